@@ -0,0 +1,92 @@
+"""
+    Resolves the geojson of a Foo with --features features through the json field resolvers, once with the
+    cached DataTuple classes and once creating a class per row as before, and reports the CPU time and the memory
+    allocated. No database is needed since the Foo isn't saved. Run from the project root:
+        DJANGO_SETTINGS_MODULE=test_settings python benchmarks/data_tuples.py [--features 10000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERY = '''
+    query {
+        foo {
+            geojson {
+                type
+                features {
+                    type
+                    geometry {
+                        type
+                        coordinates
+                    }
+                }
+            }
+        }
+    }
+'''
+
+
+def feature_collection(features):
+    return dict(
+        type='FeatureCollection',
+        features=[dict(
+            type='Feature',
+            geometry=dict(
+                type='Polygon',
+                coordinates=[[[i, 0], [i + 1, 0], [i + 1, 1], [i, 1], [i, 0]]]
+            )
+        ) for i in range(features)]
+    )
+
+
+def create_schema(foo):
+    import graphene
+    from sample_webapp.foo_schema import FooType
+
+    class Query(graphene.ObjectType):
+        foo = graphene.Field(FooType)
+
+        def resolve_foo(self, info):
+            return foo
+
+    return graphene.Schema(query=Query)
+
+
+def measure(schema):
+    tracemalloc.start()
+    start = time.process_time()
+    result = schema.execute(QUERY)
+    seconds = time.process_time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert not result.errors, result.errors
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--features', type=int, default=10000)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from sample_webapp.models import Foo
+    from rescape_graphene.graphql_helpers import json_field_helpers
+
+    schema = create_schema(Foo(key='benchmark', name='Benchmark', geojson=feature_collection(args.features)))
+    cached = measure(schema)
+    # A class per row, as before the cache
+    json_field_helpers.data_tuple_class = lambda keys: namedtuple('DataTuple', keys)
+    uncached = measure(schema)
+    for label, (seconds, peak) in [('per row', uncached), ('cached', cached)]:
+        print(f'{label:<10}{seconds:>8.3f}s cpu  {peak / 2 ** 20:>8.1f}MiB peak allocated')
+    print(f'speedup   {uncached[0] / cached[0]:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+    Reports the size, build time and memory of the sample_webapp schema with and without filter profiles.
+    Each variant is built in a fresh python process since the generated types are memoized per process.
+    Run from the project root:
+        python benchmarks/filter_profiles.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUILD_SCHEMA = '''
+import json
+import resource
+import time
+import django
+django.setup()
+start = time.perf_counter()
+from sample_webapp.sample_schema import create_default_schema
+schema = create_default_schema()
+build_seconds = time.perf_counter() - start
+from rescape_graphene.schema import schema_size
+print(json.dumps(dict(
+    schema_size(schema),
+    build_seconds=round(build_seconds, 3),
+    max_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+)))
+'''
+
+
+def build(filter_profiles):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='test_settings',
+        PYTHONPATH=BASE_DIR,
+        RESCAPE_GRAPHENE_FILTER_PROFILES='true' if filter_profiles else 'false'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', BUILD_SCHEMA], cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    # Only the last line is ours, anything before it is logging
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    before = build(False)
+    after = build(True)
+    print(f'{"":<22}{"before":>14}{"after":>14}{"change":>10}')
+    for key in before:
+        change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0
+        print(f'{key:<22}{before[key]:>14}{after[key]:>14}{change:>9.1f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+    Times parsing coordinate literals and variables of Points, LineStrings, Polygons and MultiPolygons of
+    --sizes vertices with GeometryCoordinates, and parsing the literals with the former reduce and concat walk,
+    which is quadratic, up to --legacy-max vertices. No database is needed. Run from the project root:
+        DJANGO_SETTINGS_MODULE=test_settings python benchmarks/geometry_coordinates.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def ring(vertices, offset=0):
+    return [[offset + i * 0.001, (i % 7) * 0.5] for i in range(vertices - 1)] + [[offset, 0.0]]
+
+
+def geometries(vertices):
+    # Each geometry has about the given number of vertices
+    return dict(
+        Point=[1.5, 2.5],
+        LineString=ring(vertices),
+        Polygon=[ring(vertices - vertices // 10), ring(vertices // 10, 0.1)],
+        MultiPolygon=[[ring(vertices // 4, i)] for i in range(4)]
+    )
+
+
+def literal(coordinates):
+    from graphql import parse
+
+    return parse(f'{{ geometry(coordinates: {json.dumps(coordinates)}) }}').definitions[0].selection_set \
+        .selections[0].arguments[0].value
+
+
+def legacy_parse_literal(node):
+    # GeometryCoordinates.parse_literal before CoordinateArray
+    from graphql.language.ast import ListValue
+    from rescape_python_helpers import ramda as R
+
+    def map_value(value):
+        def handle_floats(v):
+            if hasattr(v, 'values'):
+                return R.map(lambda fv: float(fv.value), v.values)
+            else:
+                return float(v.value)
+
+        return R.if_else(
+            lambda v: R.isinstance(ListValue, R.head(v.values) if hasattr(v, 'values') else v),
+            lambda v: [reduce(v.values)],
+            lambda v: [handle_floats(v)]
+        )(value)
+
+    def reduce(values):
+        return R.reduce(lambda accum, list_values: R.concat(accum, map_value(list_values)), [], values)
+
+    return R.reduce(lambda accum, list_values: reduce(node.values), [], reduce(node.values))
+
+
+def seconds(function, value):
+    start = time.perf_counter()
+    function(value)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=20000)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from rescape_graphene.schema_models.geojson.types import GeometryCoordinates
+
+    print(f'{"geometry":<14}{"vertices":>10}{"literal":>12}{"variable":>12}{"legacy":>12}')
+    for size in args.sizes:
+        for geometry_type, coordinates in geometries(size).items():
+            node = literal(coordinates)
+            legacy = f'{seconds(legacy_parse_literal, node):>11.4f}s' if size <= args.legacy_max else f'{"-":>12}'
+            print(
+                f'{geometry_type:<14}{size:>10}{seconds(GeometryCoordinates.parse_literal, node):>11.4f}s'
+                f'{seconds(GeometryCoordinates.parse_value, coordinates):>11.4f}s{legacy}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+    Compares the json size and the time to resolve and dump the coordinates of a Polygon of --vertices vertices
+    as full nested lists, rounded to --precision decimals, and encoded as polylines and as float32. No database is
+    needed. Run from the project root:
+        DJANGO_SETTINGS_MODULE=test_settings python benchmarks/geometry_encodings.py [--vertices 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def polygon(vertices):
+    return [[[-120 + i * 0.0000123456789, 38 + (i % 97) * 0.0000987654321] for i in range(vertices)]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--vertices', type=int, default=100000)
+    parser.add_argument('--precision', type=int, default=6)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from rescape_graphene.schema_models.geojson.types import GeometryCoordinates
+    from rescape_graphene.schema_models.geojson.types.geometry import resolve_coordinates, POLYLINE, FLOAT32
+
+    geometry = namedtuple('DataTuple', ['coordinates'])(polygon(args.vertices))
+    info = namedtuple('Info', ['field_name'])('coordinates')
+    results = []
+    for label, kwargs in [
+        ('full', {}),
+        (f'precision {args.precision}', dict(precision=args.precision)),
+        ('polyline', dict(precision=args.precision, encoding=POLYLINE)),
+        ('float32', dict(encoding=FLOAT32))
+    ]:
+        start = time.perf_counter()
+        dumped = json.dumps(GeometryCoordinates.serialize(resolve_coordinates(geometry, info, **kwargs)))
+        results.append((label, time.perf_counter() - start, len(dumped)))
+    for label, seconds, size in results:
+        print(f'{label:<14}{seconds:>8.3f}s  {size / 2 ** 10:>10.1f}KiB  {results[0][2] / size:>6.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
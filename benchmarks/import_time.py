@@ -0,0 +1,66 @@
+"""
+    Measures the import time of rescape_graphene with python -X importtime.
+    Each target is imported in a fresh process. The package itself should be nearly free to import, and
+    importing one helper should only pay for the modules that helper needs.
+    Run from the project root:
+        python benchmarks/import_time.py [--runs 5] [--top 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = [
+    'import rescape_graphene',
+    'from rescape_graphene import increment_prop_until_unique',
+    'from rescape_graphene import create_schema',
+]
+
+
+def import_times(statement):
+    """
+        Runs statement under -X importtime
+    :param statement: The python import statement
+    :return: A list of (cumulative microseconds, module) of every module imported, slowest first
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='test_settings', PYTHONPATH=BASE_DIR)
+    # Models can't load without an app registry, so set up Django first for targets that need it.
+    # Its cost is excluded below since it happens before the statement
+    code = f'import django; django.setup(); import sys; print("--", file=sys.stderr); {statement}'
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=BASE_DIR, env=env, check=True,
+        capture_output=True, text=True
+    ).stderr
+    # Lines look like "import time:       123 |       4567 |   package.module"
+    lines = stderr.split('--\n', 1)[-1].splitlines()
+    times = []
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # Nested imports are indented beyond the single space after the separator
+        times.append((int(cumulative), module[1:].rstrip()))
+    return sorted(times, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    for statement in TARGETS:
+        runs = [import_times(statement) for _ in range(args.runs)]
+        # Top level modules are not indented, so their cumulative times sum to the total
+        totals = [sum(cumulative for cumulative, module in times if not module.startswith(' ')) for times in runs]
+        print(f'{statement}\n  median {statistics.median(totals) / 1000:.1f}ms over {args.runs} runs')
+        for cumulative, module in runs[-1][:args.top]:
+            print(f'  {cumulative / 1000:>9.1f}ms {module.strip()}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
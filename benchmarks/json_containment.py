@@ -0,0 +1,93 @@
+"""
+    Compares filtering a large Foo table by nested data with per-key json filters and with one containment filter.
+    Creates a test database with --rows Foos and a GIN jsonb_path_ops index on Foo.data, then times and EXPLAINs
+    the same filter both ways. Needs the Postgres database of the settings. Run from the project root:
+        DJANGO_SETTINGS_MODULE=test_settings python benchmarks/json_containment.py [--rows 100000] [--iterations 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GEO_COLLECTION = 'SRID=4326;GEOMETRYCOLLECTION(POINT(0 0))'
+
+
+def create_foos(rows, batch_size=5000):
+    from django.contrib.auth import get_user_model
+    from sample_webapp.models import Foo
+
+    user, _ = get_user_model().objects.get_or_create(username='benchmark')
+    for start in range(0, rows, batch_size):
+        Foo.objects.bulk_create([
+            Foo(
+                key=f'foo{i}',
+                name=f'Foo {i}',
+                user=user,
+                data=dict(example=i % 100 * 1.1, friend=dict(id=i % 1000), tags=[f'tag{i % 10}']),
+                geojson={},
+                geo_collection=GEO_COLLECTION
+            ) for i in range(start, min(start + batch_size, rows))
+        ])
+
+
+def create_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.db import connection
+    from sample_webapp.models import Foo
+
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_index(Foo, GinIndex(fields=['data'], name='foo_data_gjp', opclasses=['jsonb_path_ops']))
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {Foo._meta.db_table}')
+
+
+def time_filter(iterations, json_containment):
+    from django.conf import settings
+    from sample_webapp.models import Foo
+    from rescape_graphene.graphql_helpers.schema_helpers import process_filter_kwargs
+
+    settings.RESCAPE_GRAPHENE_JSON_CONTAINMENT = json_containment
+    plan = Foo.objects.filter(
+        *process_filter_kwargs(Foo, data=dict(example=1.1, friend=dict(id=1)))
+    ).explain()
+    start = time.perf_counter()
+    for i in range(iterations):
+        Foo.objects.filter(
+            *process_filter_kwargs(Foo, data=dict(example=i % 100 * 1.1, friend=dict(id=i % 1000)))
+        ).count()
+    return time.perf_counter() - start, plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        create_foos(args.rows)
+        create_index()
+        results = [
+            ('per key', time_filter(args.iterations, False)),
+            ('containment', time_filter(args.iterations, True))
+        ]
+        for label, (seconds, plan) in results:
+            print(f'{label:<12}{seconds:>8.3f}s  {seconds / args.iterations * 1000:>8.2f}ms per query')
+            print(plan)
+        print(f'speedup     {results[0][1][0] / results[1][1][0]:>8.1f}x')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
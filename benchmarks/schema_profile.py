@@ -0,0 +1,39 @@
+"""
+    Profiles a cold build of the sample_webapp schema and prints the report of profile_schema_build.
+    Keep the JSON output of each release to compare against as the models grow.
+    Run from the project root:
+        DJANGO_SETTINGS_MODULE=test_settings python benchmarks/schema_profile.py [--json]
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def default_class_config():
+    # Import inside the profiler so the types built at import time are counted
+    return importlib.import_module('sample_webapp.sample_schema').default_class_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from rescape_graphene.schema import profile_schema_build, format_schema_profile
+
+    profile = profile_schema_build(default_class_config)
+    if args.json:
+        # Model labels can be None, which json writes as "null"
+        print(json.dumps(profile, indent=2))
+    else:
+        print(format_schema_profile(profile))
+
+
+if __name__ == '__main__':
+    main()
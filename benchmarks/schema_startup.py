@@ -0,0 +1,61 @@
+"""
+    Compares worker cold-start time with and without the compiled schema artifact.
+    Each sample is a fresh python process that sets up Django and builds the sample_webapp schema.
+    Run from the project root:
+        python benchmarks/schema_startup.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUILD_SCHEMA = '''
+import django
+django.setup()
+import sample_webapp.sample_schema_creator
+'''
+
+
+def time_build(compiled_schema_path=None):
+    """
+        Times one process that builds the schema
+    :param compiled_schema_path: If set, the path of the compiled schema artifact
+    :return: Seconds of wall time
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='test_settings', PYTHONPATH=BASE_DIR)
+    env.pop('RESCAPE_GRAPHENE_COMPILED_SCHEMA', None)
+    if compiled_schema_path:
+        env['RESCAPE_GRAPHENE_COMPILED_SCHEMA'] = compiled_schema_path
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', BUILD_SCHEMA], cwd=BASE_DIR, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def report(label, timings):
+    print(f'{label:<32} median {statistics.median(timings):.3f}s  min {min(timings):.3f}s  max {max(timings):.3f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'compiled_schema.json')
+        full = [time_build() for _ in range(args.runs)]
+        # The first compiled run finds no artifact, does a full build and writes it
+        writing = time_build(path)
+        compiled = [time_build(path) for _ in range(args.runs)]
+
+    report('full rebuild', full)
+    report('compiled (writing artifact)', [writing])
+    report('compiled (reading artifact)', compiled)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,91 +1,129 @@
-import django
-django.setup()
+"""
+    The public helpers of rescape_graphene. Submodules are imported on first attribute access, so importing the
+    package is cheap and does not configure Django. Call django.setup() (or run under manage.py or pytest-django)
+    before using anything that touches the models. testcases is only imported when client_for_testing is used
+"""
+import importlib
 
-from .django_helpers.pagination import (
-    get_paginator,
-    create_paginated_type_mixin
-)
-from .django_helpers.write_helpers import (
-    increment_prop_until_unique,
-    enforce_unique_props
-)
-from .graphql_helpers.json_field_helpers import (
-    resolver_for_feature_collection,
-    type_modify_fields,
-    pick_selections,
-    resolve_selections,
-    model_resolver_for_dict_field,
-    resolver_for_dict_field,
-    resolver_for_dict_list
-)
-from .graphql_helpers.schema_helpers import (
-    input_type_class,
-    related_input_field,
-    related_input_field_for_crud_type,
-    django_to_graphene_type,
-    process_field,
-    parse_django_class,
-    merge_with_django_properties,
-    allowed_read_fields,
-    allowed_filter_arguments,
-    guess_update_or_create,
-    instantiate_graphene_type,
-    input_type_fields,
-    input_type_parameters_for_update_or_create,
-    graphql_query,
-    graphql_update_or_create,
-    merge_data_fields_on_update,
-    process_filter_kwargs,
-    deep_merge_existing_json,
-    invert_q_expressions_sets,
-    process_filter_kwargs_with_to_manys,
-    query_sequentially,
-    DENY,
-    CREATE,
-    UPDATE,
-    UNIQUE,
-    ALLOW,
-    DELETE,
-    REQUIRE,
-    READ
-)
-from .graphql_helpers.views import (
-    SafeGraphQLView
+# The module of each public name, relative to this package
+_exports = dict(
+    **{name: '.django_helpers.pagination' for name in [
+        'get_paginator',
+        'create_paginated_type_mixin',
+        'get_cursor_paginator',
+        'create_cursor_paginated_type_mixin'
+    ]},
+    **{name: '.django_helpers.write_helpers' for name in [
+        'increment_prop_until_unique',
+        'enforce_unique_props'
+    ]},
+    **{name: '.graphql_helpers.json_field_helpers' for name in [
+        'resolver_for_feature_collection',
+        'feature_collection_arguments',
+        'type_modify_fields',
+        'pick_selections',
+        'resolve_selections',
+        'model_resolver_for_dict_field',
+        'resolver_for_dict_field',
+        'resolver_for_dict_list'
+    ]},
+    **{name: '.graphql_helpers.schema_helpers' for name in [
+        'input_type_class',
+        'related_input_field',
+        'related_input_field_for_crud_type',
+        'django_to_graphene_type',
+        'process_field',
+        'parse_django_class',
+        'merge_with_django_properties',
+        'allowed_read_fields',
+        'allowed_filter_arguments',
+        'guess_update_or_create',
+        'instantiate_graphene_type',
+        'input_type_fields',
+        'input_type_parameters_for_update_or_create',
+        'graphql_query',
+        'graphql_update_or_create',
+        'merge_data_fields_on_update',
+        'process_filter_kwargs',
+        'deep_merge_existing_json',
+        'invert_q_expressions_sets',
+        'process_filter_kwargs_with_to_manys',
+        'query_sequentially',
+        'to_many_exists_q_expressions',
+        'SEQUENTIAL',
+        'EXISTS',
+        'DENY',
+        'CREATE',
+        'UPDATE',
+        'UNIQUE',
+        'ALLOW',
+        'DELETE',
+        'REQUIRE',
+        'READ'
+    ]},
+    **{name: '.graphql_helpers.spatial_filters' for name in [
+        'GeoJSONGeometry',
+        'DWithinInputType'
+    ]},
+    **{name: '.graphql_helpers.query_optimizer' for name in [
+        'optimize_queryset'
+    ]},
+    **{name: '.graphql_helpers.graphene_helpers' for name in [
+        'selection_field_asts'
+    ]},
+    **{name: '.graphql_helpers.views' for name in [
+        'SafeGraphQLView'
+    ]},
+    **{name: '.schema_models.geojson' for name in [
+        'GrapheneFeatureCollection',
+        'FeatureCollectionDataType',
+        'FeatureDataType',
+        'FeatureGeometryDataType',
+        'feature_data_type_fields',
+        'feature_geometry_data_type_fields'
+    ]},
+    **{name: '.schema_models.group_schema' for name in [
+        'GroupType',
+        'UpsertGroup',
+        'CreateGroup',
+        'UpdateGroup',
+        'graphql_update_or_create_group',
+        'graphql_query_groups',
+        'group_fields',
+        'group_mutation_config'
+    ]},
+    **{name: '.schema_models.user_schema' for name in [
+        'UserType',
+        'UpsertUser',
+        'CreateUser',
+        'UpdateUser',
+        'graphql_update_or_create_user',
+        'graphql_query_users',
+        'user_fields',
+        'user_mutation_config'
+    ]},
+    # Test only. This imports django.test and graphene.test
+    **{name: '.testcases' for name in [
+        'client_for_testing'
+    ]},
+    **{name: '.schema' for name in [
+        'create_query_mutation_schema',
+        'create_schema',
+        'create_query_and_mutation_classes'
+    ]}
 )
 
-from .schema_models.geojson import (
-    GrapheneFeatureCollection,
-    FeatureCollectionDataType, FeatureDataType, FeatureGeometryDataType, feature_data_type_fields,
-    feature_geometry_data_type_fields
-)
+__all__ = list(_exports.keys())
 
-from .schema_models.group_schema import (
-    GroupType,
-    UpsertGroup,
-    CreateGroup,
-    UpdateGroup,
-    graphql_update_or_create_group,
-    graphql_query_groups,
-    group_fields,
-    group_mutation_config,
-    graphql_update_or_create,
-)
-from .schema_models.user_schema import (
-    UserType,
-    UpsertUser,
-    CreateUser,
-    UpdateUser,
-    graphql_update_or_create_user,
-    graphql_query_users,
-    user_fields,
-    user_mutation_config,
-)
-from .testcases import (
-    client_for_testing
-)
-from .schema import (
-    create_query_mutation_schema,
-    create_schema,
-    create_query_and_mutation_classes
 
-)
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    # Cache it so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
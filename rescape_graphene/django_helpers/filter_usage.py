@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Q
+from rescape_python_helpers import ramda as R
+
+from rescape_graphene.django_helpers.model_metadata import model_metadata, JSON
+
+logger = logging.getLogger('rescape_graphene')
+
+###
+# Records which filters clients actually use. process_filter_kwargs reports the Django lookups of the Q expressions
+# it builds, e.g. user__username__icontains, to the recording of the current request, if any. When the recording
+# ends, each distinct (model, field path, lookup) of the request is counted and charged the database time of the
+# request. The totals accumulate in a Django cache so that the suggest_filter_indexes management command can
+# propose indexes for the filters that are used most and cost most. The totals are merged with a read and write
+# of the cache, so concurrent requests can lose a few counts, which doesn't matter for advice.
+# Configure with settings.RESCAPE_GRAPHENE_FILTER_USAGE, a dict overriding FILTER_USAGE_DEFAULTS
+###
+
+FILTER_USAGE_DEFAULTS = dict(
+    # Record the filters of every GraphQL request
+    enabled=False,
+    # The Django cache alias that stores the totals. Use a shared cache to combine the processes of a deployment
+    cache='default',
+    # The cache key of the totals
+    key='rescape_graphene_filter_usage'
+)
+
+# The recording of the current thread's request
+_recording = threading.local()
+
+
+def filter_usage_settings():
+    return R.merge(FILTER_USAGE_DEFAULTS, getattr(settings, 'RESCAPE_GRAPHENE_FILTER_USAGE', {}))
+
+
+class FilterUsage(object):
+    """
+        A Django lookup such as user__username__icontains of a model, resolved to the field it filters
+    """
+
+    def __init__(self, model, field, keys, lookup):
+        """
+        :param model: The model that owns the filtered field, e.g. User for user__username__icontains of Foo
+        :param field: The Django field, e.g. User.username
+        :param keys: Json key transforms following the field, e.g. ['friend', 'name'] for data__friend__name
+        :param lookup: The lookup name, e.g. 'icontains'
+        """
+        self.model = model
+        self.field = field
+        self.keys = keys
+        self.lookup = lookup
+
+    @property
+    def key(self):
+        # Models aren't stored in the cache, just their labels
+        return (self.model._meta.label, '__'.join([self.field.name] + self.keys), self.lookup)
+
+
+def parse_lookup(model, lookup):
+    """
+        Resolves a Django lookup string of a model to the field it filters
+    :param model: The Django model
+    :param lookup: The lookup, e.g. 'user__username__icontains', 'data__name' or 'id__in'
+    :return: A FilterUsage or None if lookup doesn't resolve to a field
+    """
+    parts = lookup.split('__')
+    current_model = model
+    # The last relation followed and the model that owns it
+    relation = None
+    for index, part in enumerate(parts):
+        metadata = model_metadata(current_model)
+        field_metadata = R.prop_or(None, part, metadata.fields) or R.prop_or(None, part, metadata.forward_fields)
+        if not field_metadata:
+            # A lookup of the relation itself, such as user__in, filters the foreign key column
+            return FilterUsage(relation[0], relation[1].field, [], part) if relation else None
+        if field_metadata.is_relation:
+            relation = (current_model, field_metadata)
+            current_model = field_metadata.related_model
+            continue
+        rest = parts[index + 1:]
+        field = field_metadata.field
+        if field_metadata.kind == JSON:
+            # Everything but a final lookup is a key transform
+            if rest and field.get_lookup(rest[-1]):
+                return FilterUsage(current_model, field, rest[:-1], rest[-1])
+            return FilterUsage(current_model, field, rest, 'exact')
+        # Transforms like date__year end with the lookup
+        return FilterUsage(current_model, field, [], rest[-1] if rest else 'exact')
+    # A relation compared by itself, e.g. user=1
+    return FilterUsage(relation[0], relation[1].field, [], 'exact') if relation else None
+
+
+def _lookups(node):
+    # The lookup strings of a list of Q expressions, a list of lists of them, or a single Q expression
+    if isinstance(node, Q):
+        return R.chain(_lookups, node.children)
+    if isinstance(node, tuple):
+        return [node[0]]
+    if isinstance(node, list):
+        return R.chain(_lookups, node)
+    return []
+
+
+def record_filter_kwargs(model, q_expressions):
+    """
+        Called by process_filter_kwargs with the Q expressions it built. Does nothing unless a recording is active
+    :param model: The filtered Django model
+    :param q_expressions: A list of Q expressions or a list of lists of them
+    :return: None
+    """
+    recording = getattr(_recording, 'usages', None)
+    if recording is None:
+        return
+    for lookup in _lookups(q_expressions):
+        usage = parse_lookup(model, lookup)
+        if usage:
+            recording[usage.key] = R.prop_or(0, usage.key, recording) + 1
+
+
+@contextmanager
+def record_filter_usage(cache=None, key=None):
+    """
+        Records the filters processed within the block and the database time they cost, then adds them to the
+        totals in the cache. SafeGraphQLView wraps each request in this when recording is enabled
+    :param cache: The cache alias. Defaults to the setting
+    :param key: The cache key. Defaults to the setting
+    :return: None
+    """
+    options = filter_usage_settings()
+    usages = {}
+    timing = dict(seconds=0)
+
+    def time_execute(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timing['seconds'] += time.perf_counter() - start
+
+    _recording.usages = usages
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_execute))
+            yield
+    finally:
+        _recording.usages = None
+        if usages:
+            try:
+                _merge_usages(
+                    caches[cache or options['cache']],
+                    key or options['key'],
+                    usages,
+                    timing['seconds']
+                )
+            except Exception as e:
+                # Advice is never worth failing a request
+                logger.warning(f'Failed to record filter usage: {e}')
+
+
+def _merge_usages(cache, key, usages, seconds):
+    totals = cache.get(key) or {}
+    for usage_key, count in usages.items():
+        total = R.prop_or(dict(count=0, requests=0, seconds=0), usage_key, totals)
+        totals[usage_key] = dict(
+            count=total['count'] + count,
+            requests=total['requests'] + 1,
+            seconds=total['seconds'] + seconds
+        )
+    cache.set(key, totals, None)
+
+
+def filter_usage(cache=None, key=None):
+    """
+        The recorded totals
+    :param cache: The cache alias. Defaults to the setting
+    :param key: The cache key. Defaults to the setting
+    :return: A dict keyed by (model label, field path, lookup) of dicts with the count of the filter, the number
+    of requests that used it and the database seconds of those requests
+    """
+    options = filter_usage_settings()
+    return caches[cache or options['cache']].get(key or options['key']) or {}
+
+
+def reset_filter_usage(cache=None, key=None):
+    options = filter_usage_settings()
+    caches[cache or options['cache']].delete(key or options['key'])
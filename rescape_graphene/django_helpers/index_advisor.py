@@ -0,0 +1,196 @@
+from django.apps import apps
+from django.contrib.gis.db.models import GeometryField
+from django.core.exceptions import FieldDoesNotExist
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db.models import Index, CharField, TextField, JSONField
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from rescape_python_helpers import ramda as R
+
+###
+# Proposes indexes from the filter usage that filter_usage records. Each (model, field path, lookup) maps to the
+# kind of index that serves it: btree for equality and ranges, GIN with jsonb_path_ops for json containment,
+# GIN with jsonb_ops for json key tests, GIN with gin_trgm_ops for pattern matching on text and GiST for geometry.
+# Fields that are already indexed are skipped, as are lookups that only an expression index could serve, like
+# json key transforms compared by value. The suggestions are written as migrations by suggest_filter_indexes
+###
+
+BTREE = 'btree'
+JSONB_PATH_OPS = 'jsonb_path_ops'
+JSONB_OPS = 'jsonb_ops'
+TRIGRAM = 'trigram'
+GIST = 'gist'
+
+BTREE_LOOKUPS = ['exact', 'in', 'gt', 'gte', 'lt', 'lte', 'range', 'isnull', 'year']
+TRIGRAM_LOOKUPS = [
+    'contains', 'icontains', 'startswith', 'istartswith', 'endswith', 'iendswith', 'regex', 'iregex',
+    'trigram_similar'
+]
+JSONB_PATH_OPS_LOOKUPS = ['contains']
+JSONB_OPS_LOOKUPS = ['contained_by', 'has_key', 'has_keys', 'has_any_keys']
+
+# Index name suffixes, which set_name_with_model limits to 3 characters
+_suffixes = {BTREE: 'idx', JSONB_PATH_OPS: 'gjp', JSONB_OPS: 'gin', TRIGRAM: 'trg', GIST: 'gis'}
+
+
+def index_kind(field, keys, lookup):
+    """
+        The kind of index that serves a lookup
+    :param field: The Django field
+    :param keys: Json key transforms following the field
+    :param lookup: The lookup name
+    :return: A tuple of the kind or None and the reason
+    """
+    if not getattr(field, 'concrete', False):
+        return None, 'filters a reverse relation, whose foreign key is on the related model'
+    if isinstance(field, GeometryField):
+        return GIST, 'spatial lookup'
+    if isinstance(field, JSONField):
+        if keys:
+            # E.g. data -> 'friend' -> 'name' @> '"Bo"', which a GIN index on the column doesn't serve
+            return None, 'json key transforms need an expression index'
+        if lookup in JSONB_PATH_OPS_LOOKUPS:
+            return JSONB_PATH_OPS, 'json containment'
+        if lookup in JSONB_OPS_LOOKUPS:
+            return JSONB_OPS, 'json key test'
+        return None, f'no index kind for json lookup {lookup}'
+    if lookup in BTREE_LOOKUPS:
+        return BTREE, 'equality or range'
+    if lookup in TRIGRAM_LOOKUPS and isinstance(field, (CharField, TextField)):
+        return TRIGRAM, 'pattern match'
+    return None, f'no index kind for lookup {lookup}'
+
+
+def _is_indexed(model, field, kind):
+    if kind == BTREE and (field.primary_key or field.unique or field.db_index):
+        return True
+    if kind == GIST and getattr(field, 'spatial_index', False):
+        return True
+    index_class, opclasses = _index_class_and_opclasses(kind)
+    return R.any_satisfy(
+        lambda index: index.__class__ == index_class and list(index.fields) == [field.name] and
+                      list(index.opclasses) == opclasses,
+        model._meta.indexes
+    )
+
+
+def _index_class_and_opclasses(kind):
+    return {
+        BTREE: (Index, []),
+        JSONB_PATH_OPS: (GinIndex, ['jsonb_path_ops']),
+        JSONB_OPS: (GinIndex, []),
+        TRIGRAM: (GinIndex, ['gin_trgm_ops']),
+        GIST: (GistIndex, [])
+    }[kind]
+
+
+def create_index(model, field, kind):
+    """
+        Creates an index of the given kind on the field, named the way Django names indexes
+    :param model: The Django model
+    :param field: The Django field
+    :param kind: One of BTREE, JSONB_PATH_OPS, JSONB_OPS, TRIGRAM or GIST
+    :return: The Index
+    """
+    index_class, opclasses = _index_class_and_opclasses(kind)
+    # Indexes with opclasses must be named up front, so name a plain index and swap the suffix
+    named = Index(fields=[field.name])
+    named.set_name_with_model(model)
+    name = f'{named.name[:-3]}{_suffixes[kind]}'
+    return index_class(fields=[field.name], name=name, **(dict(opclasses=opclasses) if opclasses else {}))
+
+
+class IndexSuggestion(object):
+    """
+        A proposed index and the usage that motivates it
+    """
+
+    def __init__(self, model, field, kind, reason):
+        self.model = model
+        self.field = field
+        self.kind = kind
+        self.reason = reason
+        self.index = create_index(model, field, kind)
+        # The (field path, lookup) usages served by the index
+        self.lookups = []
+        self.count = 0
+        self.requests = 0
+        self.seconds = 0
+
+    def add_usage(self, path, lookup, total):
+        self.lookups.append(f'{path}__{lookup}')
+        self.count += total['count']
+        self.requests += total['requests']
+        self.seconds += total['seconds']
+
+
+def suggest_indexes(usage, min_count=1, min_seconds=0):
+    """
+        Proposes indexes for the recorded filter usage
+    :param usage: The result of filter_usage
+    :param min_count: Skip usages filtered fewer times
+    :param min_seconds: Skip usages whose requests took less database time
+    :return: A tuple of the IndexSuggestions, most costly first, and the skipped usages, a list of dicts with
+    the usage key and the reason
+    """
+    suggestions = {}
+    skipped = []
+    for (label, path, lookup), total in usage.items():
+        if total['count'] < min_count or total['seconds'] < min_seconds:
+            continue
+        try:
+            model = apps.get_model(label)
+            parts = path.split('__')
+            field = model._meta.get_field(parts[0])
+        except (LookupError, FieldDoesNotExist):
+            skipped.append(dict(usage=(label, path, lookup), reason='the model or field no longer exists'))
+            continue
+        kind, reason = index_kind(field, parts[1:], lookup)
+        if not kind:
+            skipped.append(dict(usage=(label, path, lookup), reason=reason))
+            continue
+        if _is_indexed(model, field, kind):
+            continue
+        suggestion_key = (label, field.name, kind)
+        if suggestion_key not in suggestions:
+            suggestions[suggestion_key] = IndexSuggestion(model, field, kind, reason)
+        suggestions[suggestion_key].add_usage(path, lookup, total)
+    return sorted(suggestions.values(), key=lambda suggestion: suggestion.seconds, reverse=True), skipped
+
+
+def index_migrations(suggestions, name='suggested_filter_indexes'):
+    """
+        Builds a migration per app that adds the suggested indexes after the app's latest migration
+    :param suggestions: IndexSuggestions
+    :param name: The name of the migrations, following the number
+    :return: A list of MigrationWriters, whose path and as_string() give the file
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    writers = []
+    suggestions_by_app = {}
+    for suggestion in suggestions:
+        suggestions_by_app.setdefault(suggestion.model._meta.app_label, []).append(suggestion)
+    for app_label, app_suggestions in suggestions_by_app.items():
+        leaves = loader.graph.leaf_nodes(app_label)
+        number = (MigrationAutodetector.parse_number(leaves[0][1]) or 0) + 1 if leaves else 1
+        operations = R.concat(
+            # pg_trgm must exist before gin_trgm_ops indexes
+            [TrigramExtension()] if R.any_satisfy(lambda suggestion: suggestion.kind == TRIGRAM,
+                                                  app_suggestions) else [],
+            R.map(
+                lambda suggestion: migrations.AddIndex(
+                    model_name=suggestion.model._meta.model_name,
+                    index=suggestion.index
+                ),
+                app_suggestions
+            )
+        )
+        migration = type('Migration', (migrations.Migration,), dict(
+            dependencies=leaves,
+            operations=operations
+        ))('%04i_%s' % (number, name), app_label)
+        writers.append(MigrationWriter(migration))
+    return writers
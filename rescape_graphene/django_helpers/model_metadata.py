@@ -0,0 +1,195 @@
+from functools import cached_property
+
+import graphene
+from django.contrib.gis.db.models import GeometryCollectionField
+from django.db.models import JSONField, AutoField, CharField, BooleanField, BigAutoField, DecimalField, \
+    DateTimeField, DateField, BinaryField, TimeField, FloatField, EmailField, UUIDField, TextField, IntegerField, \
+    BigIntegerField, NullBooleanField, ForeignKey, ManyToManyField, ForeignObjectRel
+from rescape_python_helpers import ramda as R
+
+###
+# A per-model index of the Django field metadata that schema building and filter translation need.
+# Model metadata doesn't change once the app registry is ready, so each model is indexed once per process and
+# lookups are then plain dict reads instead of scans of model._meta
+###
+
+# Field kinds
+SCALAR = 'scalar'
+JSON = 'json'
+# ForeignKey and OneToOneField
+FORWARD = 'forward'
+MANY_TO_MANY = 'many_to_many'
+# The reverse side of a ForeignKey, OneToOneField or ManyToManyField, i.e. model._meta.related_objects
+REVERSE = 'reverse'
+
+_model_metadata = {}
+_graphene_types_by_django_field_class = {}
+
+
+def _django_field_graphene_types():
+    # Imported here to avoid circular imports with the geojson types and schema_helpers
+    from rescape_graphene.schema_models.geojson.types import GrapheneFeatureCollection
+    from rescape_graphene.graphql_helpers.schema_helpers import Decimal
+    return {
+        AutoField: graphene.Int,
+        IntegerField: graphene.Int,
+        BigAutoField: graphene.Int,
+        CharField: graphene.String,
+        BigIntegerField: graphene.Int,
+        BinaryField: graphene.Int,
+        BooleanField: graphene.Boolean,
+        NullBooleanField: graphene.Boolean,
+        DateField: graphene.Date,
+        DateTimeField: graphene.DateTime,
+        TimeField: graphene.Time,
+        DecimalField: Decimal,
+        FloatField: graphene.Float,
+        EmailField: graphene.String,
+        UUIDField: graphene.UUID,
+        TextField: graphene.String,
+        JSONField: graphene.JSONString,
+        # I'm not sure if this is works still. We are storing geojson as a json blob, not a GeosGeometryCollection.
+        # If we do use a GeosGeometryCollection I'm not sure if this mapping works
+        GeometryCollectionField: GrapheneFeatureCollection
+    }
+
+
+def graphene_type_of_django_field_class(field_class):
+    """
+        The graphene scalar of a Django field class, resolved once per class
+    :param field_class: The Django Field subclass
+    :return: The graphene type
+    """
+    if field_class not in _graphene_types_by_django_field_class:
+        types = _django_field_graphene_types()
+        cls = field_class
+        match = R.prop_or(None, cls, types)
+        # Find the type that matches. If not match we assume that the class only has one base class,
+        # such as GeometryField subclasses
+        while not match:
+            cls = cls.__bases__[0]
+            match = R.prop_or(None, cls, types)
+        _graphene_types_by_django_field_class[field_class] = match
+    return _graphene_types_by_django_field_class[field_class]
+
+
+def _field_kind(field):
+    if isinstance(field, ForeignObjectRel):
+        return REVERSE
+    if isinstance(field, ManyToManyField):
+        return MANY_TO_MANY
+    if isinstance(field, ForeignKey):
+        return FORWARD
+    if isinstance(field, JSONField):
+        return JSON
+    return SCALAR
+
+
+class FieldMetadata(object):
+    """
+        The metadata of one model field
+    """
+
+    def __init__(self, field, field_to_unique_field_groups):
+        self.field = field
+        self.name = field.name
+        self.attname = getattr(field, 'attname', None)
+        self.kind = _field_kind(field)
+        self.related_model = field.related_model
+        # The unique_together groups that the field is in, each as a comma separated string of field names
+        self.unique_groups = R.prop_or([], field.name, field_to_unique_field_groups)
+
+    @property
+    def is_relation(self):
+        return self.kind in (FORWARD, MANY_TO_MANY, REVERSE)
+
+    @property
+    def is_to_many(self):
+        # Reverse one-to-one relations are single valued
+        return self.field.many_to_many or self.field.one_to_many
+
+    @cached_property
+    def remote_query_name(self):
+        """
+            The name that filters the related model by this model, e.g. foo for the bars field of Foo
+        :return: The name or None if the relation has no reverse query name, as with related_name='+'
+        """
+        if self.kind == REVERSE:
+            return self.field.field.name
+        if not self.is_relation or self.field.remote_field.is_hidden():
+            return None
+        return self.field.related_query_name()
+
+    @cached_property
+    def graphene_type(self):
+        """
+            The graphene scalar of the field. Resolved on first use since related fields have no scalar
+        :return: The graphene type
+        """
+        if self.is_relation:
+            return None
+        return graphene_type_of_django_field_class(self.field.__class__)
+
+
+class ModelMetadata(object):
+    """
+        The field metadata of one model
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # Maps each field name to all "unique together" groups it's in
+        self.field_to_unique_field_groups = R.from_pairs_to_array_values(
+            R.flatten(
+                R.map(
+                    lambda uniq_field_group:
+                    R.map(
+                        lambda attrname: [attrname, R.join(',', uniq_field_group)],
+                        uniq_field_group
+                    ),
+                    model._meta.unique_together
+                )
+            )
+        )
+        # Keyed by field name in the order of fields, many_to_many, then related_objects
+        self.fields = R.from_pairs(R.map(
+            lambda field: [field.name, FieldMetadata(field, self.field_to_unique_field_groups)],
+            R.concat(model._meta.fields, R.concat(model._meta.many_to_many, model._meta.related_objects))
+        ))
+        # Keyed by both name and attname like model._meta._forward_fields_map, e.g. user and user_id
+        self.forward_fields = R.from_pairs(R.map(
+            lambda key_field: [
+                key_field[0],
+                R.prop_or(None, key_field[1].name, self.fields) or
+                FieldMetadata(key_field[1], self.field_to_unique_field_groups)
+            ],
+            list(model._meta._forward_fields_map.items())
+        ))
+        # Reverse relations keyed by name. These are the related_objects
+        self.reverse_fields = R.filter_dict(
+            lambda name_field: name_field[1].kind == REVERSE,
+            self.fields
+        )
+        # Keyed by the attribute names of instances, which graphene-django uses for field names and
+        # prefetch_related uses for lookups. Reverse relations use their accessor name, e.g. foo_set
+        self.accessors = R.from_pairs(R.map(
+            lambda field_metadata: [
+                field_metadata.field.get_accessor_name() if field_metadata.kind == REVERSE else field_metadata.name,
+                field_metadata
+            ],
+            R.filter(
+                lambda field_metadata: field_metadata.kind != REVERSE or field_metadata.field.get_accessor_name(),
+                list(self.fields.values())
+            )
+        ))
+
+
+def model_metadata(model):
+    """
+        Returns the ModelMetadata of the model, building it on first use
+    :param model: The Django model
+    :return: The ModelMetadata
+    """
+    if model not in _model_metadata:
+        _model_metadata[model] = ModelMetadata(model)
+    return _model_metadata[model]
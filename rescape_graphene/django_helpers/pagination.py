@@ -1,39 +1,160 @@
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+import base64
+import json
+import math
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
 from rescape_python_helpers import ramda as R
-from graphene import Int, Boolean, ObjectType, List
+from graphene import Int, Boolean, ObjectType, List, String
 
+from rescape_graphene.graphql_helpers.query_optimizer import optimize_queryset
 from rescape_graphene.graphql_helpers.schema_helpers import DENY
 
 
-def get_paginator(qs, page_size, page, paginated_type, **kwargs):
+# Count strategies of get_paginator
+# COUNT(*) the filtered rows
+EXACT_COUNT = 'exact'
+# Estimate from pg_class.reltuples for unfiltered querysets or the row estimate of EXPLAIN otherwise
+APPROXIMATE_COUNT = 'approximate'
+# COUNT(*) at most cap + 1 rows, so pages is "at least" when there are more
+CAPPED_COUNT = 'capped'
+
+PAGINATION_COUNT_DEFAULTS = dict(strategy=EXACT_COUNT, cap=10000)
+
+
+# The page size of get_cursor_paginator when first isn't given, and the largest allowed
+CURSOR_PAGINATION_DEFAULTS = dict(first=20, max_first=1000)
+
+
+def pagination_count_settings():
+    return R.merge(PAGINATION_COUNT_DEFAULTS, getattr(settings, 'RESCAPE_GRAPHENE_PAGINATION_COUNT', {}))
+
+
+def cursor_pagination_settings():
+    return R.merge(CURSOR_PAGINATION_DEFAULTS, getattr(settings, 'RESCAPE_GRAPHENE_CURSOR_PAGINATION', {}))
+
+
+def _approximate_count(qs):
+    if connections[qs.db].vendor != 'postgresql':
+        return qs.count()
+    with connections[qs.db].cursor() as cursor:
+        if not qs.query.where:
+            # The planner's estimate of the table's rows, as of the last ANALYZE
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [qs.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1 or 0 if the table was never analyzed
+            if row and row[0] > 0:
+                return int(row[0])
+            return qs.count()
+        sql, params = qs.values('pk').query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        explanation = cursor.fetchone()[0]
+        # psycopg2 parses the json
+        plan = json.loads(explanation) if isinstance(explanation, str) else explanation
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def paginator_count(qs, strategy=EXACT_COUNT, cap=10000):
+    """
+        Counts the rows of qs for pagination
+    :param qs: The queryset
+    :param strategy: EXACT_COUNT, APPROXIMATE_COUNT or CAPPED_COUNT
+    :param cap: The most rows that CAPPED_COUNT counts
+    :return: A tuple of the count and whether it's exact
+    """
+    if strategy == APPROXIMATE_COUNT:
+        return _approximate_count(qs), False
+    if strategy == CAPPED_COUNT:
+        # Counting a limited sub query stops scanning after cap + 1 rows
+        count = qs.order_by()[:cap + 1].count()
+        return min(count, cap), count <= cap
+    return qs.count(), True
+
+
+def get_paginator(qs, page_size, page, paginated_type, count_strategy=None, count_cap=None, **kwargs):
     """
     Adapted from https://gist.github.com/mbrochh/f92594ab8188393bd83c892ef2af25e6
-    Creates a pagination_type based on the paginated_type function
+    Creates a pagination_type based on the paginated_type function.
+    The page is read with one extra row to know if there is a next page, so rows are only counted if pages
+    is read or selected, or if the page is past the end and must be clamped to the last page
     :param qs:
     :param page_size:
     :param page:
     :param paginated_type:
+    :param count_strategy: How to count for pages, EXACT_COUNT, APPROXIMATE_COUNT or CAPPED_COUNT.
+    Defaults to settings.RESCAPE_GRAPHENE_PAGINATION_COUNT['strategy']
+    :param count_cap: The cap of CAPPED_COUNT. Defaults to settings.RESCAPE_GRAPHENE_PAGINATION_COUNT['cap']
     :param kwargs: Additional kwargs to pass paginated_type function, usually unneeded
     :return:
     """
-    p = Paginator(qs.order_by('id'), page_size)
-    try:
-        page_obj = p.page(page)
-    except PageNotAnInteger:
-        page_obj = p.page(1)
-    except EmptyPage:
-        page_obj = p.page(p.num_pages)
+    options = pagination_count_settings()
+    qs = qs.order_by('id')
+    counted = {}
+
+    def count():
+        # Counts once, when first needed
+        if not counted:
+            counted['count'], counted['exact'] = paginator_count(
+                qs,
+                count_strategy or options['strategy'],
+                count_cap or options['cap']
+            )
+        return counted['count']
+
+    def pages():
+        return max(1, math.ceil(count() / page_size))
+
+    def pages_exact():
+        count()
+        return counted['exact']
+
+    page = page if isinstance(page, int) and page >= 1 else 1
+    rows = list(qs[(page - 1) * page_size:page * page_size + 1])
+    if not rows and page > 1:
+        # Past the end. Clamp to the last page like Paginator. An approximate or capped count could point at an
+        # empty page or one before the last, so this counts exactly and keeps the count for pages
+        counted['count'], counted['exact'] = qs.count(), True
+        page = pages()
+        rows = list(qs[(page - 1) * page_size:page * page_size + 1])
     return paginated_type(
-        page=page_obj.number,
-        pages=p.num_pages,
+        page=page,
+        # Computed when first read, see _lazy_property
+        pages=pages,
+        pages_exact=pages_exact,
         page_size=page_size,
-        has_next=page_obj.has_next(),
-        has_prev=page_obj.has_previous(),
-        objects=page_obj.object_list,
+        has_next=len(rows) > page_size,
+        has_prev=page > 1,
+        objects=rows[:page_size],
         **kwargs
     )
 
 
+def _lazy_property(name):
+    # A value that get_paginator gives as a function, so it's only computed if it's read or selected
+    attribute = f'_{name}'
+
+    def get(self):
+        value = getattr(self, attribute, None)
+        if callable(value):
+            value = value()
+            setattr(self, attribute, value)
+        return value
+
+    def set(self, value):
+        setattr(self, attribute, value)
+
+    return property(get, set)
+
+
+def _lazy_pages_fields():
+    return type('LazyPagesFields', (object,), dict(
+        pages=Int(),
+        # False if pages is approximate or capped, see get_paginator
+        pages_exact=Boolean(),
+    ))
+
+
 def create_paginated_type_mixin(model_object_type, model_object_type_fields):
     """
         Constructs a PaginatedTypeMixin class and the fields object (for use in allowed filtering).
@@ -48,14 +169,17 @@ def create_paginated_type_mixin(model_object_type, model_object_type_fields):
     """
     paginated_type_mixin = type(
         f'PaginatedTypeMixinFor{model_object_type.__name__}',
-        (ObjectType,),
+        # graphene collects the fields of every base, so pages and pages_exact remain fields of the mixin and
+        # its subclasses while the mixin's own attributes are the properties that compute them when read
+        (ObjectType, _lazy_pages_fields()),
         dict(
             page_size=Int(),
             page=Int(),
-            pages=Int(),
             has_next=Boolean(),
             has_prev=Boolean(),
             objects=List(model_object_type),
+            pages=_lazy_property('pages'),
+            pages_exact=_lazy_property('pages_exact'),
         )
     )
 
@@ -63,6 +187,7 @@ def create_paginated_type_mixin(model_object_type, model_object_type_fields):
         page_size=dict(type=Int, graphene_type=Int, create=DENY, update=DENY),
         page=dict(type=Int, graphene_type=Int, create=DENY, update=DENY),
         pages=dict(type=Int, graphene_type=Int, create=DENY, update=DENY),
+        pages_exact=dict(type=Boolean, graphene_type=Boolean, create=DENY, update=DENY),
         has_next=dict(type=Boolean, graphene_type=Boolean, create=DENY, update=DENY),
         has_prev=dict(type=Boolean, graphene_type=Boolean, create=DENY, update=DENY),
         objects=dict(
@@ -76,17 +201,36 @@ def create_paginated_type_mixin(model_object_type, model_object_type_fields):
     return dict(type=paginated_type_mixin, fields=paginated_fields)
 
 
-def resolve_paginated_for_type(paginated_type, type_resolver, **kwargs):
+def resolve_paginated_for_type(paginated_type, type_resolver, info=None, field_configs=None, **kwargs):
     """
         Resolver for paginated types
     :param paginated_type: The paginated Type, e.g. LocationPaginationType
     :param type_resolver: The resolver for the non-paginated type, e.g. location_resolver
+    :param info: Optional graphene resolution info. If given the queryset is optimized for the selections of
+    objects, see optimize_queryset
+    :param field_configs: Optional field configs of the non-paginated type, e.g. location_fields
     :param kwargs: The kwargs Array of prop sets for the non-paginated objects in 'objects'.
     Normally it's just a 1-item array.
     Other required kwargs are for pagination are page_size and page
     :return: The paginated query
     """
 
+    instances = _objects_queryset(type_resolver, kwargs)
+
+    if info and instances is not None:
+        instances = optimize_queryset(instances, info, field_configs, path=['objects'])
+
+    return get_paginator(
+        instances,
+        R.prop('page_size', kwargs),
+        R.prop('page', kwargs),
+        paginated_type
+    )
+
+
+def _objects_queryset(type_resolver, kwargs):
+    # ORs the querysets of each prop set of objects
+
     def reduce_or(q_expressions):
         return R.reduce(
             lambda qs, q: qs | q if qs else q,
@@ -96,14 +240,224 @@ def resolve_paginated_for_type(paginated_type, type_resolver, **kwargs):
 
     objects = R.prop_or({}, 'objects', kwargs)
 
-    instances = reduce_or(R.map(
+    return reduce_or(R.map(
         lambda obj: type_resolver('filter', **obj),
         objects
     ))
 
-    return get_paginator(
+
+def encode_cursor(values):
+    """
+        Encodes the ordering values of a row as an opaque cursor
+    :param values: The values of the ordering fields
+    :return: A url safe string
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    """
+        Decodes a cursor of encode_cursor
+    :param cursor: The cursor string
+    :param ordering: The ordering the cursor must match
+    :return: The values of the ordering fields
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f'Invalid cursor {cursor}')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError(f'Invalid cursor {cursor}')
+    return values
+
+
+def _cursor_ordering(model, order_by):
+    # The ordering with the primary key as the final tie breaker so every row has a distinct cursor
+    ordering = list(order_by or [])
+    pk_name = model._meta.pk.name
+    if not R.any_satisfy(lambda name: name.lstrip('-') in [pk_name, 'pk'], ordering):
+        ordering.append(pk_name)
+    return ordering
+
+
+def _reverse_ordering(ordering):
+    return R.map(lambda name: name[1:] if name.startswith('-') else f'-{name}', ordering)
+
+
+def _nullable(model, field_name):
+    return field_name != 'pk' and model._meta.get_field(field_name).null
+
+
+def _beyond_q(model, field_name, comparison, value):
+    """
+        Filters the rows beyond value in the direction of comparison. NULL sorts after every value, like
+        PostgreSQL's default NULLS LAST ascending and NULLS FIRST descending, which reversing the ordering keeps
+    :return: The Q expression or None if no row is beyond
+    """
+    if value is None:
+        return Q(**{f'{field_name}__isnull': False}) if comparison == 'lt' else None
+    q_expression = Q(**{f'{field_name}__{comparison}': value})
+    if comparison == 'gt' and _nullable(model, field_name):
+        return q_expression | Q(**{f'{field_name}__isnull': True})
+    return q_expression
+
+
+def _equal_q(field_name, value):
+    return Q(**{f'{field_name}__isnull': True}) if value is None else Q(**{field_name: value})
+
+
+def _keyset_q(model, ordering, values):
+    """
+        Filters the rows after the row with the given values in the given ordering, e.g. for ['name', 'id']:
+        name > value0 OR (name = value0 AND id > value1). Nullable fields compare with isnull branches, since
+        comparing to NULL matches nothing
+    """
+    q = None
+    for index, name in enumerate(ordering):
+        beyond = _beyond_q(model, name.lstrip('-'), 'lt' if name.startswith('-') else 'gt', values[index])
+        if beyond is None:
+            continue
+        # Equal on the preceding fields and beyond on this one
+        q_expression = beyond
+        for previous_index, previous in enumerate(ordering[:index]):
+            q_expression &= _equal_q(previous.lstrip('-'), values[previous_index])
+        q = q | q_expression if q else q_expression
+    # Never None, since the primary key is last and never NULL
+    return q
+
+
+def _attname(model, name):
+    # The instance attribute of an ordering field, e.g. user_id for user
+    field_name = name.lstrip('-')
+    return model._meta.pk.attname if field_name == 'pk' else model._meta.get_field(field_name).attname
+
+
+def _with_columns(qs, names):
+    # If qs loads only some columns, as optimize_queryset makes it, add the ordering columns so that reading the
+    # cursors doesn't load each row's deferred columns
+    field_names, defer = qs.query.deferred_loading
+    if defer or not field_names:
+        return qs
+    return qs.only(*field_names, *names)
+
+
+def get_cursor_paginator(qs, first, paginated_type, after=None, before=None, order_by=None, **kwargs):
+    """
+        Keyset pagination. Unlike get_paginator there is no COUNT and no OFFSET scan. The rows after (or before)
+        the cursor are found by comparing the ordering fields, which an index on them serves at any depth.
+        One extra row is fetched to know if there are more
+    :param qs: The queryset
+    :param first: The number of rows per page. Defaults to settings.RESCAPE_GRAPHENE_CURSOR_PAGINATION['first']
+    and is clamped to between 1 and its max_first
+    :param paginated_type: The paginated type, e.g. created with create_cursor_paginated_type_mixin
+    :param after: Return the rows after this cursor, the end_cursor of the previous page
+    :param before: Return the rows before this cursor, the start_cursor of the next page
+    :param order_by: Field names of qs.model to order by, e.g. ['-created_at']. The primary key is added as
+    the final tie breaker. Defaults to the primary key
+    :param kwargs: Additional kwargs to pass paginated_type function, usually unneeded
+    :return: The paginated_type instance
+    """
+    options = cursor_pagination_settings()
+    first = min(max(first if isinstance(first, int) else options['first'], 1), options['max_first'])
+    ordering = _cursor_ordering(qs.model, order_by)
+    # Paging backward reads the rows before the cursor in reverse and flips them
+    query_ordering = _reverse_ordering(ordering) if before else ordering
+    attnames = R.map(lambda name: _attname(qs.model, name), ordering)
+    qs = _with_columns(qs.order_by(*query_ordering), R.map(lambda name: name.lstrip('-'), ordering))
+    if after:
+        qs = qs.filter(_keyset_q(qs.model, ordering, decode_cursor(after, ordering)))
+    if before:
+        qs = qs.filter(_keyset_q(qs.model, query_ordering, decode_cursor(before, ordering)))
+    rows = list(qs[:first + 1])
+    has_more = len(rows) > first
+    rows = rows[:first]
+    if before:
+        rows.reverse()
+
+    def cursor(row):
+        return encode_cursor(R.map(lambda attname: getattr(row, attname), attnames))
+
+    return paginated_type(
+        first=first,
+        # Paging past a cursor means the cursor's row lies on the other side
+        has_next=True if before else has_more,
+        has_prev=has_more if before else bool(after),
+        start_cursor=cursor(rows[0]) if rows else None,
+        end_cursor=cursor(rows[-1]) if rows else None,
+        objects=rows,
+        **kwargs
+    )
+
+
+def create_cursor_paginated_type_mixin(model_object_type, model_object_type_fields):
+    """
+        Constructs a CursorPaginatedTypeMixin class and the fields object (for use in allowed filtering).
+        The cursor pagination is for the given model_object_type. Query with first and after the end_cursor
+        of the previous page, or before the start_cursor of the next page
+    :param model_object_type: E.g. LocationType
+    :param model_object_type_fields: The fields of the model_object_type, e.g. location_fields
+    :return: An object containing {type: The class, fields: The field}
+    """
+    cursor_paginated_type_mixin = type(
+        f'CursorPaginatedTypeMixinFor{model_object_type.__name__}',
+        (ObjectType,),
+        dict(
+            first=Int(),
+            after=String(),
+            before=String(),
+            has_next=Boolean(),
+            has_prev=Boolean(),
+            start_cursor=String(),
+            end_cursor=String(),
+            objects=List(model_object_type),
+        )
+    )
+
+    cursor_paginated_fields = dict(
+        first=dict(type=Int, graphene_type=Int, create=DENY, update=DENY),
+        after=dict(type=String, graphene_type=String, create=DENY, update=DENY),
+        before=dict(type=String, graphene_type=String, create=DENY, update=DENY),
+        has_next=dict(type=Boolean, graphene_type=Boolean, create=DENY, update=DENY),
+        has_prev=dict(type=Boolean, graphene_type=Boolean, create=DENY, update=DENY),
+        start_cursor=dict(type=String, graphene_type=String, create=DENY, update=DENY),
+        end_cursor=dict(type=String, graphene_type=String, create=DENY, update=DENY),
+        objects=dict(
+            type=model_object_type,
+            graphene_type=model_object_type,
+            fields=model_object_type_fields,
+            type_modifier=lambda *type_and_args: List(*type_and_args)
+        )
+    )
+
+    return dict(type=cursor_paginated_type_mixin, fields=cursor_paginated_fields)
+
+
+def resolve_cursor_paginated_for_type(paginated_type, type_resolver, info=None, field_configs=None, order_by=None,
+                                      **kwargs):
+    """
+        Resolver for cursor paginated types, the counterpart of resolve_paginated_for_type
+    :param paginated_type: The cursor paginated Type, e.g. LocationCursorPaginatedType
+    :param type_resolver: The resolver for the non-paginated type, e.g. location_resolver
+    :param info: Optional graphene resolution info. If given the queryset is optimized for the selections of
+    objects, see optimize_queryset
+    :param field_configs: Optional field configs of the non-paginated type, e.g. location_fields
+    :param order_by: Optional field names to order by. Defaults to the primary key
+    :param kwargs: The kwargs Array of prop sets for the non-paginated objects in 'objects'.
+    Normally it's just a 1-item array.
+    Other kwargs are first, which defaults to settings.RESCAPE_GRAPHENE_CURSOR_PAGINATION['first'], and the
+    optional after and before cursors
+    :return: The paginated query
+    """
+    instances = _objects_queryset(type_resolver, kwargs)
+
+    if info and instances is not None:
+        instances = optimize_queryset(instances, info, field_configs, path=['objects'])
+
+    return get_cursor_paginator(
         instances,
-        R.prop('page_size', kwargs),
-        R.prop('page', kwargs),
-        paginated_type
+        R.prop_or(None, 'first', kwargs),
+        paginated_type,
+        after=R.prop_or(None, 'after', kwargs),
+        before=R.prop_or(None, 'before', kwargs),
+        order_by=order_by
     )
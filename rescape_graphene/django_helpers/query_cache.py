@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from rescape_python_helpers import ramda as R
+from reversion.signals import post_revision_commit
+
+from rescape_graphene.django_helpers.model_metadata import model_metadata
+
+logger = logging.getLogger('rescape_graphene')
+
+###
+# A cache of the ids that top-level list resolvers return. Resolvers filter the same kwargs over and over while
+# writes are comparatively rare, so cached_queryset stores the ids of a filtered queryset under the model, the
+# resolver, the normalized filter kwargs and the auth scope, and answers repeats with a pk__in query. Only ids
+# are cached, so the fields of the rows are always current; it's the filter's matches that can go stale.
+# Every entry is stamped with a version of each model the filter touches, the queried model and the models
+# of its filtered relations. Saves, deletes, m2m changes and revision commits bump the version of their model
+# once their transaction commits, which orphans the entries that depend on it. Bumping before the commit would
+# let a concurrent request cache the old rows under the new version. Bulk updates and raw SQL don't send signals, so the timeout
+# bounds how stale an entry can get.
+# Configure with settings.RESCAPE_GRAPHENE_QUERY_CACHE, a dict overriding QUERY_CACHE_DEFAULTS
+###
+
+QUERY_CACHE_DEFAULTS = dict(
+    enabled=False,
+    # The Django cache alias
+    cache='default',
+    # Seconds to keep an entry
+    timeout=300,
+    # Timeouts by model label, e.g. {'sample_webapp.Foo': 60}
+    timeouts={},
+    # Model labels that are never cached, e.g. ['auth.User']
+    exclude=[],
+    # Don't cache results with more ids than this
+    max_ids=10000
+)
+
+_KEY_PREFIX = 'rescape_graphene_query_cache'
+
+# Hits, misses and invalidations by model label since the process started
+_stats = {}
+
+
+def query_cache_settings():
+    return R.merge(QUERY_CACHE_DEFAULTS, getattr(settings, 'RESCAPE_GRAPHENE_QUERY_CACHE', {}))
+
+
+def _count(label, stat):
+    counts = _stats.setdefault(label, dict(hits=0, misses=0, invalidations=0))
+    counts[stat] += 1
+
+
+def query_cache_stats():
+    """
+        The hits, misses and invalidations of this process
+    :return: A dict keyed by model label of dicts with hits, misses and invalidations
+    """
+    return {label: dict(counts) for label, counts in _stats.items()}
+
+
+def reset_query_cache_stats():
+    _stats.clear()
+
+
+def _version_key(label):
+    return f'{_KEY_PREFIX}:version:{label}'
+
+
+def filter_dependencies(model, kwargs):
+    """
+        The models whose rows can change which instances of model match kwargs: model itself and the related
+        models of the relations that kwargs filter by, recursively
+    :param model: The Django model
+    :param kwargs: Filter kwargs of the model's type, e.g. dict(name='Foo', user=dict(username='jo'))
+    :return: A list of models
+    """
+    models = [model]
+    fields = model_metadata(model).fields
+    for key, value in kwargs.items():
+        # Keys can end with filter suffixes like bars_in or user_not
+        field_metadata = R.prop_or(None, key, fields) or R.head([
+            field_metadata for name, field_metadata in fields.items() if key.startswith(f'{name}_')
+        ] or [None])
+        if not (field_metadata and field_metadata.is_relation):
+            continue
+        related_kwargs = value if isinstance(value, list) else [value]
+        models.append(field_metadata.related_model)
+        for related_kwarg in related_kwargs:
+            if isinstance(related_kwarg, dict):
+                models.extend(filter_dependencies(field_metadata.related_model, related_kwarg))
+    # Without duplicates, in order
+    return list(dict.fromkeys(models))
+
+
+def query_cache_scope(info):
+    """
+        The default auth scope of entries, which is the user, so that resolvers that filter by the user don't
+        share results. Resolvers whose results don't depend on the user can pass a shared scope to cached_queryset
+    :param info: The graphene resolution info
+    :return: A string
+    """
+    user = R.prop_or(None, 'user', info.context)
+    return f'user:{user.pk}' if user and user.is_authenticated else 'anonymous'
+
+
+def _entry_key(label, info, kwargs, scope, versions):
+    normalized = json.dumps(
+        dict(field=f'{info.parent_type.name}.{info.field_name}', kwargs=kwargs, scope=scope, versions=versions),
+        sort_keys=True,
+        default=str
+    )
+    return f'{_KEY_PREFIX}:{label}:{hashlib.sha1(normalized.encode()).hexdigest()}'
+
+
+def cached_queryset(queryset, info, kwargs, scope=None, timeout=None):
+    """
+        Answers queryset from the cached ids of an earlier identical query, or evaluates its ids and caches them.
+        Call it in a top-level list resolver before optimize_queryset:
+            return optimize_queryset(cached_queryset(Foo.objects.filter(*q_expressions), info, kwargs), info,
+                foo_fields)
+    :param queryset: The filtered queryset
+    :param info: The graphene resolution info
+    :param kwargs: The filter kwargs of the resolver. With the resolver's field and the scope they key the entry
+    :param scope: The auth scope. Defaults to query_cache_scope(info), the user
+    :param timeout: Seconds to keep the entry. Defaults to the timeout of the model in settings. 0 disables
+    caching for the call
+    :return: A queryset of the matching ids with the ordering of queryset, or queryset itself if caching
+    doesn't apply
+    """
+    options = query_cache_settings()
+    model = queryset.model
+    label = model._meta.label
+    if not options['enabled'] or label in options['exclude']:
+        return queryset
+    timeout = timeout if timeout is not None else R.prop_or(options['timeout'], label, options['timeouts'])
+    if not timeout:
+        return queryset
+
+    cache = caches[options['cache']]
+    version_keys = R.map(lambda dependency: _version_key(dependency._meta.label), filter_dependencies(model, kwargs))
+    versions = cache.get_many(version_keys)
+    key = _entry_key(label, info, kwargs, scope or query_cache_scope(info), [
+        R.prop_or(0, version_key, versions) for version_key in version_keys
+    ])
+    ids = cache.get(key)
+    if ids is None:
+        _count(label, 'misses')
+        ids = list(queryset.values_list('pk', flat=True)[:options['max_ids'] + 1])
+        if len(ids) > options['max_ids']:
+            # Too big to be worth caching
+            return queryset
+        cache.set(key, ids, timeout)
+    else:
+        _count(label, 'hits')
+    cached = model._default_manager.filter(pk__in=ids)
+    # Otherwise keep the model's default ordering
+    return cached.order_by(*queryset.query.order_by) if queryset.query.order_by else cached
+
+
+def invalidate_model(model):
+    """
+        Orphans the cached entries that depend on model
+    :param model: The Django model
+    :return: None
+    """
+    options = query_cache_settings()
+    label = model._meta.label
+    if not options['enabled'] or label in options['exclude']:
+        return
+    cache = caches[options['cache']]
+    key = _version_key(label)
+    # Versions never expire. Entries do
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, None)
+    _count(label, 'invalidations')
+
+
+def _invalidate_on_commit(model):
+    # Bumps the version when the write commits, immediately in autocommit mode
+    transaction.on_commit(lambda: invalidate_model(model), using=router.db_for_write(model))
+
+
+def _invalidate_sender(sender, **kwargs):
+    _invalidate_on_commit(sender)
+
+
+def _invalidate_m2m(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        # Both sides of the relation and the through model
+        _invalidate_on_commit(sender)
+        _invalidate_on_commit(instance.__class__)
+        _invalidate_on_commit(model)
+
+
+def _invalidate_revision(sender, revision, versions, **kwargs):
+    for model in dict.fromkeys(R.map(lambda version: version._model, versions)):
+        _invalidate_on_commit(model)
+
+
+post_save.connect(_invalidate_sender, dispatch_uid='rescape_graphene_query_cache_post_save')
+post_delete.connect(_invalidate_sender, dispatch_uid='rescape_graphene_query_cache_post_delete')
+m2m_changed.connect(_invalidate_m2m, dispatch_uid='rescape_graphene_query_cache_m2m_changed')
+post_revision_commit.connect(_invalidate_revision, dispatch_uid='rescape_graphene_query_cache_post_revision_commit')
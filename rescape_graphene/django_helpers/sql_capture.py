@@ -0,0 +1,147 @@
+import logging
+import re
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from rescape_python_helpers import ramda as R
+
+logger = logging.getLogger('rescape_graphene')
+
+###
+# Captures the SQL that Django runs within a block using connection.execute_wrapper. The capture counts the queries,
+# totals their time, keeps the slowest statements, optionally EXPLAINs them and flags statement templates that
+# repeat more than a threshold, which usually means an N+1 pattern that select_related or prefetch_related would fix
+###
+
+# Defaults of settings.RESCAPE_GRAPHENE_SQL_CAPTURE, which SafeGraphQLView uses
+SQL_CAPTURE_DEFAULTS = dict(
+    # Capture every request
+    enabled=False,
+    # Capture requests with this header when settings.DEBUG is on or the user is staff. None to disable.
+    # A value of 'explain' also EXPLAINs the slowest statements
+    header='HTTP_X_SQL_CAPTURE',
+    # The number of slowest statements to report
+    top=5,
+    # EXPLAIN the slowest statements
+    explain=False,
+    # Warn when the same statement template runs more than this many times
+    n_plus_one_threshold=10
+)
+
+# Collapses the placeholders of IN lists so statements that only differ by list length share a template
+_placeholder_list = re.compile(r'\((?:%s, )+%s\)')
+
+
+def sql_template(sql):
+    """
+        The template of a parameterized statement, with IN lists collapsed
+    :param sql: The SQL with %s placeholders
+    :return: The template string
+    """
+    return _placeholder_list.sub('(%s, ...)', sql)
+
+
+class SqlCapture(object):
+    """
+        An execute wrapper that records every statement it wraps
+    """
+
+    def __init__(self, top=5, explain=False, n_plus_one_threshold=10):
+        """
+        :param top: The number of slowest statements to report
+        :param explain: If True, report the EXPLAIN output of the slowest SELECT statements
+        :param n_plus_one_threshold: Report statement templates that run more than this many times
+        """
+        self.top = top
+        self.explain = explain
+        self.n_plus_one_threshold = n_plus_one_threshold
+        # Dicts of alias, sql, params and seconds
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append(dict(
+                alias=context['connection'].alias,
+                sql=sql,
+                params=params,
+                many=many,
+                seconds=time.perf_counter() - start
+            ))
+
+    @property
+    def seconds(self):
+        return sum(R.map(R.prop('seconds'), self.statements))
+
+    def slowest(self):
+        return sorted(self.statements, key=R.prop('seconds'), reverse=True)[:self.top]
+
+    def repeated_templates(self):
+        """
+            Statement templates that ran more than n_plus_one_threshold times
+        :return: A list of dict(sql=template, count=n), most repeated first
+        """
+        counts = {}
+        for statement in self.statements:
+            template = sql_template(statement['sql'])
+            counts[template] = R.prop_or(0, template, counts) + 1
+        return sorted(
+            [dict(sql=template, count=count) for template, count in counts.items() if
+             count > self.n_plus_one_threshold],
+            key=R.prop('count'),
+            reverse=True
+        )
+
+    def _explain(self, statement):
+        if not statement['sql'].lstrip().upper().startswith('SELECT') or statement['many']:
+            return None
+        try:
+            with connections[statement['alias']].cursor() as cursor:
+                cursor.execute(f'EXPLAIN {statement["sql"]}', statement['params'])
+                return R.map(lambda row: row[0], cursor.fetchall())
+        except Exception as e:
+            return [f'EXPLAIN failed: {e}']
+
+    def report(self):
+        """
+            Summarizes the captured statements. Call this after the capture ends so EXPLAIN isn't captured
+        :return: A json serializable dict
+        """
+        repeated = self.repeated_templates()
+        for template in repeated:
+            logger.warning(f'Possible N+1 queries, statement ran {template["count"]} times: {template["sql"]}')
+        return dict(
+            count=len(self.statements),
+            milliseconds=round(self.seconds * 1000, 3),
+            slowest=R.map(
+                lambda statement: R.compact_dict_none(dict(
+                    sql=statement['sql'],
+                    milliseconds=round(statement['seconds'] * 1000, 3),
+                    explain=self._explain(statement) if self.explain else None
+                )),
+                self.slowest()
+            ),
+            n_plus_one=repeated
+        )
+
+
+@contextmanager
+def capture_sql(top=5, explain=False, n_plus_one_threshold=10):
+    """
+        Captures the statements run on every database connection within the block
+            with capture_sql() as capture:
+                ...
+            capture.report()
+    :param top: The number of slowest statements to report
+    :param explain: If True, report the EXPLAIN output of the slowest SELECT statements
+    :param n_plus_one_threshold: Report statement templates that run more than this many times
+    :return: The SqlCapture
+    """
+    capture = SqlCapture(top=top, explain=explain, n_plus_one_threshold=n_plus_one_threshold)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(capture))
+        yield capture
@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+from django.contrib.postgres.indexes import GinIndex
+
+from sample_webapp.models import Foo
+from .filter_usage import parse_lookup, record_filter_kwargs, _recording
+from .index_advisor import suggest_indexes, index_migrations, TRIGRAM, JSONB_PATH_OPS
+from ..graphql_helpers.schema_helpers import process_filter_kwargs
+
+
+class IndexAdvisorTestCase(TestCase):
+
+    def test_parse_lookup(self):
+        usage = parse_lookup(Foo, 'user__username__icontains')
+        assert usage.key == ('auth.User', 'username', 'icontains')
+        assert parse_lookup(Foo, 'data__friend__name__contains').key == \
+               ('sample_webapp.Foo', 'data__friend__name', 'contains')
+        assert parse_lookup(Foo, 'data__contains').key == ('sample_webapp.Foo', 'data', 'contains')
+        assert parse_lookup(Foo, 'user__in').key == ('sample_webapp.Foo', 'user', 'in')
+        assert parse_lookup(Foo, 'nonesuch') is None
+
+    def test_record_filter_kwargs(self):
+        _recording.usages = {}
+        try:
+            record_filter_kwargs(Foo, process_filter_kwargs(Foo, name_contains='a', key='b'))
+            assert _recording.usages == {
+                ('sample_webapp.Foo', 'name', 'contains'): 1,
+                ('sample_webapp.Foo', 'key', 'exact'): 1
+            }
+        finally:
+            _recording.usages = None
+
+    def test_suggest_indexes(self):
+        total = dict(count=20, requests=10, seconds=1.5)
+        suggestions, skipped = suggest_indexes({
+            ('sample_webapp.Foo', 'name', 'icontains'): total,
+            ('sample_webapp.Foo', 'name', 'contains'): total,
+            ('sample_webapp.Foo', 'data', 'contains'): total,
+            # Unique, so already indexed
+            ('sample_webapp.Foo', 'key', 'exact'): total,
+            ('sample_webapp.Foo', 'data__friend', 'contains'): total,
+            ('auth.User', 'username', 'exact'): dict(count=1, requests=1, seconds=0)
+        }, min_count=10)
+        assert sorted([suggestion.kind for suggestion in suggestions]) == sorted([TRIGRAM, JSONB_PATH_OPS])
+        trigram = [suggestion for suggestion in suggestions if suggestion.kind == TRIGRAM][0]
+        # Both lookups are served by the same index
+        assert trigram.count == 40
+        assert isinstance(trigram.index, GinIndex) and trigram.index.opclasses == ['gin_trgm_ops']
+        assert len(trigram.index.name) <= 30
+        assert [skip['usage'][1] for skip in skipped] == ['data__friend']
+
+        writers = index_migrations(suggestions)
+        assert len(writers) == 1
+        migration = writers[0].as_string()
+        assert 'TrigramExtension()' in migration
+        assert 'jsonb_path_ops' in migration
+        # The number follows the app's latest migration, so only the name and operations are checked
+        assert writers[0].migration.name.endswith('_suggested_filter_indexes')
+        assert [operation.__class__.__name__ for operation in writers[0].migration.operations] == \
+               ['TrigramExtension', 'AddIndex', 'AddIndex']
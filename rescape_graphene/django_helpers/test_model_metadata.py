@@ -0,0 +1,20 @@
+from unittest import TestCase
+
+import graphene
+from django.contrib.auth import get_user_model
+
+from .model_metadata import model_metadata, SCALAR, MANY_TO_MANY
+
+
+class ModelMetadataTestCase(TestCase):
+
+    def test_model_metadata(self):
+        metadata = model_metadata(get_user_model())
+        # Built once per model
+        assert metadata is model_metadata(get_user_model())
+        assert metadata.fields['username'].kind == SCALAR
+        assert metadata.fields['username'].graphene_type == graphene.String
+        assert metadata.fields['groups'].kind == MANY_TO_MANY
+        assert metadata.fields['groups'].graphene_type is None
+        assert metadata.forward_fields['groups'] is metadata.fields['groups']
+        assert 'username' not in metadata.reverse_fields
@@ -0,0 +1,117 @@
+import pytest
+from datetime import timedelta
+from unittest import TestCase
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rescape_python_helpers import ramda as R
+
+from rescape_graphene.schema_models.user_schema import UserType, user_fields
+from .pagination import create_cursor_paginated_type_mixin, get_cursor_paginator, create_paginated_type_mixin, \
+    get_paginator, CAPPED_COUNT, APPROXIMATE_COUNT
+
+UserPaginatedType = create_paginated_type_mixin(UserType, user_fields)['type']
+UserCursorPaginatedType = create_cursor_paginated_type_mixin(UserType, user_fields)['type']
+
+
+@pytest.mark.django_db
+class CursorPaginationTestCase(TestCase):
+
+    def setUp(self):
+        for i in range(7):
+            get_user_model().objects.create(username=f'user{i}', last_name=['b', 'a'][i % 2])
+
+    def test_paginator_counts_lazily(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+        with CaptureQueriesContext(connection) as context:
+            page = get_paginator(queryset, 3, 2, UserPaginatedType)
+        # The page with one extra row, but no count
+        assert len(context.captured_queries) == 1
+        assert R.length(page.objects) == 3 and page.has_next and page.has_prev
+        assert page.pages == 3 and page.pages_exact
+        # Past the end is clamped to the last page
+        assert get_paginator(queryset, 3, 5, UserPaginatedType).page == 3
+
+    def test_paginator_clamps_exactly(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+        # A cap below the rows would clamp to page 2 of 3
+        page = get_paginator(queryset, 3, 5, UserPaginatedType, count_strategy=CAPPED_COUNT, count_cap=4)
+        assert page.page == 3 and R.length(page.objects) == 1
+        assert page.pages == 3 and page.pages_exact
+
+    def test_paginator_count_strategies(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+        capped = get_paginator(queryset, 2, 1, UserPaginatedType, count_strategy=CAPPED_COUNT, count_cap=4)
+        # At least 2 pages
+        assert capped.pages == 2 and not capped.pages_exact
+        approximate = get_paginator(queryset, 2, 1, UserPaginatedType, count_strategy=APPROXIMATE_COUNT)
+        assert approximate.pages >= 1 and not approximate.pages_exact
+
+    def test_cursor_paginator(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+
+        def usernames(page):
+            return R.map(lambda user: user.username, page.objects)
+
+        first_page = get_cursor_paginator(queryset, 3, UserCursorPaginatedType)
+        assert usernames(first_page) == ['user0', 'user1', 'user2']
+        assert first_page.has_next and not first_page.has_prev
+        second_page = get_cursor_paginator(queryset, 3, UserCursorPaginatedType, after=first_page.end_cursor)
+        assert usernames(second_page) == ['user3', 'user4', 'user5']
+        last_page = get_cursor_paginator(queryset, 3, UserCursorPaginatedType, after=second_page.end_cursor)
+        assert usernames(last_page) == ['user6']
+        assert not last_page.has_next and last_page.has_prev
+        # Backward from the last page
+        previous_page = get_cursor_paginator(queryset, 3, UserCursorPaginatedType, before=last_page.start_cursor)
+        assert usernames(previous_page) == usernames(second_page)
+        assert previous_page.has_prev and previous_page.has_next
+
+    def test_cursor_paginator_ordering(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+        pages = []
+        after = None
+        while True:
+            page = get_cursor_paginator(queryset, 2, UserCursorPaginatedType, after=after, order_by=['last_name'])
+            pages.extend(R.map(lambda user: user.username, page.objects))
+            if not page.has_next:
+                break
+            after = page.end_cursor
+        # Ties of last_name are broken by id
+        assert pages == ['user1', 'user3', 'user5', 'user0', 'user2', 'user4', 'user6']
+
+    @override_settings(RESCAPE_GRAPHENE_CURSOR_PAGINATION=dict(first=4, max_first=5))
+    def test_cursor_paginator_first(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+        assert R.length(get_cursor_paginator(queryset, None, UserCursorPaginatedType).objects) == 4
+        assert R.length(get_cursor_paginator(queryset, -1, UserCursorPaginatedType).objects) == 1
+        assert R.length(get_cursor_paginator(queryset, 100, UserCursorPaginatedType).objects) == 5
+
+    def test_cursor_paginator_nulls(self):
+        queryset = get_user_model().objects.filter(username__startswith='user')
+        now = timezone.now()
+        queryset.filter(username='user5').update(last_login=now)
+        queryset.filter(username='user2').update(last_login=now - timedelta(days=1))
+
+        def page_through(order_by):
+            usernames = []
+            after = None
+            while True:
+                page = get_cursor_paginator(queryset, 2, UserCursorPaginatedType, after=after, order_by=order_by)
+                usernames.extend(R.map(lambda user: user.username, page.objects))
+                if not page.has_next:
+                    return usernames, page
+                after = page.end_cursor
+
+        # NULLs are last ascending and first descending, like PostgreSQL orders them
+        ascending, last_page = page_through(['last_login'])
+        assert ascending == ['user2', 'user5', 'user0', 'user1', 'user3', 'user4', 'user6']
+        descending, _ = page_through(['-last_login'])
+        assert descending == ['user0', 'user1', 'user3', 'user4', 'user6', 'user5', 'user2']
+        # Backward from a page of NULLs
+        previous_page = get_cursor_paginator(
+            queryset, 2, UserCursorPaginatedType, before=last_page.start_cursor, order_by=['last_login']
+        )
+        assert R.map(lambda user: user.username, previous_page.objects) == ['user3', 'user4']
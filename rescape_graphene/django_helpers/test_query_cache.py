@@ -0,0 +1,66 @@
+import pytest
+from types import SimpleNamespace
+from unittest import TestCase
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.db import transaction
+from django.test import override_settings
+
+from .query_cache import cached_queryset, filter_dependencies, query_cache_stats, reset_query_cache_stats, \
+    _version_key
+
+
+# Writes commit, so invalidations run as they do outside of tests
+@pytest.mark.django_db(transaction=True)
+class QueryCacheTestCase(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        reset_query_cache_stats()
+        self.info = SimpleNamespace(
+            parent_type=SimpleNamespace(name='Query'),
+            field_name='users',
+            context=SimpleNamespace(user=None)
+        )
+
+    def test_filter_dependencies(self):
+        user_model = get_user_model()
+        assert filter_dependencies(user_model, dict(username='jo')) == [user_model]
+        assert filter_dependencies(user_model, dict(groups=[dict(name='fellas')])) == [user_model, Group]
+
+    @override_settings(RESCAPE_GRAPHENE_QUERY_CACHE=dict(enabled=True))
+    def test_cached_queryset(self):
+        user_model = get_user_model()
+        user_model.objects.create(username='jo')
+
+        def usernames():
+            kwargs = dict(username_contains='j')
+            return list(cached_queryset(
+                user_model.objects.filter(username__contains='j'), self.info, kwargs
+            ).values_list('username', flat=True))
+
+        assert usernames() == ['jo']
+        assert usernames() == ['jo']
+        assert query_cache_stats()['auth.User']['misses'] == 1
+        assert query_cache_stats()['auth.User']['hits'] == 1
+        # Saving a user orphans the entry
+        user_model.objects.create(username='jan')
+        assert sorted(usernames()) == ['jan', 'jo']
+        assert query_cache_stats()['auth.User']['misses'] == 2
+
+    @override_settings(RESCAPE_GRAPHENE_QUERY_CACHE=dict(enabled=True))
+    def test_invalidate_on_commit(self):
+        user_model = get_user_model()
+        version = caches['default'].get(_version_key('auth.User'))
+        with transaction.atomic():
+            user_model.objects.create(username='jo')
+            # Concurrent requests still see the old rows, so the version must not change yet
+            assert caches['default'].get(_version_key('auth.User')) == version
+        assert caches['default'].get(_version_key('auth.User')) == (version or 0) + 1
+
+    @override_settings(RESCAPE_GRAPHENE_QUERY_CACHE=dict(enabled=True, exclude=['auth.User']))
+    def test_exclude(self):
+        queryset = get_user_model().objects.all()
+        assert cached_queryset(queryset, self.info, {}) is queryset
@@ -0,0 +1,40 @@
+import pytest
+from unittest import TestCase
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, override_settings
+
+from rescape_graphene.graphql_helpers.views import sql_capture_options
+from .sql_capture import capture_sql, sql_template
+
+
+@pytest.mark.django_db
+class SqlCaptureTestCase(TestCase):
+
+    def test_sql_template(self):
+        assert sql_template('SELECT * FROM a WHERE id IN (%s, %s, %s)') == \
+               sql_template('SELECT * FROM a WHERE id IN (%s, %s)')
+
+    def test_capture_sql(self):
+        user_model = get_user_model()
+        with capture_sql(top=2, explain=True, n_plus_one_threshold=3) as capture:
+            for i in range(5):
+                list(user_model.objects.filter(id=i))
+        report = capture.report()
+        assert report['count'] == 5
+        assert len(report['slowest']) == 2
+        assert report['slowest'][0]['explain']
+        # The same statement ran 5 times
+        assert report['n_plus_one'][0]['count'] == 5
+
+    def test_sql_capture_options(self):
+        factory = RequestFactory()
+        with override_settings(DEBUG=False, RESCAPE_GRAPHENE_SQL_CAPTURE={}):
+            request = factory.post('/graphql', HTTP_X_SQL_CAPTURE='explain')
+            # Not staff
+            assert sql_capture_options(request) is None
+        with override_settings(DEBUG=True, RESCAPE_GRAPHENE_SQL_CAPTURE={}):
+            assert sql_capture_options(factory.post('/graphql')) is None
+            assert sql_capture_options(factory.post('/graphql', HTTP_X_SQL_CAPTURE='explain'))['explain']
+        with override_settings(DEBUG=False, RESCAPE_GRAPHENE_SQL_CAPTURE=dict(enabled=True)):
+            assert not sql_capture_options(factory.post('/graphql'))['explain']
@@ -0,0 +1,348 @@
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+
+from django.apps import apps
+from django.conf import settings
+from graphene import Scalar
+from graphene.types.structures import Structure
+from graphene.types.unmountedtype import UnmountedType
+from rescape_python_helpers import ramda as R
+
+logger = logging.getLogger('rescape_graphene')
+
+###
+# Compiled schema mode. Building the schema walks the Django model metadata of every model in every field_dict,
+# tests every FILTER_FIELDS suffix against every graphene type and lays out the fields of every input type.
+# These results only depend on the models and the field dicts, so we write them to an on-disk artifact and read
+# them back in later processes.
+# The artifact is enabled by pointing settings.RESCAPE_GRAPHENE_COMPILED_SCHEMA at a writable json file path.
+# The whole artifact is stamped with a digest of the installed models that is computed once per process, so
+# any model change falls back to a full rebuild. Entries are keyed by the field_dict shape, so a changed
+# field_dict rebuilds its entry, after which the artifact is rewritten.
+# The graphene classes themselves are still created in process, since they carry resolvers and lambdas.
+# Input type layouts are only stored if every field is a scalar or a list of scalars. Layouts with nested input
+# types are rebuilt, though the nested types and the parse_django_class results they need come from the artifact
+###
+
+# Bump this whenever the layout of the artifact changes
+COMPILED_SCHEMA_VERSION = 2
+
+_artifact = None
+
+
+def class_path(cls):
+    """
+        The importable dotted path of a class
+    :param cls:
+    :return: {String} E.g. 'graphene.types.scalars.String'
+    """
+    return f'{cls.__module__}.{cls.__qualname__}'
+
+
+def class_from_path(path):
+    """
+        Imports the class at the given dotted path
+    :param path: E.g. 'graphene.types.scalars.String'
+    :return: The class
+    """
+    module_name, _, class_name = path.rpartition('.')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def models_digest(filter_fields):
+    """
+        Digests the fields of every installed model, which is everything parse_django_class reads from Django,
+        and the settings that change the filter layouts
+    :param filter_fields: The FILTER_FIELDS dict
+    :return: A hash string
+    """
+    return _hash([
+        COMPILED_SCHEMA_VERSION,
+        sorted(R.keys(filter_fields)),
+        getattr(settings, 'RESCAPE_GRAPHENE_FILTER_PROFILES', True),
+        R.map(
+            lambda model: [
+                model._meta.label,
+                R.map(
+                    lambda field: [
+                        field.name,
+                        class_path(field.__class__),
+                        field.related_model._meta.label if field.related_model else None
+                    ],
+                    R.concat(model._meta.fields, R.concat(model._meta.many_to_many, model._meta.related_objects))
+                ),
+                R.map(list, model._meta.unique_together)
+            ],
+            sorted(apps.get_models(), key=lambda model: model._meta.label)
+        )
+    ])
+
+
+def _type_spec(graphene_type):
+    # An importable scalar class or a structure of one, e.g. List(Int), or None
+    if isinstance(graphene_type, Structure):
+        of_type = _type_spec(graphene_type.of_type)
+        return None if of_type is None else dict(structure=class_path(graphene_type.__class__), of_type=of_type)
+    if inspect.isclass(graphene_type) and issubclass(graphene_type, Scalar) and \
+            class_from_path(class_path(graphene_type)) is graphene_type:
+        return dict(scalar=class_path(graphene_type))
+    return None
+
+
+def field_spec(value):
+    """
+        Describes an input type field that is a scalar or a structure of scalars as json
+    :param value: An unmounted field such as Int(required=True) or List(String)
+    :return: The spec or None if the field has input types or kwargs other than required
+    """
+    if not isinstance(value, UnmountedType) or value.args or set(value.kwargs) - {'required'}:
+        return None
+    type_spec = _type_spec(value) if isinstance(value, Structure) else _type_spec(value.__class__)
+    return R.merge(type_spec, dict(kwargs=dict(value.kwargs))) if type_spec else None
+
+
+def _type_from_spec(spec):
+    if R.has('structure', spec):
+        return class_from_path(spec['structure'])(_type_from_spec(spec['of_type']))
+    return class_from_path(spec['scalar'])
+
+
+def field_from_spec(spec):
+    """
+        Recreates the field of field_spec
+    :param spec: The result of field_spec
+    :return: The unmounted field
+    """
+    if R.has('structure', spec):
+        return class_from_path(spec['structure'])(_type_from_spec(spec['of_type']), **spec['kwargs'])
+    return class_from_path(spec['scalar'])(**spec['kwargs'])
+
+
+def _type_name(graphene_type):
+    return class_path(graphene_type) if inspect.isclass(graphene_type) else \
+        ('callable' if callable(graphene_type) else str(graphene_type))
+
+
+class CompiledSchemaArtifact(object):
+    """
+        The on-disk artifact of parse_django_class results, allowed filter suffixes and input type layouts
+    """
+
+    def __init__(self, path, filter_fields):
+        """
+        :param path: The json file path of the artifact. It need not exist yet
+        :param filter_fields: The FILTER_FIELDS dict. The artifact is discarded when its keys change
+        """
+        self.path = path
+        # Once per process. Entries are only keyed by the field_dict shape
+        self.digest = models_digest(filter_fields)
+        self.django_classes = {}
+        self.filter_suffixes = {}
+        self.input_types = {}
+        # Keys of the entries used by this process. Only these are written so stale entries drop out
+        self.used_django_classes = set()
+        self.used_filter_suffixes = set()
+        self.used_input_types = set()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                artifact = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Ignoring unreadable compiled schema artifact {self.path}: {e}')
+            return
+        if R.prop_or(None, 'digest', artifact) != self.digest:
+            # The models or filters changed. Everything is rebuilt
+            return
+        self.django_classes = R.prop_or({}, 'django_classes', artifact)
+        self.filter_suffixes = R.prop_or({}, 'filter_suffixes', artifact)
+        self.input_types = R.prop_or({}, 'input_types', artifact)
+
+    def save(self):
+        """
+            Writes the artifact if anything was rebuilt by this process
+        :return: True if written
+        """
+        if not self.dirty:
+            return False
+        artifact = dict(
+            digest=self.digest,
+            django_classes=R.pick(list(self.used_django_classes), self.django_classes),
+            filter_suffixes=R.pick(list(self.used_filter_suffixes), self.filter_suffixes),
+            input_types=R.pick(list(self.used_input_types), self.input_types)
+        )
+        # Write to a temporary file and rename so that concurrently starting workers never read a partial file
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(artifact, f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+        return True
+
+    def django_class_key(self, model, field_dict):
+        # Whether a field has a graphene_type decides if it is resolved to a related input type
+        return R.join(',', R.concat([model._meta.label], R.map(
+            lambda key: f'{key}*' if R.prop_or(False, 'graphene_type', field_dict[key] or {}) else key,
+            R.keys(field_dict)
+        )))
+
+    def parsed_django_class(self, model, field_dict, parent_type_classes):
+        """
+            Rebuilds the result of parse_django_class from the artifact
+        :param model: The Django model
+        :param field_dict: The field_dict passed to parse_django_class
+        :param parent_type_classes: The parent_type_classes passed to parse_django_class
+        :return: The parsed dict or None if the artifact has no matching entry
+        """
+        from .schema_helpers import related_input_field_for_crud_type
+
+        key = self.django_class_key(model, field_dict)
+        entry = R.prop_or(None, key, self.django_classes)
+        if entry is None:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.used_django_classes.add(key)
+
+        def process_entry(name, field_entry):
+            field_dict_value = R.prop(name, field_dict)
+            return dict(
+                # Related types are lambdas that we recreate, since they close over the parent types
+                type=related_input_field_for_crud_type(field_dict_value, R.to_array_if_not(parent_type_classes))
+                if field_entry['type'] is None else
+                class_from_path(field_entry['type']),
+                django_type=R.item_path_or(None, ['graphene_type', '_meta', 'model'], field_dict_value),
+                unique=field_entry['unique']
+            )
+
+        return R.map_with_obj(process_entry, entry)
+
+    def record_django_class(self, model, field_dict, parsed):
+        """
+            Stores the result of parse_django_class
+        :param model: The Django model
+        :param field_dict: The field_dict passed to parse_django_class
+        :param parsed: The result of parse_django_class
+        :return: None
+        """
+        key = self.django_class_key(model, field_dict)
+        self.django_classes[key] = R.map_with_obj(
+            lambda name, value: dict(
+                type=class_path(value['type']) if inspect.isclass(value['type']) else None,
+                unique=value['unique']
+            ),
+            parsed
+        )
+        self.used_django_classes.add(key)
+        self.dirty = True
+
+    def allowed_filter_suffixes(self, graphene_type):
+        """
+            The filter suffixes previously recorded for graphene_type
+        :param graphene_type: Graphene type class
+        :return: List of FILTER_FIELDS keys or None if unknown
+        """
+        key = class_path(graphene_type)
+        suffixes = R.prop_or(None, key, self.filter_suffixes)
+        if suffixes is not None:
+            self.used_filter_suffixes.add(key)
+        return suffixes
+
+    def record_allowed_filter_suffixes(self, graphene_type, suffixes):
+        key = class_path(graphene_type)
+        self.filter_suffixes[key] = suffixes
+        self.used_filter_suffixes.add(key)
+        self.dirty = True
+
+    def input_type_key(self, graphene_class, crud, parent_type_classes, allowed_fields_only, fields):
+        """
+            Keys the layout of an input_type_class call by everything in its arguments that shapes the layout
+        :return: The key or None if the layout can't be keyed, since a type_modifier can return anything
+        """
+        fields = fields or {}
+        if R.any_satisfy(lambda field_config: R.has('type_modifier', field_config or {}), R.values(fields)):
+            return None
+        return R.join('|', [
+            class_path(graphene_class),
+            crud,
+            R.join(',', R.map(_type_name, parent_type_classes)),
+            str(allowed_fields_only),
+            R.join(',', R.map(
+                lambda key: R.join(':', R.concat(
+                    [key, _type_name(R.prop_or(None, 'graphene_type', fields[key] or {}) or
+                                     R.prop_or(None, 'type', fields[key] or {}))],
+                    R.map(
+                        lambda prop: str(R.prop_or(None, prop, fields[key] or {})),
+                        ['create', 'update', 'read', 'filters', 'related_input']
+                    )
+                )),
+                R.keys(fields)
+            ))
+        ])
+
+    def input_type_layout(self, key):
+        """
+            The fields of an input type previously recorded under key
+        :param key: The result of input_type_key
+        :return: The dict of fields or None if unknown
+        """
+        specs = R.prop_or(None, key, self.input_types) if key else None
+        if specs is None:
+            return None
+        self.used_input_types.add(key)
+        return dict(R.map(lambda name_spec: [name_spec[0], field_from_spec(name_spec[1])], specs))
+
+    def record_input_type_layout(self, key, fields):
+        """
+            Stores the fields of an input type if they are all scalars or lists of scalars
+        :param key: The result of input_type_key
+        :param fields: The dict of fields of the input type
+        :return: True if recorded
+        """
+        if not key:
+            return False
+        specs = R.map(lambda name: [name, field_spec(fields[name])], R.keys(fields))
+        if R.any_satisfy(lambda name_spec: name_spec[1] is None, specs):
+            return False
+        self.input_types[key] = specs
+        self.used_input_types.add(key)
+        self.dirty = True
+        return True
+
+
+def compiled_schema_artifact():
+    """
+        Returns the process-wide CompiledSchemaArtifact if settings.RESCAPE_GRAPHENE_COMPILED_SCHEMA is set
+    :return: The CompiledSchemaArtifact or None
+    """
+    global _artifact
+    path = getattr(settings, 'RESCAPE_GRAPHENE_COMPILED_SCHEMA', None)
+    if not path:
+        return None
+    if not _artifact or _artifact.path != path:
+        from .schema_helpers import FILTER_FIELDS
+        _artifact = CompiledSchemaArtifact(path, FILTER_FIELDS)
+    return _artifact
+
+
+def save_compiled_schema_artifact():
+    """
+        Writes the compiled schema artifact if enabled and anything was rebuilt
+    :return: True if written
+    """
+    artifact = compiled_schema_artifact()
+    return artifact.save() if artifact else False
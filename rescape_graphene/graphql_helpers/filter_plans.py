@@ -0,0 +1,208 @@
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+
+logger = logging.getLogger('rescape_graphene')
+
+###
+# Compiled filter plans. Translating filter kwargs to Q expressions converts the keys, looks up the model
+# metadata of every key and groups the results, yet only the values change between requests of the same query.
+# So we compile the shape of the kwargs (the keys, nesting and list lengths, but not the values) once per model,
+# using placeholder slots for the values, and then bind each request's values into a copy of the compiled Q
+# expressions. Shapes whose translation depends on the values, such as the related__in sub queries, can't be
+# compiled and always take the normal path.
+# Disable with settings.RESCAPE_GRAPHENE_COMPILE_FILTER_PLANS = False
+###
+
+# The number of (model, shape) plans to keep
+FILTER_PLAN_CACHE_SIZE = 1024
+
+# Shapes of leaf values
+_SLOT = 'slot'
+_LIST_SLOT = 'list_slot'
+_EMPTY_LIST = 'empty_list'
+
+
+class _Slot(object):
+    """
+        Stands in for a scalar value while compiling
+    """
+    __slots__ = ['index']
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f'<slot {self.index}>'
+
+
+class _ListSlot(list):
+    """
+        Stands in for a non-empty list of scalars while compiling, such as the value of id__in. It's a list so
+        that the translation treats it like one
+    """
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f'<list slot {self.index}>'
+
+
+def _is_nested(value):
+    return isinstance(value, (dict, list))
+
+
+def filter_shape(value):
+    """
+        The shape of filter kwargs: keys in order, nesting and the length of lists of objects. Lists of scalars
+        are a single slot, so id__in=[1, 2] and id__in=[1, 2, 3] have the same shape
+    :param value: The filter kwargs or a value within them
+    :return: A hashable tuple
+    """
+    if isinstance(value, dict):
+        return (dict, tuple((key, filter_shape(inner_value)) for key, inner_value in value.items()))
+    if isinstance(value, list):
+        if not value:
+            return _EMPTY_LIST
+        if any(_is_nested(item) for item in value):
+            return (list, tuple(filter_shape(item) for item in value))
+        return _LIST_SLOT
+    return _SLOT
+
+
+def _template(shape, slots):
+    # Builds kwargs of the given shape with a slot for each value. slots counts the slots made so far
+    if shape == _SLOT:
+        slots.append(_Slot(len(slots)))
+        return slots[-1]
+    if shape == _LIST_SLOT:
+        slots.append(_ListSlot(len(slots)))
+        return slots[-1]
+    if shape == _EMPTY_LIST:
+        return []
+    kind, items = shape
+    if kind == dict:
+        return {key: _template(item_shape, slots) for key, item_shape in items}
+    return [_template(item_shape, slots) for item_shape in items]
+
+
+def _slot_values(value, values):
+    # Collects the values of the kwargs in the same order that _template numbers the slots
+    if isinstance(value, dict):
+        for inner_value in value.values():
+            _slot_values(inner_value, values)
+    elif isinstance(value, list):
+        if not value:
+            return values
+        if any(_is_nested(item) for item in value):
+            for item in value:
+                _slot_values(item, values)
+        else:
+            values.append(value)
+    else:
+        values.append(value)
+    return values
+
+
+def _used_slots(node, used):
+    """
+        Collects the indices of the slots in the compiled result into used
+    :param node: A list of results, a Q expression or a value within a Q expression
+    :param used: A set of slot indices
+    :return: False if the node can't be bound, namely if it contains a QuerySet, otherwise True
+    """
+    if isinstance(node, (_Slot, _ListSlot)):
+        used.add(node.index)
+        return True
+    if isinstance(node, Q):
+        return all(_used_slots(child, used) for child in node.children)
+    if isinstance(node, tuple):
+        return _used_slots(node[1], used)
+    if isinstance(node, list):
+        return all(_used_slots(item, used) for item in node)
+    if isinstance(node, dict):
+        return all(_used_slots(item, used) for item in node.values())
+    # A sub query built from the slots, which we can't bind
+    return not isinstance(node, QuerySet)
+
+
+def _bind(node, values):
+    # Copies the compiled node, replacing each slot with its value
+    if isinstance(node, (_Slot, _ListSlot)):
+        return values[node.index]
+    if isinstance(node, Q):
+        return node._new_instance(
+            [_bind(child, values) for child in node.children],
+            node.connector,
+            node.negated
+        )
+    if isinstance(node, tuple):
+        return (node[0], _bind(node[1], values))
+    if isinstance(node, list):
+        return [_bind(item, values) for item in node]
+    if isinstance(node, dict):
+        return {key: _bind(item, values) for key, item in node.items()}
+    return node
+
+
+@lru_cache(maxsize=FILTER_PLAN_CACHE_SIZE)
+def filter_plan(model, shape, compile_filter, json_containment=False):
+    """
+        Compiles filter kwargs of the given shape
+    :param model: The Django model
+    :param shape: The result of filter_shape
+    :param compile_filter: The function that translates kwargs, called with the model and kwargs
+    :param json_containment: settings.RESCAPE_GRAPHENE_JSON_CONTAINMENT, which changes the translation and so
+    is part of the cache key
+    :return: The compiled result with slots for values, or None if the shape can't be compiled
+    """
+    slots = []
+    template = _template(shape, slots)
+    try:
+        compiled = compile_filter(model, template)
+    except Exception as e:
+        # Something needed the real values. The normal path will raise the error if the values are invalid
+        logger.debug(f'Not compiling filter shape of {model.__name__}: {e}')
+        return None
+    used = set()
+    if not _used_slots(compiled, used) or len(used) != len(slots):
+        # A value was consumed by the translation instead of passed through to the Q expressions
+        return None
+    return compiled
+
+
+def apply_filter_plan(model, kwargs, compile_filter):
+    """
+        Translates filter kwargs with compile_filter, reusing the compiled plan of kwargs of the same shape
+    :param model: The Django model
+    :param kwargs: The filter kwargs
+    :param compile_filter: A module level function that translates kwargs, called with the model and kwargs.
+    Its result must be a list of Q expressions or a list of lists of them
+    :return: The result of compile_filter for kwargs
+    """
+    if not getattr(settings, 'RESCAPE_GRAPHENE_COMPILE_FILTER_PLANS', True):
+        return compile_filter(model, kwargs)
+    plan = filter_plan(
+        model,
+        filter_shape(kwargs),
+        compile_filter,
+        getattr(settings, 'RESCAPE_GRAPHENE_JSON_CONTAINMENT', False)
+    )
+    if plan is None:
+        return compile_filter(model, kwargs)
+    return _bind(plan, _slot_values(kwargs, []))
+
+
+def filter_plan_cache_info():
+    """
+        Hits, misses and size of the filter plan cache
+    :return: A functools cache info named tuple
+    """
+    return filter_plan.cache_info()
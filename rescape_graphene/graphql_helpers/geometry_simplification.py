@@ -0,0 +1,60 @@
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsGeoJSON, GeomOutputGeoFunc
+from graphql import GraphQLFloat
+from graphql.utils.value_from_ast import value_from_ast
+from rescape_python_helpers import ramda as R
+
+###
+# Geometry simplification on read. Geometry fields resolved by resolver_for_feature_collection take a simplify
+# argument, a tolerance in the units of the geometry's SRID. optimize_queryset annotates the queryset with the
+# geometry simplified by ST_SimplifyPreserveTopology and dumped by ST_AsGeoJSON, and leaves the stored geometry
+# out of the loaded columns, so the full geometry never leaves the database. resolver_for_feature_collection
+# reads the annotation, or simplifies the stored geometry with GEOS when its parent wasn't loaded by an
+# optimized queryset or when selections of the field ask for different tolerances
+###
+
+
+class SimplifyPreserveTopology(GeomOutputGeoFunc):
+    """
+        PostGIS's ST_SimplifyPreserveTopology, which simplifies without collapsing or splitting polygons
+    """
+    function = 'ST_SimplifyPreserveTopology'
+    arity = 2
+
+    def __init__(self, expression, tolerance, **extra):
+        super().__init__(expression, self._handle_param(tolerance, 'tolerance', (int, float)), **extra)
+
+
+def simplify_tolerance(info, field_asts):
+    """
+        The simplify argument that all selections of a geometry field share
+    :param info: The graphene resolution info, whose variables the arguments can reference
+    :param field_asts: The field asts that select the geometry field
+    :return: The tolerance or None if a selection doesn't simplify or the selections disagree
+    """
+    tolerances = {
+        value_from_ast(R.prop_or(None, 'simplify', {
+            argument.name.value: argument.value for argument in field_ast.arguments
+        }), GraphQLFloat, info.variable_values)
+        for field_ast in field_asts
+    }
+    return R.head(list(tolerances)) if len(tolerances) == 1 else None
+
+
+def simplified_geometry(model, info, column, field_asts):
+    """
+        The annotation of the simplified geometry of the column as GeoJSON text. optimize_queryset annotates the
+        queryset with it as simplified_geometry_alias(column)
+    :param model: The Django model of the queryset
+    :param info: The graphene resolution info
+    :param column: The name of the geometry field, e.g. 'geo_collection'
+    :param field_asts: The field asts that select the column
+    :return: The AsGeoJSON expression or None if the field isn't simplified
+    """
+    if not isinstance(model._meta.get_field(column), GeometryField):
+        return None
+    tolerance = simplify_tolerance(info, field_asts)
+    if tolerance is None:
+        return None
+    # Without a precision ST_AsGeoJSON keeps PostGIS's default number of decimals
+    return AsGeoJSON(SimplifyPreserveTopology(column, tolerance), precision=None)
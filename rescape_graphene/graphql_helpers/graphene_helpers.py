@@ -1,5 +1,6 @@
 from inflection import camelize
 from graphene import ObjectType, Scalar
+from graphql.language import ast
 import inspect
 from rescape_python_helpers import ramda as R, map_keys_deep
 import numbers
@@ -185,3 +186,54 @@ def quote_list(lst, tab):
 
 def quote_str(str):
     return '"{0}"'.format(str)
+
+
+def selection_field_asts(info, field_ast):
+    """
+        The field asts selected by field_ast, with fragment spreads and inline fragments expanded
+    :param {ResolveInfo} info: The graphene resolution info, which holds the fragments of the query
+    :param field_ast: A field ast, e.g. info.field_asts[0]
+    :return: {[Field]} The selected field asts. Empty if field_ast has no selections
+    """
+
+    def expand(selection_set):
+        if not selection_set:
+            return []
+        field_asts = []
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                field_asts.append(selection)
+            elif isinstance(selection, ast.FragmentSpread):
+                field_asts.extend(expand(info.fragments[selection.name.value].selection_set))
+            else:
+                field_asts.extend(expand(selection.selection_set))
+        return field_asts
+
+    return expand(field_ast.selection_set)
+
+
+def selection_names(info):
+    """
+        The distinct names of the fields selected by info.field_asts, with fragments expanded and aliases of the
+        same field merged. Resolvers of json fields call this once per parent row with the same field asts,
+        so the names are computed once per execution and stored on the context, normally the request
+    :param {ResolveInfo} info: The graphene resolution info
+    :return: {tuple} The field names
+    """
+    key = tuple(id(field_ast) for field_ast in info.field_asts)
+    cache = getattr(info.context, 'rescape_selection_names', None)
+    if cache is None:
+        cache = {}
+        try:
+            setattr(info.context, 'rescape_selection_names', cache)
+        except AttributeError:
+            # A context that can't hold it, such as None, just doesn't cache
+            pass
+    if key not in cache:
+        # Keep the field asts with their names so their ids can't be reused by other asts while cached
+        cache[key] = (info.field_asts, tuple(dict.fromkeys(
+            selection.name.value
+            for field_ast in info.field_asts
+            for selection in selection_field_asts(info, field_ast)
+        )))
+    return cache[key][1]
@@ -1,8 +1,10 @@
-import ast
-from safedelete.models import SafeDeleteModel
+import json
 from collections import namedtuple
+from functools import lru_cache
+from itertools import islice
+
+from graphene import Int, List, Float
 
-from more_itertools import first
 from rescape_python_helpers import ramda as R
 from inflection import underscore
 
@@ -10,16 +12,43 @@ from inflection import underscore
 # Helpers for json fields. json fields are not a Django model,
 # rather a json blob that is the field data of the Region and Resource models
 ###
+from rescape_graphene.graphql_helpers.graphene_helpers import selection_names
+from rescape_graphene.graphql_helpers.model_loaders import model_loader
 from rescape_graphene.graphql_helpers.schema_helpers import allowed_filter_arguments
 
 
 def resolve_selections(context):
     """
-        Returns the query fields for the current context.
+        Returns the query fields for the current context, including those of fragments.
+        They are computed once per field of the execution, see selection_names
     :param {ResolveInfo} context: The graphene resolution context
-    :return: {[String]} The field names to that are in the query
+    :return: {(String)} The field names to that are in the query
+    """
+    return selection_names(context)
+
+
+# The number of distinct key tuples whose DataTuple classes are kept
+DATA_TUPLE_CLASS_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=DATA_TUPLE_CLASS_CACHE_SIZE)
+def data_tuple_class(keys):
+    """
+        The DataTuple class of the given keys. Creating a namedtuple class compiles it, which is far slower than
+        instantiating one, so each key tuple gets one class
+    :param {tuple} keys: The field names
+    :return: The namedtuple class
     """
-    return R.map(lambda sel: sel.name.value, context.field_asts[0].selection_set.selections)
+    return namedtuple('DataTuple', keys)
+
+
+def data_tuple(dct):
+    """
+        Creates a DataTuple of the dict
+    :param {dict} dct: The values to resolve
+    :return: {DataTuple}
+    """
+    return data_tuple_class(tuple(dct.keys()))(*dct.values())
 
 
 def pick_selections(selections, data):
@@ -29,8 +58,17 @@ def pick_selections(selections, data):
     :param {dict} data: Data to pick from
     :return: {DataTuple} data with limited to selections
     """
-    dct = R.pick(selections, data)
-    return namedtuple('DataTuple', R.keys(dct))(*R.values(dct))
+    return data_tuple(R.pick(selections, data))
+
+
+def json_lists_alias(column):
+    """
+        The name of the annotation that holds a json column whose selected lists were filtered in the database,
+        see json_list_pushdown
+    :param {string} column: The json column, e.g. 'geojson'
+    :return: {string} The annotation name
+    """
+    return f'{column}_json_lists'
 
 
 def resolver_for_dict_field(resource, context, **kwargs):
@@ -44,17 +82,22 @@ def resolver_for_dict_field(resource, context, **kwargs):
     """
     selections = resolve_selections(context)
     field_name = context.field_name
-    data = getattr(resource, field_name) if (hasattr(resource, field_name) and R.prop(field_name, resource)) else {}
+    alias = json_lists_alias(underscore(field_name))
+    if alias in getattr(resource, '__dict__', {}):
+        # optimize_queryset loaded the column with its filtered json lists already filtered by the database
+        data = getattr(resource, alias) or {}
+    else:
+        data = getattr(resource, field_name) if (hasattr(resource, field_name) and R.prop(field_name, resource)) else {}
     # We only let this value through if it matches the kwargs
     # TODO data doesn't include full values for embedded model values, rather just {id: ...}. So if kwargs have
     # searches on other values of the model this will fail. The solution is to load the model values, but I
     # need some way to figure out where they are in data
     passes = R.dict_matches_params_deep(kwargs, data)
     # Pick the selections from our resource json field value default to {} if resource[field_name] is null
-    return pick_selections(selections, data) if passes else namedtuple('DataTuple', [])()
+    return pick_selections(selections, data) if passes else data_tuple({})
 
 
-def resolver_for_dict_list(resource, context, **kwargs):
+def resolver_for_dict_list(resource, context, first=None, offset=None, **kwargs):
     """
         Resolver for the data field that is a list. This extracts the desired json fields from the context
         and creates a tuple of the field values. Graphene has no built in way for drilling into json types.
@@ -62,31 +105,46 @@ def resolver_for_dict_list(resource, context, **kwargs):
         in turn by graphene
     :param resource:
     :param context:
+    :param first: Optional number of matching items to return. type_modify_fields adds this argument unless
+    the items have a first field, in which case it's a filter
+    :param offset: Optional number of matching items to skip, likewise
     :params kwargs: Arguments to filter with
     :return:
     """
     selections = resolve_selections(context)
     field_name = context.field_name
+    # Arguments named like a field of the items filter by that field instead of slicing
+    slicing = list_slice_argument_names(context.return_type)
+    kwargs = R.merge(kwargs, R.filter_dict(
+        lambda name_value: name_value[0] not in slicing and name_value[1] is not None,
+        dict(first=first, offset=offset)
+    ))
+    first = first if 'first' in slicing else None
+    offset = offset if 'offset' in slicing else None
     # Value defaults to None. Empty is not the same as None
     value = R.prop_or(None, field_name, resource)
+    if not value:
+        return value
 
-    return R.map(
-        lambda data: pick_selections(selections, data),
-        R.filter(
-            # We only let this value through if it matches the kwargs
-            # TODO data doesn't include full values for embedded model values, rather just {id: ...}. So if kwargs have
-            # searches on other values of the model this will fail. The solution is to load the model values, but I
-            # need some way to figure out where they are in data
-            lambda data: R.dict_matches_params_deep(kwargs, data),
-            value
-        )
-    ) if value else value
+    # We only let this value through if it matches the kwargs. If the database already filtered the list, see
+    # json_list_pushdown, this only checks the items that it returned
+    # TODO data doesn't include full values for embedded model values, rather just {id: ...}. So if kwargs have
+    # searches on other values of the model this will fail. The solution is to load the model values, but I
+    # need some way to figure out where they are in data
+    matches = (data for data in value if R.dict_matches_params_deep(kwargs, data)) if kwargs else value
+    start = max(offset or 0, 0)
+    # Slice before picking so only the requested window is resolved. Matching stops at the window's end
+    return [
+        pick_selections(selections, data) for data in
+        islice(matches, start, start + max(first, 0) if first is not None else None)
+    ]
 
 
 def model_resolver_for_dict_field(model_class):
     """
         Resolves a Django model referenced in a data field. This extracts the desired json fields from the context
-        and creates a tuple of the field values. Graphene has no built in way for drilling into json types
+        and creates a tuple of the field values. Graphene has no built in way for drilling into json types.
+        The instances referenced by all parents of the request are loaded together, see model_loaders
         TODO this naively assumes that the 'id' property is among the query selections and uses that
         to resolve the instance
     :param model_class:
@@ -96,8 +154,6 @@ def model_resolver_for_dict_field(model_class):
     :return:
     """
 
-    from rescape_graphene.graphql_helpers.schema_helpers import flatten_query_kwargs
-
     def _model_resolver_for_dict_field(resource, context, **kwargs):
         field_name = underscore(context.field_name)
         id = R.prop_or(None, 'id', getattr(resource, field_name))
@@ -105,40 +161,61 @@ def model_resolver_for_dict_field(model_class):
         if not id:
             return None
 
-        # Now filter based on any query arguments beyond id. If it doesn't match we also return None
-        found =  first(model_class.objects.filter(
-            **dict(
-                # These are Q expressions
-                *flatten_query_kwargs(model_class, kwargs),
-                id=id
-            )
-        ), None)
-        # If we didn't find the instances search for delete instances if safedelete is implemented
-        return found or (issubclass(model_class, SafeDeleteModel) and first(model_class.objects.all(force_visibility=True).filter(
-            **dict(
-                # These are Q expressions
-                *flatten_query_kwargs(model_class, kwargs),
-                id=id
-            )
-        )))
-
+        # Now filter based on any query arguments beyond id. If it doesn't match we also return None.
+        # If we don't find the instance we search for deleted instances if safedelete is implemented
+        return model_loader(context.context, model_class, kwargs).load(model_class._meta.pk.to_python(id))
 
     return _model_resolver_for_dict_field
 
 
-def resolver_for_feature_collection(resource, context, **kwargs):
+def simplified_geometry_alias(column):
+    """
+        The name of the annotation that holds the simplified GeoJSON of a geometry column, see
+        geometry_simplification
+    :param {string} column: The geometry column, e.g. 'geo_collection'
+    :return: {string} The annotation name
+    """
+    return f'{column}_simplified'
+
+
+def feature_collection_arguments():
+    """
+        The arguments of geometry fields resolved by resolver_for_feature_collection
+    :return: {dict} The graphene arguments keyed by name
+    """
+    return dict(
+        simplify=Float(description='Simplify the geometry, preserving its topology, to this tolerance in the '
+                                   'units of its SRID')
+    )
+
+
+def _geometry_json(resource, context, simplify):
+    # The GeoJSON dict of the geometry, simplified to the tolerance if given
+    alias = simplified_geometry_alias(underscore(context.field_name))
+    if simplify is not None and alias in getattr(resource, '__dict__', {}):
+        # optimize_queryset loaded the geometry simplified by the database
+        geojson = getattr(resource, alias)
+        return json.loads(geojson) if geojson else {}
+    geometry = R.prop(context.field_name, resource)
+    if not geometry:
+        return {}
+    return json.loads((geometry.simplify(simplify, preserve_topology=True) if simplify is not None else geometry).json)
+
+
+def resolver_for_feature_collection(resource, context, simplify=None, **kwargs):
     """
         Like resolver but takes care of converting the geos value stored in the field to a dict that
         has the values we want to resolve, namely type and features.
     :param {string} resource: The instance whose json field data is being resolved
     :param {ResolveInfo} context: Graphene context which contains the fields queried in field_asts
+    :param {float} simplify: Optional tolerance to simplify the geometry to. See feature_collection_arguments
     :return: {DataTuple} Standard resolver return value
     """
 
     # Take the camelized keys. We don't store data fields slugified. We leave them camelized
-    selections = R.map(lambda sel: sel.name.value, context.field_asts[0].selection_set.selections)
+    selections = resolve_selections(context)
     # Recover the json by parsing the string provided by GeometryCollection and mapping the geometries property to features
-    json = R.compose(
+    feature_collection = R.compose(
         # Map the value GeometryCollection to FeatureCollection for the type property
         R.map_with_obj(lambda k, v: R.if_else(
             R.equals('type'),
@@ -155,17 +232,62 @@ def resolver_for_feature_collection(resource, context, **kwargs):
                 R.prop_or([], 'geometries', dct))
             )
         ),
-    )(ast.literal_eval(R.prop(context.field_name, resource).json))
+    )(_geometry_json(resource, context, simplify))
     # Identify the keys that are actually in resource[json_field_name]
     all_selections = R.filter(
-        lambda key: key in json,
+        lambda key: key in feature_collection,
         selections
     )
     # Pick out the values that we want
-    result = R.pick(all_selections, json)
+    result = R.pick(all_selections, feature_collection)
 
     # Return in the standard Graphene DataTuple
-    return namedtuple('DataTuple', R.keys(result))(*R.values(result))
+    return data_tuple(result)
+
+
+# The arguments that type_modify_fields adds to json lists resolved by resolver_for_dict_list
+LIST_SLICE_ARGUMENTS = dict(
+    first=dict(type=Int, description='The number of matching items to return'),
+    offset=dict(type=Int, description='The number of matching items to skip')
+)
+
+
+def list_slice_argument_names(list_type):
+    """
+        The names of LIST_SLICE_ARGUMENTS that slice a json list rather than filter its items. Items with a field
+        of the same name are filtered by it, see _with_slice_arguments
+    :param list_type: The graphql type of the list field, e.g. info.return_type
+    :return: A list of names
+    """
+    item_type = list_type
+    # Unwrap List and NonNull
+    while not hasattr(item_type, 'fields') and hasattr(item_type, 'of_type'):
+        item_type = item_type.of_type
+    item_fields = getattr(item_type, 'fields', None) or {}
+    return [name for name in R.keys(LIST_SLICE_ARGUMENTS) if name not in item_fields]
+
+
+def _with_slice_arguments(field):
+    """
+        Adds first and offset arguments to a List resolved by resolver_for_dict_list, so clients can page
+        through long json lists
+    :param field: The result of a type_modifier
+    :return: The field, with the arguments if it's such a List
+    """
+    if not (isinstance(field, List) and R.prop_or(None, 'resolver', field.kwargs) is resolver_for_dict_list):
+        return field
+    arguments = R.head(field.args) if field.args else {}
+    return List(
+        field.of_type,
+        R.merge(
+            # Filter arguments of the same name win, and resolver_for_dict_list then filters with them
+            R.map_with_obj(lambda name, config: config['type'](description=config['description']),
+                           R.omit(list(R.keys(arguments)), LIST_SLICE_ARGUMENTS)),
+            arguments
+        ),
+        *field.args[1:],
+        **field.kwargs
+    )
 
 
 def apply_type(v):
@@ -177,7 +299,7 @@ def apply_type(v):
     # construct
     args = [R.prop('type', v)] + ([allowed_arguments] if allowed_arguments else [])
     t = R.prop_or(lambda typ: typ(), 'type_modifier', v)
-    return t(*args)
+    return _with_slice_arguments(t(*args))
 
 
 def type_modify_fields(data_field_configs):
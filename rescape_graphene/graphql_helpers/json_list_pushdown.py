@@ -0,0 +1,143 @@
+import json
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import JSONField
+from django.db.models.expressions import RawSQL
+from graphene import Field, List
+from graphql.execution.values import get_argument_values
+from inflection import underscore
+from rescape_python_helpers import ramda as R
+
+from .graphene_helpers import selection_field_asts, call_if_lambda
+from .json_field_helpers import resolver_for_dict_field, resolver_for_dict_list, list_slice_argument_names
+
+###
+# Filters the items of json lists in the database. resolver_for_dict_list matches every item of a json list
+# against the list field's arguments in Python, so a column with thousands of features is loaded and scanned
+# whole for every row, even when a few items match. When enabled, optimize_queryset annotates the queryset with
+# each selected json column whose filtered lists are replaced, in SQL, by their items that contain the arguments.
+# resolver_for_dict_field reads the annotation instead of the column, and resolver_for_dict_list still applies
+# its Python filter to the items that the database returned, so it remains the fallback whenever the parent
+# wasn't loaded by an optimized queryset, such as related instances joined with select_related.
+# Only lists whose argument values are scalars and dicts are pushed down, since those translate to jsonb
+# containment (@>). Lists whose selections disagree on the arguments, e.g. aliases with different filters,
+# and columns whose own field has arguments are left to Python.
+# Enable with settings.RESCAPE_GRAPHENE_JSON_LIST_PUSHDOWN = True
+###
+
+
+def _pushable(value):
+    # Containment only agrees with dict_matches_params_deep for dicts and scalars
+    if isinstance(value, dict):
+        return all(_pushable(item) for item in value.values())
+    return not isinstance(value, (list, tuple))
+
+
+def _json_field_kind(field_config):
+    # The resolver of the field's type_modifier, which tells a json list from a json dict
+    type_modifier = R.prop_or(None, 'type_modifier', field_config)
+    if not type_modifier:
+        return None
+    field = type_modifier(R.prop('type', field_config))
+    if isinstance(field, List):
+        return R.prop_or(None, 'resolver', field.kwargs)
+    if isinstance(field, Field):
+        return field.resolver
+    return None
+
+
+def _list_filters(info, graphene_type, field_configs, field_asts, path=[]):
+    """
+        Finds the selected json lists that have filter arguments
+    :param info: The graphene resolution info
+    :param graphene_type: The graphene type of the json dict, e.g. FeatureCollectionDataType
+    :param field_configs: The field configs of graphene_type, e.g. feature_collection_data_type_fields
+    :param field_asts: The selected field asts of graphene_type
+    :param path: The json keys to the dict
+    :return: A list of tuples of the json keys of each list and its filter kwargs
+    """
+    schema_type = info.schema.get_type(graphene_type._meta.name)
+    selected = {}
+    for field_ast in field_asts:
+        selected.setdefault(field_ast.name.value, []).append(field_ast)
+    list_filters = []
+    for name, named_field_asts in selected.items():
+        field_config = R.prop_or(None, underscore(name), field_configs or {})
+        field_definition = schema_type.fields.get(name) if schema_type else None
+        if not (field_config and R.has('fields', field_config) and field_definition):
+            continue
+        kind = _json_field_kind(field_config)
+        if kind is resolver_for_dict_field:
+            list_filters.extend(_list_filters(
+                info,
+                R.prop('graphene_type', field_config),
+                call_if_lambda(R.prop('fields', field_config)),
+                [sub_field_ast for field_ast in named_field_asts for sub_field_ast in
+                 selection_field_asts(info, field_ast)],
+                path + [name]
+            ))
+        elif kind is resolver_for_dict_list:
+            kwargs_of_selections = {
+                json.dumps(kwargs, sort_keys=True, default=str): kwargs for kwargs in (
+                    R.omit(list_slice_argument_names(field_definition.type), get_argument_values(
+                        field_definition.args, field_ast.arguments, info.variable_values
+                    )) for field_ast in named_field_asts
+                )
+            }
+            if len(kwargs_of_selections) != 1:
+                continue
+            kwargs = R.head(list(kwargs_of_selections.values()))
+            if kwargs and _pushable(kwargs):
+                list_filters.append((path + [name], kwargs))
+    return list_filters
+
+
+def _filtered_lists_sql(column_sql, list_filters):
+    # Replaces each list by its containing items, keeping their order. Values that aren't lists are kept
+    sql, params = column_sql, []
+    for path, kwargs in list_filters:
+        sql = (
+            "(SELECT CASE WHEN jsonb_typeof(value #> %s::text[]) = 'array' THEN jsonb_set(value, %s::text[], ("
+            "SELECT coalesce(jsonb_agg(item ORDER BY position), '[]'::jsonb) "
+            "FROM jsonb_array_elements(value #> %s::text[]) WITH ORDINALITY AS items(item, position) "
+            "WHERE item @> %s::jsonb"
+            ")) ELSE value END FROM (SELECT " + sql + " AS value) AS json_list)"
+        )
+        params = [path, path, path, json.dumps(kwargs, default=str)] + params
+    return sql, params
+
+
+def json_list_pushdown(model, info, column, field_asts, field_configs):
+    """
+        The annotation that loads the json column with its selected, filtered lists filtered by the database.
+        optimize_queryset annotates the queryset with it as json_lists_alias(column)
+    :param model: The Django model of the queryset
+    :param info: The graphene resolution info
+    :param column: The name of the json column, e.g. 'geojson'
+    :param field_asts: The field asts that select the column
+    :param field_configs: The field configs of the model's type, e.g. foo_fields
+    :return: A RawSQL expression or None if pushdown is disabled or doesn't apply
+    """
+    if not getattr(settings, 'RESCAPE_GRAPHENE_JSON_LIST_PUSHDOWN', False):
+        return None
+    field = model._meta.get_field(column)
+    field_config = R.prop_or({}, column, field_configs or {})
+    if not (isinstance(field, JSONField) and R.has('graphene_type', field_config) and R.has('fields', field_config)):
+        return None
+    if R.any_satisfy(lambda field_ast: field_ast.arguments, field_asts):
+        # The column's own filter must see the unfiltered lists
+        return None
+    list_filters = _list_filters(
+        info,
+        R.prop('graphene_type', field_config),
+        call_if_lambda(R.prop('fields', field_config)),
+        [sub_field_ast for field_ast in field_asts for sub_field_ast in selection_field_asts(info, field_ast)]
+    )
+    if not list_filters:
+        return None
+    sql, params = _filtered_lists_sql(
+        f'{connection.ops.quote_name(model._meta.db_table)}.{connection.ops.quote_name(field.column)}',
+        list_filters
+    )
+    return RawSQL(sql, params, output_field=JSONField())
@@ -0,0 +1,91 @@
+import json
+
+from promise import Promise
+from promise.dataloader import DataLoader
+from rescape_python_helpers import ramda as R
+from safedelete.models import SafeDeleteModel
+
+###
+# Request scoped loading of model instances that json blobs reference by id, such as Foo.data.friend.
+# Resolving one reference per parent row costs a query per row, so model_resolver_for_dict_field asks a
+# ModelLoader instead. The loader collects the ids that all parents of an execution reference and loads them
+# with one id__in query, plus one query for soft deleted instances of SafeDeleteModels that weren't found.
+# The loaders of a request share an identity map, so an instance is loaded once per request and every
+# reference to it resolves to the same object.
+# The loaders live on the graphene context, normally the request
+###
+
+
+class ModelLoader(DataLoader):
+    """
+        Loads instances of a model by id, filtered by the Q expressions of the field's arguments
+    """
+
+    def __init__(self, model_class, q_expressions, identity_map):
+        """
+        :param model_class: The Django model
+        :param q_expressions: Q expressions that the instances must also match
+        :param identity_map: A dict of instances keyed by (model_class, pk), shared by the request's loaders
+        """
+        super().__init__()
+        self.model_class = model_class
+        self.q_expressions = q_expressions
+        self.identity_map = identity_map
+
+    def _query(self, queryset, ids):
+        return queryset.filter(*self.q_expressions, id__in=ids)
+
+    def batch_load_fn(self, ids):
+        found = {}
+        if not self.q_expressions:
+            # Without filters an instance that any loader of the request loaded is a match
+            found = {
+                id: self.identity_map[(self.model_class, id)]
+                for id in ids if (self.model_class, id) in self.identity_map
+            }
+        missing = [id for id in ids if id not in found]
+        if missing:
+            found.update({instance.pk: instance for instance in self._query(self.model_class.objects, missing)})
+            missing = [id for id in ids if id not in found]
+        if missing and issubclass(self.model_class, SafeDeleteModel):
+            # Deleted instances are still resolved
+            found.update({
+                instance.pk: instance for instance in
+                self._query(self.model_class.objects.all(force_visibility=True), missing)
+            })
+        instances = []
+        for id in ids:
+            instance = R.prop_or(None, id, found)
+            if instance is not None:
+                # Prefer the request's existing instance
+                instance = self.identity_map.setdefault((self.model_class, id), instance)
+            instances.append(instance)
+        return Promise.resolve(instances)
+
+
+def model_loader(context, model_class, kwargs):
+    """
+        The request's ModelLoader of model_class and the filter kwargs
+    :param context: The graphene context, normally the request. If it can't hold the loaders the loader only
+    serves one reference
+    :param model_class: The Django model
+    :param kwargs: Filter kwargs of the referencing field
+    :return: The ModelLoader
+    """
+    from rescape_graphene.graphql_helpers.schema_helpers import flatten_query_kwargs
+
+    loaders = getattr(context, 'rescape_model_loaders', None)
+    if loaders is None:
+        loaders = dict(loaders={}, identity_map={})
+        try:
+            setattr(context, 'rescape_model_loaders', loaders)
+        except AttributeError:
+            pass
+    key = (model_class, json.dumps(kwargs, sort_keys=True, default=str))
+    if key not in loaders['loaders']:
+        loaders['loaders'][key] = ModelLoader(
+            model_class,
+            flatten_query_kwargs(model_class, kwargs),
+            loaders['identity_map']
+        )
+    return loaders['loaders'][key]
@@ -0,0 +1,160 @@
+from django.db.models import Prefetch
+from inflection import underscore
+from rescape_python_helpers import ramda as R
+
+from rescape_graphene.django_helpers.model_metadata import model_metadata, REVERSE
+from .graphene_helpers import selection_field_asts, call_if_lambda
+from .geometry_simplification import simplified_geometry
+from .json_field_helpers import json_lists_alias, simplified_geometry_alias
+from .json_list_pushdown import json_list_pushdown
+
+###
+# Selection-set-driven queryset optimization. List resolvers return querysets of the queried model and graphene
+# then resolves each related field per instance, one query per row. optimize_queryset walks the selections of the
+# query along with the field configs and the model metadata and joins to-one relations with select_related
+# and batches to-many relations with prefetch_related, so the number of queries doesn't grow with the rows.
+# It also limits the loaded columns with only() to those of the selected fields, so unselected json and geometry
+# columns aren't read. A selected field that isn't a model field must declare the columns its resolver needs with
+# a columns property in its field config, e.g. version_number=dict(columns=[]). Otherwise all columns are loaded.
+# With settings.RESCAPE_GRAPHENE_JSON_LIST_PUSHDOWN json columns of the queryset's model whose selected lists have
+# filter arguments are loaded as annotations with the lists filtered by the database, see json_list_pushdown.
+# Likewise geometry columns selected with a simplify argument are loaded simplified, see geometry_simplification
+###
+
+
+def _selected_fields(info, field_asts):
+    # Field names of the selections in snake case, skipping __typename. Aliased duplicates are merged
+    selected = {}
+    for field_ast in field_asts:
+        if field_ast.name.value.startswith('__'):
+            continue
+        selected.setdefault(underscore(field_ast.name.value), []).extend(selection_field_asts(info, field_ast))
+    return selected
+
+
+def _field_configs_of(field_configs, name):
+    # The field configs of the related type of the named field, if configured
+    return call_if_lambda(R.item_path_or({}, [name, 'fields'], field_configs or {})) or {}
+
+
+def _columns_of(field_configs, name):
+    # The columns property of the named field config or None
+    return R.item_path_or(None, [name, 'columns'], field_configs or {})
+
+
+def _optimizations(model, info, field_asts, field_configs, prefix=''):
+    """
+        Collects the select_related lookups, Prefetch objects and columns for the selections
+    :param model: The Django model being resolved
+    :param info: The graphene resolution info
+    :param field_asts: The selected field asts of the model's type
+    :param field_configs: The field configs of the model's type, e.g. foo_fields
+    :param prefix: The lookup path to the model from the queryset's model, e.g. 'user__'
+    :return: A tuple of the select_related lookups, the Prefetch objects, the only() lookups and the annotations.
+    The only() lookups are None if some selected field's columns are unknown, in which case all of the model's
+    columns are loaded. Annotations are only made for the queryset's model, whose prefix is empty
+    """
+    metadata = model_metadata(model)
+    select_related = []
+    prefetches = []
+    # Always load the primary key
+    columns = [f'{prefix}{model._meta.pk.name}']
+    annotations = {}
+    projectable = True
+    for name, sub_field_asts in _selected_fields(info, field_asts).items():
+        field_metadata = R.prop_or(None, name, metadata.accessors)
+        configured_columns = _columns_of(field_configs, name)
+        if configured_columns is not None:
+            columns.extend([f'{prefix}{column}' for column in configured_columns])
+        if not field_metadata:
+            # Not a model field, such as a property. We can only project if the field config names the columns
+            projectable = projectable and configured_columns is not None
+            continue
+        if not field_metadata.is_relation:
+            # Scalar, json and geometry columns, including those resolved by custom resolvers like
+            # resolver_for_dict_field and resolver_for_feature_collection, which read the column of the same name
+            column_field_asts = [field_ast for field_ast in field_asts if underscore(field_ast.name.value) == name]
+            pushdown = json_list_pushdown(model, info, name, column_field_asts, field_configs) if not prefix else None
+            simplified = simplified_geometry(model, info, name, column_field_asts) if not prefix else None
+            if pushdown:
+                # resolver_for_dict_field reads the annotation instead of the column
+                annotations[json_lists_alias(name)] = pushdown
+            elif simplified:
+                # resolver_for_feature_collection reads the annotation instead of the column
+                annotations[simplified_geometry_alias(name)] = simplified
+            else:
+                columns.append(f'{prefix}{name}')
+            continue
+        sub_field_configs = _field_configs_of(field_configs, name)
+        if field_metadata.is_to_many:
+            related_queryset = field_metadata.related_model._default_manager.all()
+            # Prefetching a reverse foreign key matches the related rows to instances by the foreign key column
+            remote_columns = [field_metadata.field.field.attname] if field_metadata.field.one_to_many else []
+            # Prefetch with a queryset that is optimized for the selections of the related type
+            prefetches.append(Prefetch(
+                f'{prefix}{name}',
+                queryset=_optimize(related_queryset, info, sub_field_asts, sub_field_configs, remote_columns)
+            ))
+            continue
+        if field_metadata.kind != REVERSE:
+            # Forward foreign keys need their column. Reverse one-to-ones are joined from the other table
+            columns.append(f'{prefix}{name}')
+        select_related.append(f'{prefix}{name}')
+        related_select_related, related_prefetches, related_columns, _ = _optimizations(
+            field_metadata.related_model,
+            info,
+            sub_field_asts,
+            sub_field_configs,
+            f'{prefix}{name}__'
+        )
+        select_related.extend(related_select_related)
+        prefetches.extend(related_prefetches)
+        # If the related columns are unknown, not naming any loads them all
+        columns.extend(related_columns or [])
+    return select_related, prefetches, columns if projectable else None, annotations
+
+
+def _optimize(queryset, info, field_asts, field_configs, required_columns=[]):
+    select_related, prefetches, columns, annotations = _optimizations(
+        queryset.model, info, field_asts, field_configs
+    )
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    if columns is not None and field_asts:
+        # Without duplicates, in order
+        queryset = queryset.only(*dict.fromkeys(columns + required_columns))
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset
+
+
+def optimize_queryset(queryset, info, field_configs=None, path=[]):
+    """
+        Applies select_related for the selected to-one relations and prefetch_related, with nested Prefetch
+        querysets, for the selected to-many relations, and limits each model's columns with only() to those
+        of the selected fields. Call it on the queryset that a list resolver returns:
+            return optimize_queryset(Foo.objects.filter(*q_expressions), info, foo_fields)
+    :param queryset: The queryset of the resolved type's model
+    :param info: The graphene resolution info of the resolver
+    :param field_configs: Optional field configs of the resolved type, e.g. foo_fields. The fields of related
+    field configs are followed to the related types
+    :param path: Field names from the resolved field to the field of the model's type, if it's not the resolved
+    field itself. E.g. ['objects'] for a paginated type
+    :return: The optimized queryset
+    """
+    field_asts = info.field_asts
+    for name in path:
+        field_asts = [
+            sub_field_ast
+            for field_ast in field_asts
+            for sub_field_ast in selection_field_asts(info, field_ast)
+            if underscore(sub_field_ast.name.value) == name
+        ]
+    return _optimize(
+        queryset,
+        info,
+        [sub_field_ast for field_ast in field_asts for sub_field_ast in selection_field_asts(info, field_ast)],
+        field_configs
+    )
@@ -7,12 +7,10 @@ from decimal import Decimal
 import graphene
 import reversion
 from deepmerge import Merger
-from django.contrib.gis.db.models import OneToOneField, ManyToManyField, ForeignKey, \
-    GeometryCollectionField
-from django.db.models import JSONField, AutoField, CharField, BooleanField, BigAutoField, DecimalField, \
-    DateTimeField, DateField, BinaryField, TimeField, FloatField, EmailField, UUIDField, TextField, IntegerField, \
-    BigIntegerField, NullBooleanField, Q
-from graphene import Scalar, InputObjectType, ObjectType
+from django.db.models import Q, Exists, OuterRef
+from graphene import Scalar, InputObjectType, ObjectType, InputField
+from graphene.types.structures import Structure
+from graphene.types.unmountedtype import UnmountedType
 from graphql import parse
 from graphql.language import ast
 from graphql.language.printer import print_ast
@@ -21,7 +19,13 @@ from rescape_python_helpers import ramda as R, memoize
 from rescape_python_helpers.functional.ramda import to_dict_deep, flatten_dct_until, \
     to_array_if_not
 
+from rescape_graphene.django_helpers.model_metadata import model_metadata, graphene_type_of_django_field_class, \
+    JSON, FORWARD, MANY_TO_MANY
+from rescape_graphene.django_helpers.filter_usage import record_filter_kwargs
+from .compiled_schema import compiled_schema_artifact
+from .filter_plans import apply_filter_plan
 from .graphene_helpers import dump_graphql_keys, dump_graphql_data_object, camelize_graphql_data_object, call_if_lambda
+from .spatial_filters import spatial_filter_arguments, spatial_q_expressions, SPATIAL_FILTERS
 
 logger = logging.getLogger('rescape_graphene')
 from django.conf import settings
@@ -52,6 +56,53 @@ READ = 'read'
 UPDATE = 'update'
 DELETE = 'delete'
 
+# Strategies of process_filter_kwargs_with_to_manys for filtering to-many relations
+SEQUENTIAL = 'sequential'
+EXISTS = 'exists'
+
+# The Django lookups that filter arguments can use, keyed by suffix. See FILTER_FIELDS
+FILTER_LOOKUPS = {
+    'year': dict(allowed_types=[graphene.Date, graphene.DateTime]),
+    'month': dict(allowed_types=[graphene.Date, graphene.DateTime]),
+    'day': dict(allowed_types=[graphene.Date, graphene.DateTime]),
+    'week_day': dict(allowed_types=[graphene.Date, graphene.DateTime]),
+    'hour': dict(allowed_types=[graphene.DateTime]),
+    'minute': dict(allowed_types=[graphene.DateTime]),
+    'second': dict(allowed_types=[graphene.DateTime]),
+
+    # standard lookups
+    'exact': dict(),  # this is the default, but keep so we can do negative queries, i.e. exact__not
+    'iexact': dict(),
+    'contains': dict(),
+    'icontains': dict(),
+    'in': dict(type_modifier=lambda typ: graphene.List(typ)),
+    'gt': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
+    'gte': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
+    'lt': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
+    'lte': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
+    'startswith': dict(allowed_types=[graphene.String]),
+    'istartswith': dict(allowed_types=[graphene.String]),
+    'endswith': dict(allowed_types=[graphene.String]),
+    'iendswith': dict(allowed_types=[graphene.String]),
+    # Range expects a 2 item tuple, so give it a list
+    'range': dict(type_modifier=lambda typ: graphene.List(typ)),
+    'isnull': dict(),
+    'regex': dict(allowed_types=[graphene.String]),
+    'iregex': dict(allowed_types=[graphene.String]),
+    'search': dict(allowed_types=[graphene.String]),
+
+    # postgres lookups
+    'contained_by': dict(),
+    # Date overlap
+    'overlap': dict(allowed_types=[graphene.Date, graphene.DateTime]),
+    # These are probably for json types so maybe useful
+    'has_key': dict(allowed_types=[graphene.JSONString, graphene.InputObjectType]),
+    'has_keys': dict(allowed_types=[graphene.JSONString, graphene.InputObjectType]),
+    'has_any_keys': dict(allowed_types=[graphene.JSONString, graphene.InputObjectType]),
+    # groups of 3 characters for similarity recognition
+    'trigram_similar': dict(allowed_types=[graphene.String])
+}
+
 # From django-filters. Whenever graphene supports filtering without Relay we can get rid of this here
 # Educated guesss about what types for each to support. Django/Postgres might support fewer or more of these
 # combinations than I'm aware of
@@ -73,50 +124,23 @@ FILTER_FIELDS = R.compose(
             'icontains': dict(),
             'in': dict(type_modifier=lambda typ: graphene.List(typ))
         },
-        lambda _: {
-            'year': dict(allowed_types=[graphene.Date, graphene.DateTime]),
-            'month': dict(allowed_types=[graphene.Date, graphene.DateTime]),
-            'day': dict(allowed_types=[graphene.Date, graphene.DateTime]),
-            'week_day': dict(allowed_types=[graphene.Date, graphene.DateTime]),
-            'hour': dict(allowed_types=[graphene.DateTime]),
-            'minute': dict(allowed_types=[graphene.DateTime]),
-            'second': dict(allowed_types=[graphene.DateTime]),
-
-            # standard lookups
-            'exact': dict(),  # this is the default, but keep so we can do negative queries, i.e. exact__not
-            'iexact': dict(),
-            'contains': dict(),
-            'icontains': dict(),
-            'in': dict(type_modifier=lambda typ: graphene.List(typ)),
-            'gt': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
-            'gte': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
-            'lt': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
-            'lte': dict(allowed_types=[graphene.Int, graphene.Float, graphene.DateTime, graphene.Date]),
-            'startswith': dict(allowed_types=[graphene.String]),
-            'istartswith': dict(allowed_types=[graphene.String]),
-            'endswith': dict(allowed_types=[graphene.String]),
-            'iendswith': dict(allowed_types=[graphene.String]),
-            # Range expects a 2 item tuple, so give it a list
-            'range': dict(type_modifier=lambda typ: graphene.List(typ)),
-            'isnull': dict(),
-            'regex': dict(allowed_types=[graphene.String]),
-            'iregex': dict(allowed_types=[graphene.String]),
-            'search': dict(allowed_types=[graphene.String]),
-
-            # postgres lookups
-            'contained_by': dict(),
-            # Date overlap
-            'overlap': dict(allowed_types=[graphene.Date, graphene.DateTime]),
-            # These are probably for json types so maybe useful
-            'has_key': dict(allowed_types=[graphene.JSONString, graphene.InputObjectType]),
-            'has_keys': dict(allowed_types=[graphene.JSONString, graphene.InputObjectType]),
-            'has_any_keys': dict(allowed_types=[graphene.JSONString, graphene.InputObjectType]),
-            # groups of 3 characters for similarity recognition
-            'trigram_similar': dict(allowed_types=[graphene.String])
-        }
+        lambda _: FILTER_LOOKUPS
     )
 )(settings)
 
+# Named filter profiles that a field config can give as filters='text' instead of listing the FILTER_FIELDS
+# suffixes it supports, e.g. filters=['exact', 'in', 'icontains']. The _not variant of each suffix is implied.
+# Without a filters property a field gets every FILTER_FIELDS suffix compliant with its type
+FILTER_PROFILES = dict(
+    id=['exact', 'in'],
+    text=['exact', 'iexact', 'contains', 'icontains', 'startswith', 'istartswith', 'in'],
+    number=['exact', 'gt', 'gte', 'lt', 'lte', 'in', 'range'],
+    date=['exact', 'gt', 'gte', 'lt', 'lte', 'range', 'year', 'month', 'day', 'isnull'],
+    json=['contains', 'contained_by', 'has_key', 'has_keys', 'has_any_keys', 'isnull'],
+    # The spatial filters of geometry fields, see spatial_filters. Leaves out the generic filters
+    geometry=list(R.keys(SPATIAL_FILTERS)),
+)
+
 
 # https://github.com/graphql-python/graphene-django/issues/124
 
@@ -180,9 +204,10 @@ def input_type_class(field_config, crud, parent_type_classes=[], allowed_fields_
     as well as the rules for the crud type spceified in field_dict_vale.
     :param field_config:
     :param crud: CREATE, UPDATE, or READ
-    :param parent_type_classes: String or String array of parent graphene type classes. Unfortunately, Graphene doesn't
-    let us reuse input types around the schema, even if they are identical, so we must give them unique names
-    based on the parent ancestry
+    :param parent_type_classes: String or String array of parent graphene type classes. Graphene requires unique
+    type names, so we give them unique names based on the parent ancestry. If
+    settings.RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES is True, identical layouts share one class with a canonical
+    name instead and the ancestry name is only used for layouts that differ
     :return: An InputObjectType subclass
     """
     # Get the Graphene type. This comes from graphene_type if the class containing the field is a Django Model,
@@ -195,49 +220,77 @@ def input_type_class(field_config, crud, parent_type_classes=[], allowed_fields_
     modified_parent_type_classes = parent_type_classes if R.isinstance((list, tuple), parent_type_classes) else [
         parent_type_classes]
 
-    # Gather the field_configs for the type we are creating
-    input_type_field_configs = merge_with_django_properties(
-        graphene_class,
-        R.compose(
-            # Remove the update and create constraints,
-            # which would normally disallow using id in create and require using it in update
-            # We're not creating this model instance, we're just referencing it
-            # TODO We could add some other field flag that specifies whether the container needs to reference it or not
-            # such as referenced_in_create = REQUIRE, if the container has to have a reference when the
-            # container is created
-            R.map_with_obj(lambda key, value: R.omit(['create', 'update'], value)),
-            # Only take the id, unless related_input=true for a field
-            lambda fields: R.merge(
-                R.pick(['id'], fields),
-                R.filter_dict(
-                    lambda name_field: R.compose(R.equals(ALLOW), R.prop_or(False, 'related_input'))(name_field[1]),
-                    fields
+    # In compiled schema mode reuse the layout stored by a previous process, which skips the model metadata and
+    # the filter layouts. Only layouts of scalars are stored, see CompiledSchemaArtifact.record_input_type_layout
+    artifact = compiled_schema_artifact()
+    layout_key = artifact.input_type_key(
+        graphene_class, crud, modified_parent_type_classes, allowed_fields_only, fields
+    ) if artifact else None
+    combined_fields = artifact.input_type_layout(layout_key) if layout_key else None
+
+    if combined_fields is None:
+        # Gather the field_configs for the type we are creating
+        input_type_field_configs = merge_with_django_properties(
+            graphene_class,
+            R.compose(
+                # Remove the update and create constraints,
+                # which would normally disallow using id in create and require using it in update
+                # We're not creating this model instance, we're just referencing it
+                # TODO We could add some other field flag that specifies whether the container needs to reference
+                # it or not such as referenced_in_create = REQUIRE, if the container has to have a reference when the
+                # container is created
+                R.map_with_obj(lambda key, value: R.omit(['create', 'update'], value)),
+                # Only take the id, unless related_input=true for a field
+                lambda fields: R.merge(
+                    R.pick(['id'], fields),
+                    R.filter_dict(
+                        lambda name_field: R.compose(
+                            R.equals(ALLOW),
+                            R.prop_or(False, 'related_input')
+                        )(name_field[1]),
+                        fields
+                    )
                 )
-            )
-        )(fields) if crud in [CREATE, UPDATE] else fields
-    ) if django_model_of_graphene_type(graphene_class) else fields
-
-    input_fields = input_type_fields(
-        input_type_field_configs,
-        crud,
-        # Keep our naming unique by appending parent classes, ordered newest to oldest
-        R.concat([graphene_class], modified_parent_type_classes)
-    )
+            )(fields) if crud in [CREATE, UPDATE] else fields
+        ) if django_model_of_graphene_type(graphene_class) else fields
+
+        input_fields = input_type_fields(
+            input_type_field_configs,
+            crud,
+            # Keep our naming unique by appending parent classes, ordered newest to oldest
+            R.concat([graphene_class], modified_parent_type_classes)
+        )
 
-    # These fields allow us to filter on InputTypes when we use them as query arguments
-    # This doesn't apply to Update and Create input types, since we never filter during those operations
-    filter_fields = allowed_filter_arguments(input_type_field_configs, graphene_class) if R.equals(READ, crud) else {}
+        # These fields allow us to filter on InputTypes when we use them as query arguments
+        # This doesn't apply to Update and Create input types, since we never filter during those operations
+        filter_fields = allowed_filter_arguments(input_type_field_configs, graphene_class) if \
+            R.equals(READ, crud) else {}
 
-    combined_fields = R.merge(filter_fields, input_fields)
+        combined_fields = R.merge(filter_fields, input_fields)
+        if layout_key:
+            artifact.record_input_type_layout(layout_key, combined_fields)
     if allowed_fields_only:
         return combined_fields
 
-    return type(
-        '%s%sRelated%sInputType' % (
-            graphene_class.__name__,
-            # Use the ancestry for uniqueness of name
-            R.join('of', R.concat([''], modified_parent_type_classes)),
-            camelize(crud, True)),
+    ancestry_name = '%s%sRelated%sInputType' % (
+        graphene_class.__name__,
+        # Use the ancestry for uniqueness of name
+        R.join('of', R.concat([''], modified_parent_type_classes)),
+        camelize(crud, True))
+
+    if not getattr(settings, 'RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES', False):
+        return type(ancestry_name, (InputObjectType,), combined_fields)
+
+    # Reuse the class of any identical layout, no matter where in the ancestry it was first created
+    fingerprint = input_type_fingerprint(combined_fields)
+    if fingerprint in _input_types_by_fingerprint:
+        return _input_types_by_fingerprint[fingerprint]
+
+    # The first layout of each graphene_class and crud gets the canonical name. Differing layouts keep the ancestry
+    canonical_name = '%sRelated%sInputType' % (graphene_class.__name__, camelize(crud, True))
+    name = ancestry_name if canonical_name in _input_type_names else canonical_name
+    input_type = type(
+        name,
         (InputObjectType,),
         # RECURSION
         # Create Graphene types for the InputType based on the field_dict_value.fields
@@ -250,6 +303,74 @@ def input_type_class(field_config, crud, parent_type_classes=[], allowed_fields_
         # Otherwise field_dict_value['fields'] are independent of a Django model and each have their own type property
         combined_fields
     )
+    _input_type_names.add(name)
+    _input_types_by_fingerprint[fingerprint] = input_type
+    return input_type
+
+
+def _fingerprint_value(value):
+    # Classes and functions compare by identity, which is stable for the process. Other values by representation
+    return value if callable(value) or isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+
+
+def _fingerprint_kwargs(kwargs):
+    return tuple(sorted(R.map(lambda key: (key, _fingerprint_value(kwargs[key])), R.keys(kwargs))))
+
+
+def _type_fingerprint(value):
+    """
+        Describes a mounted or unmounted graphene type as a hashable tuple
+    :param value: A graphene type class, Structure (List, NonNull), InputField or UnmountedType instance
+    :return: A hashable value
+    """
+    if isinstance(value, Structure):
+        # A related input of a type_modifier, e.g. List(related_input), is a new lambda for each layout
+        related_input = getattr(value._of_type, 'related_input', None)
+        return (
+            value.__class__,
+            _related_input_fingerprint(*related_input) if related_input else _type_fingerprint(value.of_type)
+        )
+    if isinstance(value, InputField):
+        return (
+            InputField,
+            _type_fingerprint(value.type),
+            _fingerprint_value(value.default_value),
+            value.description,
+            value.name
+        )
+    if isinstance(value, UnmountedType):
+        return (UnmountedType, _type_fingerprint(value.get_type()), _fingerprint_kwargs(value.kwargs))
+    return _fingerprint_value(value)
+
+
+def _related_input_fingerprint(field_dict_value, parent_type_classes, crud):
+    # Describes the input type that a lambda of related_input_field_for_crud_type creates by its crud, graphene
+    # type and layout, so identical related inputs match no matter which lambda or ancestry made them
+    return (
+        'related_input',
+        crud,
+        call_if_lambda(R.prop('graphene_type', field_dict_value)),
+        input_type_fingerprint(input_type_class(field_dict_value, crud, parent_type_classes, True))
+    )
+
+
+def input_type_fingerprint(fields):
+    """
+        Fingerprints the resolved field layout of an InputObjectType. Two layouts with the same fingerprint
+        produce identical graphql types and can share one class
+    :param fields: The dict of fields passed to the InputObjectType subclass
+    :return: A hashable tuple
+    """
+    return tuple(sorted(
+        R.map(lambda key: (key, _type_fingerprint(fields[key])), R.keys(fields)),
+        key=lambda pair: pair[0]
+    ))
+
+
+# When settings.RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES is True, input_type_class shares one class between
+# identical field layouts instead of creating one class per parent ancestry
+_input_types_by_fingerprint = {}
+_input_type_names = set()
 
 
 def related_input_field(field_dict_value, parent_type_classes, *args, **kwargs):
@@ -281,7 +402,12 @@ def related_input_field_for_crud_type(field_dict_value, parent_type_classes, cru
     :param parent_type_classes: String or String array of parent graphene type classes. Unfortunately, Graphene doesn't
     :return:
     """
-    return lambda *args, **kwargs: related_input_field(field_dict_value, parent_type_classes, *args, **kwargs)(crud)
+    def related_input(*args, **kwargs):
+        return related_input_field(field_dict_value, parent_type_classes, *args, **kwargs)(crud)
+
+    # Lets input_type_fingerprint identify the field without the identity of this function
+    related_input.related_input = (field_dict_value, parent_type_classes, crud)
+    return related_input
 
 
 def django_to_graphene_type(field, field_dict_value, parent_type_classes):
@@ -302,37 +428,7 @@ def django_to_graphene_type(field, field_dict_value, parent_type_classes):
         # the other graphene types above
         return related_input_field_for_crud_type(field_dict_value, parent_type_classes)
 
-    from rescape_graphene.schema_models.geojson.types import GrapheneFeatureCollection
-    types = {
-        AutoField: graphene.Int,
-        IntegerField: graphene.Int,
-        BigAutoField: graphene.Int,
-        CharField: graphene.String,
-        BigIntegerField: graphene.Int,
-        BinaryField: graphene.Int,
-        BooleanField: graphene.Boolean,
-        NullBooleanField: graphene.Boolean,
-        DateField: graphene.Date,
-        DateTimeField: graphene.DateTime,
-        TimeField: graphene.Time,
-        DecimalField: Decimal,
-        FloatField: graphene.Float,
-        EmailField: graphene.String,
-        UUIDField: graphene.UUID,
-        TextField: graphene.String,
-        JSONField: graphene.JSONString,
-        # I'm not sure if this is works still. We are storing geojson as a json blob, not a GeosGeometryCollection.
-        # If we do use a GeosGeometryCollection I'm not sure if this mapping works
-        GeometryCollectionField: GrapheneFeatureCollection
-    }
-    cls = field.__class__
-    match = R.prop_or(None, cls, types)
-    # Find the type that matches. If not match we assume that the class only has one base class,
-    # such as GeometryField subclasses
-    while not match:
-        cls = cls.__bases__[0]
-        match = R.prop_or(None, cls, types)
-    return match
+    return graphene_type_of_django_field_class(field.__class__)
 
 
 def process_field(field_to_unique_field_groups, field, field_dict_value, parent_type_classes):
@@ -375,37 +471,35 @@ def parse_django_class(model, field_dict, parent_type_classes=[]):
     :param parent_type_classes Single class or array of parent classes of this graphene class
     :return:
     """
-    # This mess just maps each attr to all "unique together" tuples it's in
-    field_to_unique_field_groups = R.from_pairs_to_array_values(
-        R.flatten(
-            R.map(
-                lambda uniq_field_group:
-                R.map(
-                    lambda attrname: [attrname, R.join(',', uniq_field_group)],
-                    uniq_field_group
-                ),
-                model._meta.unique_together
-            )
-        )
-    )
-    return R.from_pairs(R.map(
-        lambda field: [
+    # In compiled schema mode reuse the result stored by a previous process if the model and field_dict match
+    artifact = compiled_schema_artifact()
+    if artifact:
+        parsed = artifact.parsed_django_class(model, field_dict, parent_type_classes)
+        if parsed is not None:
+            return parsed
+
+    metadata = model_metadata(model)
+    parsed = R.from_pairs(R.map(
+        lambda field_metadata: [
             # Key by file.name
-            field.name,
+            field_metadata.name,
             # Process each field
             process_field(
-                field_to_unique_field_groups,
-                field,
-                R.prop(field.name, field_dict),
+                metadata.field_to_unique_field_groups,
+                field_metadata.field,
+                R.prop(field_metadata.name, field_dict),
                 R.to_array_if_not(parent_type_classes)
             )
         ],
         # Only accept model fields that are defined in field_dict
         R.filter(
-            lambda field: field.name in field_dict,
-            R.concat(model._meta.fields, R.concat(model._meta.many_to_many, model._meta.related_objects))
+            lambda field_metadata: field_metadata.name in field_dict,
+            list(metadata.fields.values())
         )
     ))
+    if artifact:
+        artifact.record_django_class(model, field_dict, parsed)
+    return parsed
 
 
 def django_model_of_graphene_type(graphene_type):
@@ -467,56 +561,108 @@ def allowed_read_fields(fields_dict, graphene_type):
     )(fields_dict)
 
 
-def allowed_filter_pairs(field_name, graphene_type):
+def allowed_filter_suffixes(graphene_type):
+    """
+        The FILTER_FIELDS keys that are compliant with the given graphene_type
+    :param graphene_type: Graphene type of the field
+    :return: List of FILTER_FIELDS keys, e.g. ['contains', 'contains_not', 'in', 'in_not']
+    """
+    artifact = compiled_schema_artifact()
+    suffixes = artifact.allowed_filter_suffixes(graphene_type) if artifact else None
+    if suffixes is None:
+        # Only allow filters compliant with the type of pair[1]
+        suffixes = list(R.keys(R.filter_dict(
+            lambda keyvalue: not R.has('allowed_types', keyvalue[1]) or R.any_satisfy(
+                lambda typ: issubclass(graphene_type, typ), keyvalue[1]['allowed_types']
+            ),
+            FILTER_FIELDS
+        )))
+        if artifact:
+            artifact.record_allowed_filter_suffixes(graphene_type, suffixes)
+    return suffixes
+
+
+def filter_profile(field_config):
+    """
+        Resolves the filters property of a field config to the FILTER_FIELDS suffixes that it allows.
+        Profiles are ignored if settings.RESCAPE_GRAPHENE_FILTER_PROFILES is False
+    :param field_config: The field config, e.g. dict(create=REQUIRE, filters='text')
+    :return: List of suffixes including their _not variants, or None if the field config doesn't limit filters.
+    Raises a ValueError for an unknown profile name or an unknown suffix in a filters list
+    """
+    filters = R.prop_or(None, 'filters', field_config or {})
+    if filters is None or not getattr(settings, 'RESCAPE_GRAPHENE_FILTER_PROFILES', True):
+        return None
+    if R.isinstance(str, filters):
+        if not R.has(filters, FILTER_PROFILES):
+            raise ValueError(f"Unknown filter profile {filters}. Expected one of {', '.join(R.keys(FILTER_PROFILES))}")
+        filters = FILTER_PROFILES[filters]
+    else:
+        # Check against every lookup, not just the FILTER_FIELDS of this environment, which testing limits
+        known = R.merge(FILTER_LOOKUPS, SPATIAL_FILTERS)
+        unknown = [
+            suffix for suffix in filters
+            if not R.has(suffix[:-len('_not')] if suffix.endswith('_not') else suffix, known)
+        ]
+        if unknown:
+            raise ValueError(
+                f"Unknown filter suffixes {', '.join(unknown)}. Expected keys of FILTER_LOOKUPS or SPATIAL_FILTERS"
+            )
+    return R.chain(
+        lambda suffix: [suffix] if suffix.endswith('_not') else [suffix, f'{suffix}_not'],
+        filters
+    )
+
+
+def allowed_filter_pairs(field_name, graphene_type, filters=None):
     """
         Creates pairs of filter_field, graphene_type such as [id_contains, Int(), id_in, List(Int())] for
         filter fields that are allowed for the field_name's graphene_type
     :param field_name: Field being given filters
     :param graphene_type: Graphene type of the field
+    :param filters: Optional list of suffixes from filter_profile. Only these suffixes are used
     :return: List of pairs
     """
-    return R.map_with_obj_to_values(
+    suffixes = allowed_filter_suffixes(graphene_type)
+    return R.map(
         # Make all the filter pairs for each key id: id_contains, id: id_in, etc
-        lambda filter_str, config: [
+        lambda filter_str: [
             '%s_%s' % (field_name, filter_str),
             # If a type_modifier is needed for the filter type, such as a List constructor call it
             # with the field's type as an argument
-            (config['type_modifier'] if R.has('type_modifier', config) else lambda t: t())(graphene_type)
+            (FILTER_FIELDS[filter_str]['type_modifier'] if R.has('type_modifier', FILTER_FIELDS[filter_str])
+             else lambda t: t())(graphene_type)
         ],
-        # Only allow filters compliant with the type of pair[1]
-        R.filter_dict(
-            lambda keyvalue: not R.has('allowed_types', keyvalue[1]) or R.any_satisfy(
-                lambda typ: issubclass(graphene_type, typ), keyvalue[1]['allowed_types']
-            ),
-            FILTER_FIELDS
-        )
+        suffixes if filters is None else R.filter(lambda suffix: suffix in filters, suffixes)
     )
 
 
-def make_filters(pair):
+def make_filters(pair, fields_dict={}):
     """
         Add the needed filters to the standard 'eq' value
         This compensates for django-filter not being implemented to work in graphene without Relay
     :param pair:
+    :param fields_dict: The field configs keyed by field name. A field config's filters property limits the filters
     :return:
     """
     return R.from_pairs(
         R.concat(
             [pair],
-            allowed_filter_pairs(pair[0], pair[1].__class__)
+            allowed_filter_pairs(pair[0], pair[1].__class__, filter_profile(R.prop_or(None, pair[0], fields_dict)))
         )
     )
 
 
-def add_filters(argument_dict):
+def add_filters(argument_dict, fields_dict={}):
     """
         Adds filter arguments to 'eq' arguments.
     :param argument_dict:
+    :param fields_dict: The field configs of argument_dict, used for their filters property
     :return: dict of the 'eq' arguments and the filter args e.g. {id: Int(), id_contains: List(Int), ...}
     """
     return R.compose(
         R.merge_all,
-        R.map(make_filters),
+        R.map(lambda pair: make_filters(pair, fields_dict)),
         R.to_pairs
     )(argument_dict)
 
@@ -526,12 +672,22 @@ def top_level_allowed_filter_arguments(fields, graphene_type):
         For top-level calls, not recursion
         Like allowed_query_and_read_arguments but only used for arguments and adds filter variables like id_contains.
         Note that django needs __ so these are converted for resolvers. The graphql interface converts them to
-        camel case
+        camel case. Geometry fields of the model also get the spatial filters of spatial_filters
     :param fields: The fields for the graphene type
     :param graphen_type: The graphene type
     :return: dict of field keys and there graphene type, either a primitive or input type
     """
-    return input_type_class(dict(fields=fields, graphene_type=graphene_type), 'read', [], True)
+    model = django_model_of_graphene_type(graphene_type)
+    return R.merge(
+        input_type_class(dict(fields=fields, graphene_type=graphene_type), 'read', [], True),
+        spatial_filter_arguments(
+            model,
+            R.map_dict(
+                filter_profile,
+                R.filter_dict(lambda name_field: R.prop_or(None, 'read', name_field[1]) != DENY, call_if_lambda(fields))
+            )
+        ) if model else {}
+    )
 
 
 def allowed_filter_arguments(fields_dict, graphene_type):
@@ -539,12 +695,14 @@ def allowed_filter_arguments(fields_dict, graphene_type):
         Like allowed_query_and_read_arguments but only used for arguments and adds filter variables like id_contains.
         Note that django needs __ so these are converted for resolvers. The graphql interface converts them to
         camel case
-    :param fields_dict: The fields_dict for the Django model
+    :param fields_dict: The fields_dict for the Django model. A field's filters property limits its filters to
+    a FILTER_PROFILES name or a list of FILTER_FIELDS suffixes
     :param graphen_type: Type used for embedded input class naming
     :return: dict of field keys and there graphene type, either a primitive or input type
     """
+    fields = call_if_lambda(fields_dict)
     return R.compose(
-        lambda argument_dict: add_filters(argument_dict),
+        lambda argument_dict: add_filters(argument_dict, fields),
         R.map_dict(resolve_type(graphene_type)),
         R.filter_dict(
             # Don't allow DENYed READ fields to be used for querying
@@ -553,7 +711,7 @@ def allowed_filter_arguments(fields_dict, graphene_type):
                 R.not_func(R.prop_eq_or_in(READ, DENY, key_value[1]))
             )
         )
-    )(call_if_lambda(fields_dict))
+    )(fields)
 
 
 def guess_update_or_create(fields_dict):
@@ -939,6 +1097,61 @@ def _related_model_expressions(related_model, value, key):
             q_expressions
         )
 
+def _containment_path(field, field_key, key, value):
+    """
+        The json keys that a flattened json filter compares for equality, or None if the filter can't be expressed
+        as containment. E.g. data__friend__id=5 gives ['friend', 'id'], but data__example__gte=1 gives None.
+        Filters of lists and objects, such as data__tags__contains=['a'], give None. Only scalar equalities are
+        folded, so the setting never changes which rows match
+    """
+    segments = key.split('__')[len(field_key.split('__')):]
+    if isinstance(value, (dict, list)):
+        return None
+    if not segments or _key_matches_filter_field(key) or field.get_lookup(segments[-1]):
+        # A lookup other than equality
+        return None
+    # Without keys the value is the root, which we leave alone
+    return segments or None
+
+
+def _merge_containment(containment, path, value):
+    # Sets value at path of containment unless another filter already put something different there
+    node = containment
+    for segment in path[:-1]:
+        if not isinstance(node.setdefault(segment, {}), dict):
+            return False
+        node = node[segment]
+    if path[-1] in node:
+        return False
+    node[path[-1]] = value
+    return True
+
+
+def json_containment_q_expressions(field, field_key, dct):
+    """
+        Combines the equality filters of a json field into one containment filter, so that
+        data: {friend: {id: 5}, example: 1.1} becomes data__contains={friend: {id: 5}, example: 1.1}, which is @>
+        in Postgres and uses a GIN index on the column, instead of data__friend__id=5 and data__example=1.1, which
+        extract each key and can't. Only scalar equalities are combined. Filters with lookups like
+        data__example__gte and filters of lists or objects like data__tags__contains=['a'] stay separate.
+        Enable with settings.RESCAPE_GRAPHENE_JSON_CONTAINMENT = True
+    :param field: The Django JSONField
+    :param field_key: The key of the json field, e.g. 'data'
+    :param dct: The flattened filters, e.g. dict(data__friend__id=5, data__example__gte=1)
+    :return: A list of Q expressions
+    """
+    containment = {}
+    separate = []
+    for key, value in dct.items():
+        path = _containment_path(field, field_key, key, value)
+        if not (path and _merge_containment(containment, path, value)):
+            separate.append(Q(**{key: value}))
+    return R.concat(
+        [Q(**{f'{field_key}__contains': containment})] if containment else [],
+        separate
+    )
+
+
 def process_query_kwarg(model, key, value):
     """
         Process a query kwarg. The key is always a string and the value can be a scalar or a dict representing the
@@ -962,9 +1175,13 @@ def process_query_kwarg(model, key, value):
         # If the key ends in not it tells us to convert to a ~Q(key) expression
         k = key.replace('__not', '')
         return [~Q(**{k: value})]
-    if isinstance(R.prop_or(None, key, model._meta._forward_fields_map), (JSONField,)):
+    metadata = model_metadata(model)
+    field_metadata = R.prop_or(None, key, metadata.forward_fields)
+    if field_metadata and field_metadata.kind == JSON:
         return R.compose(
-            lambda dct: R.map_with_obj_to_values(
+            lambda dct: json_containment_q_expressions(field_metadata.field, key, dct) if
+            getattr(settings, 'RESCAPE_GRAPHENE_JSON_CONTAINMENT', False) else
+            R.map_with_obj_to_values(
                 lambda key, value: Q(**{key: value}),
                 dct
             ),
@@ -986,23 +1203,14 @@ def process_query_kwarg(model, key, value):
                 '__'
             )
         )({key: value})
-    elif R.has(key, model._meta._forward_fields_map):
+    elif field_metadata:
         # If it's a model key
-        if isinstance(model._meta._forward_fields_map[key], (ForeignKey, OneToOneField, ManyToManyField)):
+        if field_metadata.kind in (FORWARD, MANY_TO_MANY):
             # Recurse on these, so foo: {bar: 1, car: 2} resolves to [['foo__bar' 1], ['foo__car', 2]]
-            related_model = model._meta._forward_fields_map[key].related_model
-            return _related_model_expressions(related_model, value, key)
-        elif isinstance(model._meta._forward_fields_map[key], (ManyToManyField)):
-            raise NotImplementedError(f'Unrecognized field type for {model._meta._forward_fields_map[key]}')
-    elif R.contains(R.head(key.split('__')), R.map(R.prop('name'), model._meta.related_objects)):
+            return _related_model_expressions(field_metadata.related_model, value, key)
+    elif R.head(key.split('__')) in metadata.reverse_fields:
         # Recurse on these, so foo: {bar: {id: 1}, car: {id: 2}} resolves to [['foo__bar__id' 1], ['foo__car__id', 2]]
-        many_to_many_rel = R.find(
-            lambda obj: R.compose(
-                R.equals(R.head(key.split('__'))),
-                R.prop('name')
-            )(obj),
-            model._meta.related_objects)
-        related_model = many_to_many_rel.related_model
+        related_model = metadata.reverse_fields[R.head(key.split('__'))].related_model
         return _related_model_expressions(related_model, value, key)
 
     return [Q(**{key: value})]
@@ -1171,10 +1379,20 @@ def invert_q_expressions_sets(q_expressions):
 def process_filter_kwargs(model, **kwargs):
     """
         Converts filter names for resolvers. They come in with an _ but need __ to match django's query language
+        The translation is compiled once per shape of kwargs, see filter_plans
     :param model: The django model--used to flatten the objects properly
     :param kwargs:
     :return: list of Q expressions representing each kwarg
     """
+    # Spatial filters translate to their own lookups, see spatial_filters
+    spatial_q_expressions_of_kwargs, kwargs = spatial_q_expressions(model, kwargs)
+    q_expressions = R.concat(apply_filter_plan(model, kwargs, _process_filter_kwargs), spatial_q_expressions_of_kwargs)
+    # Counts the filters for the index advisor when recording
+    record_filter_kwargs(model, q_expressions)
+    return q_expressions
+
+
+def _process_filter_kwargs(model, kwargs):
     return R.compose(
         lambda kwrgs: flatten_query_kwargs(model, kwrgs),
 
@@ -1187,7 +1405,8 @@ def process_filter_kwargs(model, **kwargs):
     )(kwargs)
 
 
-def process_filter_kwargs_with_to_manys(model, process_filter_kwargs=process_filter_kwargs, **kwargs):
+def process_filter_kwargs_with_to_manys(model, process_filter_kwargs=process_filter_kwargs, to_many_strategy=SEQUENTIAL,
+                                        **kwargs):
     """
         Calls process_filter_kwargs and then invert_q_expressions_sets so that
         the filtering can correctly handle to-many relations. This works
@@ -1195,13 +1414,142 @@ def process_filter_kwargs_with_to_manys(model, process_filter_kwargs=process_fil
         property must both be present (most often one is present in each of two to-mnay instances)
     :param model: The django model
     :param process_filter_kwargs Defaults to process_filter_kwargs, can be overridden for special cases
+    :param to_many_strategy: SEQUENTIAL (default) to filter the sets sequentially with distinct or EXISTS
+    to express each to-many condition as a correlated Exists subquery. See to_many_exists_q_expressions
     :param kwargs: The kwargs to filter by
-    :return: Sets of q_expressions that are run sequentially
+    :return: Sets of q_expressions that are run sequentially. Pass them to query_sequentially
+    """
+    if process_filter_kwargs is _default_process_filter_kwargs:
+        # Compile the whole translation, including the inversion, once per shape of kwargs.
+        # Spatial filters have no to-many relations, so they join the first set
+        spatial_q_expressions_of_kwargs, kwargs = spatial_q_expressions(model, kwargs)
+        q_expressions_sets = apply_filter_plan(model, kwargs, _process_filter_kwargs_with_to_manys)
+        if spatial_q_expressions_of_kwargs:
+            q_expressions_sets = [
+                R.concat(R.head(q_expressions_sets) if R.length(q_expressions_sets) else [],
+                         spatial_q_expressions_of_kwargs)
+            ] + list(q_expressions_sets[1:])
+        record_filter_kwargs(model, q_expressions_sets)
+    else:
+        q_expressions_sets = R.compose(
+            lambda q_expressions: invert_q_expressions_sets(q_expressions),
+            lambda kwargs: process_filter_kwargs(model, **kwargs)
+        )(kwargs)
+    if to_many_strategy == EXISTS:
+        return to_many_exists_q_expressions(model, q_expressions_sets)
+    return q_expressions_sets
+
+
+# The default of process_filter_kwargs_with_to_manys, which shadows the name with its argument
+_default_process_filter_kwargs = process_filter_kwargs
+
+
+def _process_filter_kwargs_with_to_manys(model, kwargs):
+    return invert_q_expressions_sets(_process_filter_kwargs(model, kwargs))
+
+
+class ExistsQExpressionsSets(list):
     """
-    return R.compose(
-        lambda q_expressions: invert_q_expressions_sets(q_expressions),
-        lambda kwargs: process_filter_kwargs(model, **kwargs)
-    )(kwargs)
+        The q_expressions_sets of the EXISTS strategy. It holds a single set with no to-many joins, so
+        query_sequentially applies it with one filter and no distinct
+    """
+    pass
+
+
+def _single_clause(q_expression):
+    # Unwraps a Q expression with a single clause, returning the clause and whether it's negated, or None
+    negated = False
+    node = q_expression
+    while isinstance(node, Q):
+        if R.length(node.children) != 1:
+            return None
+        negated = negated != node.negated
+        node = node.children[0]
+    return (node, negated) if isinstance(node, tuple) else None
+
+
+def _to_many_path(model, key):
+    """
+        Splits a filter key at its first to-many relation, e.g. user__groups__name__icontains of Foo
+    :param model: The Django model
+    :param key: The filter key
+    :return: A tuple of the to-one path segments before the relation (['user']), the FieldMetadata of the
+    relation (groups) and the remaining segments (['name', 'icontains']), or None if the key has no to-many relation
+    """
+    current = model
+    segments = key.split('__')
+    for i, segment in enumerate(segments):
+        metadata = model_metadata(current)
+        field_metadata = R.prop_or(None, segment, metadata.forward_fields) or \
+                         R.prop_or(None, segment, metadata.reverse_fields)
+        if not field_metadata or not field_metadata.is_relation:
+            return None
+        if field_metadata.is_to_many:
+            return segments[:i], field_metadata, segments[i + 1:]
+        current = field_metadata.related_model
+    return None
+
+
+def _related_key(related_model, segments):
+    # The key of the remaining segments on the related model. bars__in and bars=1 filter the related pk
+    metadata = model_metadata(related_model)
+    if segments and (R.has(segments[0], metadata.forward_fields) or R.has(segments[0], metadata.reverse_fields)):
+        return R.join('__', segments)
+    return R.join('__', R.concat(['pk'], segments))
+
+
+def _to_many_exists(prefix, field_metadata, clauses):
+    related_model = field_metadata.related_model
+    # The base manager joins like the relation does, without excluding anything the default manager would
+    return Exists(related_model._base_manager.filter(
+        Q(**{field_metadata.remote_query_name: OuterRef(R.join('__', R.concat(prefix, ['pk'])))}),
+        *R.map(lambda clause: Q(**{_related_key(related_model, clause[0]): clause[1]}), clauses)
+    ))
+
+
+def to_many_exists_q_expressions(model, q_expressions_sets):
+    """
+        The EXISTS strategy of process_filter_kwargs_with_to_manys. Instead of filtering each set sequentially
+        with distinct, the conditions of each set on a to-many relation become one correlated Exists subquery
+        on the related table, so a single related instance must match them all just as in the sequential filter.
+        Negated conditions become NOT EXISTS. The result is one flat query without DISTINCT, which matters for
+        tables with wide json and geometry columns
+    :param model: The Django model
+    :param q_expressions_sets: The result of invert_q_expressions_sets
+    :return: ExistsQExpressionsSets with one set, or q_expressions_sets unchanged if an expression can't be
+    converted, such as a multi-clause Q expression or a relation without a reverse query name
+    """
+    if not R.length(q_expressions_sets):
+        return q_expressions_sets
+    expressions = []
+    for q_expressions in q_expressions_sets:
+        # The positive conditions of this set keyed by to-many path
+        groups = {}
+        for q_expression in q_expressions:
+            single_clause = _single_clause(q_expression)
+            if not single_clause:
+                return q_expressions_sets
+            (key, value), negated = single_clause
+            path = _to_many_path(model, key)
+            if not path:
+                expressions.append(q_expression)
+                continue
+            prefix, field_metadata, segments = path
+            if not field_metadata.remote_query_name:
+                return q_expressions_sets
+            if negated:
+                expressions.append(~_to_many_exists(prefix, field_metadata, [(segments, value)]))
+            else:
+                group = groups.setdefault(
+                    R.join('__', R.concat(prefix, [field_metadata.name])),
+                    dict(prefix=prefix, field_metadata=field_metadata, clauses=[])
+                )
+                group['clauses'].append((segments, value))
+        expressions.extend(R.map(
+            lambda group: _to_many_exists(group['prefix'], group['field_metadata'], group['clauses']),
+            list(groups.values())
+        ))
+    return ExistsQExpressionsSets([expressions])
 
 
 def query_sequentially(manager, manager_method, q_expressions_sets):
@@ -1219,6 +1567,10 @@ def query_sequentially(manager, manager_method, q_expressions_sets):
     if not R.length(q_expressions_sets):
         return getattr(manager, manager_method)()
 
+    if isinstance(q_expressions_sets, ExistsQExpressionsSets):
+        # The to-many conditions are Exists subqueries, so one filter without distinct suffices
+        return getattr(manager, manager_method)(*R.head(q_expressions_sets))
+
     def _reduce(last, mgr_or_queryset, q_expressions_set):
         # We need distinct because the intersections__data__streets can generate duplicates of the same location
         return getattr(mgr_or_queryset, manager_method if last else 'filter')(*q_expressions_set).distinct()
@@ -0,0 +1,147 @@
+import json
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.gdal.error import GDALException
+from django.contrib.gis.geos import GEOSGeometry, GEOSException, Point, Polygon
+from django.db.models import Q
+from graphene import Scalar, InputObjectType, List, Float
+from graphene.types.generic import GenericScalar
+from rescape_python_helpers import ramda as R
+
+###
+# Spatial filters of geometry fields. top_level_allowed_filter_arguments adds a {field}_bbox_intersects,
+# {field}_intersects, {field}_within and {field}_dwithin argument for each GeometryField of the model, and
+# process_filter_kwargs translates them to the __bboverlaps, __intersects, __within and __dwithin lookups, which
+# PostGIS answers from the field's GiST index. The generic filters of FILTER_FIELDS compare the geometry
+# to a value, so they can't use the index. Spatial arguments are taken out of the kwargs before the generic
+# translation, which would otherwise read the _in of _intersects as the in suffix
+###
+
+
+class GeoJSONGeometry(Scalar):
+    """
+        A GeoJSON geometry argument such as {type: "Point", coordinates: [2.35, 48.85]}, or the GeoJSON or WKT string
+        of one. Parsed to a GEOSGeometry, whose SRID is 4326 unless the string specifies one
+    """
+
+    @staticmethod
+    def serialize(geometry):
+        return json.loads(geometry.geojson)
+
+    @classmethod
+    def parse_literal(cls, node):
+        return cls.parse_value(GenericScalar.parse_literal(node))
+
+    @staticmethod
+    def parse_value(value):
+        # None tells graphql the value is invalid
+        try:
+            return GEOSGeometry(value if isinstance(value, str) else json.dumps(value))
+        except (ValueError, TypeError, GEOSException, GDALException):
+            return None
+
+
+class DWithinInputType(InputObjectType):
+    """
+        The point and distance of a dwithin filter
+    """
+    # [x, y] in the SRID of the field
+    point = List(Float, required=True)
+    # In the units of the field's SRID, e.g. degrees for 4326, or meters for geography fields
+    distance = Float(required=True)
+
+
+def _bbox_polygon(field, bbox):
+    if R.length(bbox) != 4:
+        raise ValueError(f'A bounding box is [xmin, ymin, xmax, ymax], not {bbox}')
+    polygon = Polygon.from_bbox(bbox)
+    polygon.srid = field.srid
+    return polygon
+
+
+def _point_and_distance(field, point_and_distance):
+    point = R.prop('point', point_and_distance)
+    if R.length(point) != 2:
+        raise ValueError(f'A dwithin point is [x, y], not {point}')
+    return Point(*point, srid=field.srid), R.prop('distance', point_and_distance)
+
+
+# Keyed by the suffix of the argument. Each has the graphene type of the argument, the lookup it translates to
+# and a function of the GeometryField and argument value that returns the lookup's value
+SPATIAL_FILTERS = dict(
+    # [xmin, ymin, xmax, ymax] in the SRID of the field. Compares bounding boxes only, the cheapest test
+    bbox_intersects=dict(
+        type=lambda: List(Float),
+        lookup='bboverlaps',
+        value=_bbox_polygon
+    ),
+    intersects=dict(
+        type=lambda: GeoJSONGeometry(),
+        lookup='intersects',
+        value=lambda field, geometry: geometry
+    ),
+    within=dict(
+        type=lambda: GeoJSONGeometry(),
+        lookup='within',
+        value=lambda field, geometry: geometry
+    ),
+    dwithin=dict(
+        type=lambda: DWithinInputType(),
+        lookup='dwithin',
+        value=_point_and_distance
+    )
+)
+
+
+def _geometry_fields(model):
+    return {
+        field.name: field for field in model._meta.get_fields() if isinstance(field, GeometryField)
+    }
+
+
+def spatial_filter_arguments(model, field_filters):
+    """
+        The spatial filter arguments of the model's geometry fields
+    :param model: The Django model
+    :param field_filters: The readable fields keyed by name and valued by the suffixes their config allows,
+    see filter_profile, or None to allow all
+    :return: dict of argument names and graphene types, e.g. {geo_collection_intersects: GeoJSONGeometry(), ...}
+    """
+    geometry_fields = _geometry_fields(model)
+    return {
+        f'{name}_{suffix}': R.prop('type', spatial_filter)()
+        for name, filters in field_filters.items() if R.has(name, geometry_fields)
+        for suffix, spatial_filter in SPATIAL_FILTERS.items() if filters is None or suffix in filters
+    }
+
+
+def _spatial_field_and_suffix(geometry_fields, key):
+    for suffix in SPATIAL_FILTERS.keys():
+        name = key[:-len(f'_{suffix}')]
+        if key.endswith(f'_{suffix}') and R.has(name, geometry_fields):
+            return geometry_fields[name], suffix
+    return None
+
+
+def spatial_q_expressions(model, kwargs):
+    """
+        Takes the spatial filters out of filter kwargs
+    :param model: The Django model
+    :param kwargs: The filter kwargs
+    :return: A tuple of the Q expressions of the spatial filters and the remaining kwargs. Spatial filters
+    whose value is None are dropped
+    """
+    geometry_fields = _geometry_fields(model)
+    q_expressions = []
+    remaining = {}
+    for key, value in kwargs.items():
+        field_and_suffix = _spatial_field_and_suffix(geometry_fields, key) if geometry_fields else None
+        if not field_and_suffix:
+            remaining[key] = value
+        elif value is not None:
+            field, suffix = field_and_suffix
+            spatial_filter = SPATIAL_FILTERS[suffix]
+            q_expressions.append(Q(**{
+                f'{field.name}__{R.prop("lookup", spatial_filter)}': R.prop('value', spatial_filter)(field, value)
+            }))
+    return q_expressions, remaining
@@ -0,0 +1,66 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from django.contrib.auth import get_user_model
+from graphene import Int, String, List, InputObjectType, InputField
+from rescape_python_helpers import ramda as R
+
+from rescape_graphene.graphql_helpers.compiled_schema import CompiledSchemaArtifact
+from rescape_graphene.graphql_helpers.schema_helpers import parse_django_class, FILTER_FIELDS, READ, \
+    input_type_fingerprint
+from rescape_graphene.schema_models.user_schema import UserType, user_fields
+
+
+class CompiledSchemaTestCase(TestCase):
+
+    def test_django_class_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'compiled_schema.json')
+            parsed = parse_django_class(get_user_model(), user_fields, UserType)
+
+            artifact = CompiledSchemaArtifact(path, FILTER_FIELDS)
+            artifact.record_django_class(get_user_model(), user_fields, parsed)
+            assert artifact.save()
+
+            # A new process reads the same parse result back
+            loaded = CompiledSchemaArtifact(path, FILTER_FIELDS)
+            reparsed = loaded.parsed_django_class(get_user_model(), user_fields, UserType)
+            assert R.keys(reparsed) == R.keys(parsed)
+            assert reparsed['username']['type'] == parsed['username']['type']
+            assert R.map_with_obj(lambda k, v: v['unique'], reparsed) == \
+                   R.map_with_obj(lambda k, v: v['unique'], parsed)
+
+            # A changed field_dict falls back to a full rebuild
+            assert loaded.parsed_django_class(get_user_model(), R.omit(['email'], user_fields), UserType) is None
+
+    def test_input_type_layout_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'compiled_schema.json')
+            artifact = CompiledSchemaArtifact(path, FILTER_FIELDS)
+            key = artifact.input_type_key(UserType, READ, [], True, user_fields)
+            fields = dict(id=Int(required=True), username=String(), username_in=List(String))
+            assert artifact.record_input_type_layout(key, fields)
+            assert artifact.save()
+
+            loaded = CompiledSchemaArtifact(path, FILTER_FIELDS)
+            assert input_type_fingerprint(loaded.input_type_layout(key)) == input_type_fingerprint(fields)
+            # Other field_dicts have other keys
+            assert loaded.input_type_layout(
+                loaded.input_type_key(UserType, READ, [], True, R.omit(['email'], user_fields))
+            ) is None
+
+            # Nested input types are rebuilt in process
+            nested = dict(id=Int(), group=InputField(type('GroupInputType', (InputObjectType,), dict(id=Int()))))
+            assert not loaded.record_input_type_layout(key + 'nested', nested)
+
+    def test_models_digest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'compiled_schema.json')
+            artifact = CompiledSchemaArtifact(path, FILTER_FIELDS)
+            parsed = parse_django_class(get_user_model(), user_fields, UserType)
+            artifact.record_django_class(get_user_model(), user_fields, parsed)
+            artifact.save()
+            # Different filters stand in for changed models. The stale artifact is ignored
+            stale = CompiledSchemaArtifact(path, R.omit(['in'], FILTER_FIELDS))
+            assert stale.parsed_django_class(get_user_model(), user_fields, UserType) is None
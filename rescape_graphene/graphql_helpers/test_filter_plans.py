@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from .filter_plans import filter_shape, filter_plan
+from .schema_helpers import process_filter_kwargs_with_to_manys, process_filter_kwargs, \
+    _process_filter_kwargs_with_to_manys
+
+
+def _uncompiled(func, model, **kwargs):
+    with override_settings(RESCAPE_GRAPHENE_COMPILE_FILTER_PLANS=False):
+        return func(model, **kwargs)
+
+
+class FilterPlansTestCase(TestCase):
+
+    def test_filter_shape(self):
+        # Values and the length of scalar lists don't change the shape
+        assert filter_shape(dict(username='a', id_in=[1, 2], groups=[dict(id=1)])) == \
+               filter_shape(dict(username='b', id_in=[3], groups=[dict(id=2)]))
+        assert filter_shape(dict(username='a')) != filter_shape(dict(username_contains='a'))
+        assert filter_shape(dict(groups=[dict(id=1)])) != filter_shape(dict(groups=[dict(id=1), dict(id=2)]))
+
+    def test_compiled_matches_uncompiled(self):
+        model = get_user_model()
+        for kwargs in [
+            dict(username='jo', is_active=True),
+            dict(username_contains='j', id_in=[1, 2, 3], username_not='al'),
+            dict(groups=[dict(id=1), dict(name='fellas')]),
+            dict(groups=[dict(id=2), dict(name='gals')], last_name_icontains='x')
+        ]:
+            assert process_filter_kwargs_with_to_manys(model, **kwargs) == \
+                   _uncompiled(process_filter_kwargs_with_to_manys, model, **kwargs)
+            assert process_filter_kwargs(model, **kwargs) == _uncompiled(process_filter_kwargs, model, **kwargs)
+
+    def test_uncompilable_shape(self):
+        # Reverse relation __in filters build a sub query from the values, so they take the normal path
+        model = get_user_model()
+        kwargs = dict(logentry_in=[dict(id=1), dict(id=2)])
+        assert filter_plan(model, filter_shape(kwargs), _process_filter_kwargs_with_to_manys) is None
+        q_expressions_sets = process_filter_kwargs_with_to_manys(model, **kwargs)
+        assert q_expressions_sets[0][0].children[0][0] == 'logentry__in'
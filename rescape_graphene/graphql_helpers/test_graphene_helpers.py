@@ -1,4 +1,8 @@
-from .graphene_helpers import quote
+from types import SimpleNamespace
+
+from graphql import parse
+
+from .graphene_helpers import quote, selection_names
 from snapshottest import TestCase
 
 class TestGrapheneHelpers(TestCase):
@@ -32,3 +36,25 @@ f: [
 ]
 }'''
 
+    def test_selection_names(self):
+        document = parse('''
+            query {
+                foo {
+                    geojson {
+                        type
+                        kind: type
+                        ...on FeatureCollectionDataType { generator }
+                        ...collectionFields
+                    }
+                }
+            }
+            fragment collectionFields on FeatureCollectionDataType { copyright type }
+        ''')
+        operation, fragment = document.definitions
+        geojson = operation.selection_set.selections[0].selection_set.selections[0]
+        context = SimpleNamespace()
+        info = SimpleNamespace(field_asts=[geojson], fragments={fragment.name.value: fragment}, context=context)
+        assert selection_names(info) == ('type', 'generator', 'copyright')
+        # Cached on the context for the other rows
+        assert selection_names(info) is selection_names(info)
+        assert len(context.rescape_selection_names) == 1
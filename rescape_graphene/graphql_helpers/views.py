@@ -10,6 +10,8 @@ from graphql.error import format_error as format_graphql_error
 from graphql.error.located_error import GraphQLLocatedError
 
 from rescape_python_helpers import ramda as R
+from rescape_graphene.django_helpers.filter_usage import filter_usage_settings, record_filter_usage
+from rescape_graphene.django_helpers.sql_capture import capture_sql, SQL_CAPTURE_DEFAULTS
 from .exceptions import ResponseError
 from .str_converters import to_kebab_case, dict_key_to_camel_case
 
@@ -63,11 +65,53 @@ def format_located_error(error):
     return format_internal_error(error.original_error)
 
 
+def sql_capture_options(request):
+    """
+        Decides whether to capture the SQL of a request
+    :param request: The Django request
+    :return: The merged SQL_CAPTURE_DEFAULTS and settings.RESCAPE_GRAPHENE_SQL_CAPTURE or None to not capture
+    """
+    options = R.merge(SQL_CAPTURE_DEFAULTS, getattr(settings, 'RESCAPE_GRAPHENE_SQL_CAPTURE', {}))
+    header_value = request.META.get(options['header']) if options['header'] else None
+    # Only developers and staff may ask for the SQL with the header, since it reveals the schema
+    if header_value and (settings.DEBUG or R.item_path_or(False, ['user', 'is_staff'], request)):
+        return R.merge(options, dict(explain=options['explain'] or header_value.lower() == 'explain'))
+    return options if options['enabled'] else None
+
+
 class SafeGraphQLView(GraphQLView):
+    """
+        GraphQLView that logs errors and formats them safely. It can also capture the SQL of each operation and
+        return it in the response extensions, see sql_capture. Configure with settings.RESCAPE_GRAPHENE_SQL_CAPTURE,
+        a dict overriding SQL_CAPTURE_DEFAULTS
+    """
 
     def execute_graphql_request(self, *args, **kwargs):
+        if filter_usage_settings()['enabled']:
+            # Counts the filters of the request for the index advisor, see suggest_filter_indexes
+            with record_filter_usage():
+                return self._capture_graphql_request(*args, **kwargs)
+        return self._capture_graphql_request(*args, **kwargs)
+
+    def _capture_graphql_request(self, *args, **kwargs):
+        request = args[0]
+        options = sql_capture_options(request)
+        if not options:
+            return self._execute_graphql_request(*args, **kwargs)
+
+        with capture_sql(
+                top=options['top'],
+                explain=options['explain'],
+                n_plus_one_threshold=options['n_plus_one_threshold']
+        ) as capture:
+            result = self._execute_graphql_request(*args, **kwargs)
+        # Report once the capture ends so the EXPLAIN statements aren't captured. json_encode adds it to the response
+        request.rescape_sql_capture = capture.report()
+        return result
+
+    def _execute_graphql_request(self, *args, **kwargs):
         result = super().execute_graphql_request(*args, **kwargs)
-        if result.errors:
+        if result and result.errors:
             log.error(json.dumps(R.pick(['operationName', 'variables'], args[1]), indent=4))
             for error in result.errors:
                 if error.source:
@@ -77,6 +121,14 @@ class SafeGraphQLView(GraphQLView):
 
         return result
 
+    def json_encode(self, request, d, pretty=False):
+        sql_report = getattr(request, 'rescape_sql_capture', None)
+        if sql_report is not None:
+            d = R.merge(d, dict(extensions=R.merge(R.prop_or({}, 'extensions', d), dict(sql=sql_report))))
+            # Batched operations each get their own report
+            request.rescape_sql_capture = None
+        return super().json_encode(request, d, pretty)
+
     @staticmethod
     def format_error(error):
         try:
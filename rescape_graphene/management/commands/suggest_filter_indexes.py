@@ -0,0 +1,59 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from rescape_graphene.django_helpers.filter_usage import filter_usage, reset_filter_usage
+from rescape_graphene.django_helpers.index_advisor import suggest_indexes, index_migrations
+
+
+class Command(BaseCommand):
+    help = 'Proposes indexes for the filters recorded with settings.RESCAPE_GRAPHENE_FILTER_USAGE ' \
+           'and writes them as migrations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-count', type=int, default=10,
+                            help='Ignore filters used fewer times')
+        parser.add_argument('--min-seconds', type=float, default=0,
+                            help='Ignore filters whose requests spent less time in the database')
+        parser.add_argument('--app', action='append', dest='app_labels', default=[],
+                            help='Only write migrations for this app. Repeat for several apps')
+        parser.add_argument('--name', default='suggested_filter_indexes',
+                            help='The name of the migrations, following the number')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the suggestions and migrations without writing them')
+        parser.add_argument('--reset', action='store_true',
+                            help='Clear the recorded usage after writing the migrations')
+
+    def handle(self, *args, **options):
+        usage = filter_usage()
+        if not usage:
+            self.stdout.write('No filter usage recorded. Enable settings.RESCAPE_GRAPHENE_FILTER_USAGE first')
+            return
+        suggestions, skipped = suggest_indexes(usage, options['min_count'], options['min_seconds'])
+        for suggestion in suggestions:
+            self.stdout.write(
+                f'{suggestion.model._meta.label}.{suggestion.field.name}: {suggestion.index.__class__.__name__} '
+                f'{suggestion.index.name} ({suggestion.reason}) used {suggestion.count} times in '
+                f'{suggestion.requests} requests taking {round(suggestion.seconds * 1000)}ms by '
+                f'{", ".join(suggestion.lookups)}'
+            )
+        for skip in skipped:
+            self.stdout.write(f'Skipped {"__".join(skip["usage"][1:])} of {skip["usage"][0]}: {skip["reason"]}')
+
+        def is_writable(suggestion):
+            if options['app_labels']:
+                return suggestion.model._meta.app_label in options['app_labels']
+            # Don't write into the migrations of Django's own apps
+            return not suggestion.model._meta.app_config.name.startswith('django.')
+
+        writable = [suggestion for suggestion in suggestions if is_writable(suggestion)]
+        for writer in index_migrations(writable, options['name']):
+            if options['dry_run']:
+                self.stdout.write(f'{writer.path}:\n{writer.as_string()}')
+                continue
+            os.makedirs(os.path.dirname(writer.path), exist_ok=True)
+            with open(writer.path, 'w', encoding='utf-8') as file:
+                file.write(writer.as_string())
+            self.stdout.write(f'Wrote {writer.path}')
+        if options['reset'] and not options['dry_run']:
+            reset_filter_usage()
@@ -1,6 +1,14 @@
+import cProfile
+import json
+import pstats
+import time
+
 from graphene import Schema
+from graphql import GraphQLObjectType, GraphQLInputObjectType, GraphQLInterfaceType
 from rescape_python_helpers import ramda as R
 
+from rescape_graphene.graphql_helpers import schema_helpers
+from rescape_graphene.graphql_helpers.compiled_schema import save_compiled_schema_artifact
 from rescape_graphene.schema_models.token_schema import RescapeTokenMutation, RescapeTokenQuery
 from rescape_graphene.schema_models.user_schema import UserQuery, UserMutation
 
@@ -22,6 +30,8 @@ def create_query_mutation_schema(class_config):
 
     obj = create_query_and_mutation_classes(class_config)
     schema = Schema(query=R.prop('query', obj), mutation=R.prop('mutation', obj))
+    # In compiled schema mode, store anything we had to rebuild so the next process can skip it
+    save_compiled_schema_artifact()
     return dict(query=R.prop('query', obj), mutation=R.prop('mutation', obj), schema=schema)
 
 
@@ -59,3 +69,158 @@ def create_query_and_mutation_classes(query_and_mutation_class_lookups):
         pass
 
     return dict(query=Query, mutation=Mutation)
+
+
+def schema_size(schema):
+    """
+        Counts the types, fields and arguments of a schema, leaving out the introspection types.
+        Use this to measure how field configs such as filter profiles change the size of the schema
+    :param schema: A graphene Schema
+    :return: A dict of counts and the byte size of the introspection response
+    """
+    types = _schema_types(schema)
+    object_types = R.filter(lambda typ: isinstance(typ, (GraphQLObjectType, GraphQLInterfaceType)), types)
+    input_types = R.filter(lambda typ: isinstance(typ, GraphQLInputObjectType), types)
+    return dict(
+        types=len(types),
+        object_types=len(object_types),
+        input_types=len(input_types),
+        fields=sum(R.map(lambda typ: len(typ.fields), object_types)),
+        arguments=sum(R.map(
+            lambda typ: sum(R.map(lambda field: len(field.args), list(typ.fields.values()))),
+            object_types
+        )),
+        input_fields=sum(R.map(lambda typ: len(typ.fields), input_types)),
+        introspection_bytes=len(json.dumps(schema.introspect()))
+    )
+
+
+def _schema_types(schema):
+    # The types of the schema without the introspection types
+    return R.filter(
+        lambda typ: not typ.name.startswith('__'),
+        list(schema.get_type_map().values())
+    )
+
+
+def _type_field_count(typ):
+    return len(typ.fields) if isinstance(typ, (GraphQLObjectType, GraphQLInterfaceType, GraphQLInputObjectType)) else 0
+
+
+def schema_types_per_model(schema):
+    """
+        Counts the types and fields of a schema per Django model. Types are attributed to the model of the
+        DjangoObjectType whose name is their longest prefix, which covers the generated related input types
+        such as FooTypeRelatedReadInputType. Anything else is counted under None
+    :param schema: A graphene Schema
+    :return: A dict keyed by model label and valued by dict(types=, fields=)
+    """
+    types = _schema_types(schema)
+    model_labels_by_prefix = {
+        typ.name: R.item_path(['graphene_type', '_meta', 'model'], typ)._meta.label
+        for typ in types if R.item_path_or(None, ['graphene_type', '_meta', 'model'], typ)
+    }
+    # Longest first so FooBarType wins over FooType
+    prefixes = sorted(R.keys(model_labels_by_prefix), key=len, reverse=True)
+
+    counts = {}
+    for typ in types:
+        prefix = R.find(lambda prefix: typ.name.startswith(prefix), prefixes)
+        label = model_labels_by_prefix[prefix] if prefix else None
+        count = counts.setdefault(label, dict(types=0, fields=0))
+        count['types'] += 1
+        count['fields'] += _type_field_count(typ)
+    return counts
+
+
+# The schema_helpers functions that profile_schema_build reports on
+PROFILED_SCHEMA_FUNCTIONS = [
+    'input_type_class',
+    'merge_with_django_properties',
+    'parse_django_class',
+    'allowed_filter_arguments',
+    'instantiate_graphene_type'
+]
+
+
+def _function_stats(stats, func):
+    # Memoized functions are profiled as their inner function, so this counts only the calls that miss the cache
+    code = getattr(func, '__wrapped__', func).__code__
+    _, calls, own_seconds, cumulative_seconds, _ = stats.get(
+        (code.co_filename, code.co_firstlineno, code.co_name),
+        (0, 0, 0, 0, {})
+    )
+    return dict(calls=calls, cumulative_seconds=round(cumulative_seconds, 4), own_seconds=round(own_seconds, 4))
+
+
+def profile_schema_build(class_config):
+    """
+        Builds a schema under cProfile and reports where the time goes. Use this to track regressions as models
+        and field configs grow. input_type_class is memoized per process, so profile in a fresh process to
+        measure a cold build
+    :param class_config: The class_config of create_query_mutation_schema or a function that returns it.
+    Pass a function that imports the schema modules to include the types they build at import time
+    :return: A dict with functions (call counts and times of PROFILED_SCHEMA_FUNCTIONS), memoize (hits and misses
+    of input_type_class), models (see schema_types_per_model), size (see schema_size) and build_seconds
+    """
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        schema = create_schema(class_config() if callable(class_config) else class_config)
+    finally:
+        profiler.disable()
+    build_seconds = time.perf_counter() - start
+    stats = pstats.Stats(profiler).stats
+
+    functions = R.from_pairs(R.map(
+        lambda name: [name, _function_stats(stats, getattr(schema_helpers, name))],
+        PROFILED_SCHEMA_FUNCTIONS
+    ))
+    # input_type_class maps its arguments with _memoize on every call, hit or miss
+    calls = _function_stats(stats, schema_helpers._memoize)['calls']
+    misses = functions['input_type_class']['calls']
+    return dict(
+        build_seconds=round(build_seconds, 4),
+        functions=functions,
+        memoize=dict(
+            calls=calls,
+            hits=calls - misses,
+            misses=misses,
+            hit_rate=round((calls - misses) / calls, 4) if calls else None
+        ),
+        models=schema_types_per_model(schema),
+        size=schema_size(schema)
+    )
+
+
+def format_schema_profile(profile):
+    """
+        Formats the result of profile_schema_build as a text table
+    :param profile: The result of profile_schema_build
+    :return: A string
+    """
+    memoize = profile['memoize']
+    lines = [
+        f'Schema built in {profile["build_seconds"]:.3f}s',
+        '',
+        f'{"function":<32}{"calls":>10}{"cumulative":>14}{"own":>12}',
+        *R.map_with_obj_to_values(
+            lambda name, stats: f'{name:<32}{stats["calls"]:>10}'
+                                f'{stats["cumulative_seconds"]:>13.3f}s{stats["own_seconds"]:>11.3f}s',
+            profile['functions']
+        ),
+        '',
+        f'input_type_class memoize: {memoize["calls"]} calls, {memoize["hits"]} hits, {memoize["misses"]} misses'
+        f', hit rate {memoize["hit_rate"]}',
+        '',
+        f'{"model":<32}{"types":>10}{"fields":>14}',
+        *R.map(
+            lambda label: f'{label or "(other)":<32}{profile["models"][label]["types"]:>10}'
+                          f'{profile["models"][label]["fields"]:>14}',
+            sorted(R.keys(profile['models']), key=lambda label: label or '')
+        ),
+        '',
+        *R.map_with_obj_to_values(lambda key, value: f'{key:<32}{value:>10}', profile['size'])
+    ]
+    return '\n'.join(lines)
@@ -20,8 +20,9 @@ class DjangoObjectTypeRevisionedMixin(object):
 reversion_types = dict(
     created_at=dict(create=DENY, update=DENY, type=DateTime),
     updated_at=dict(create=DENY, update=DENY, type=DateTime),
-    version_number=dict(create=DENY, update=DENY, type=Int),
-    revision_id=dict(create=DENY, update=DENY, type=Int)
+    # These are properties that look up versions by the primary key, so they need no other columns
+    version_number=dict(create=DENY, update=DENY, type=Int, columns=[]),
+    revision_id=dict(create=DENY, update=DENY, type=Int, columns=[])
 )
 
 # Deleted is for the SafeDeleteModel mixin and the others correspond to the RevisionModelMixin properties
@@ -0,0 +1,72 @@
+import base64
+from collections import namedtuple
+
+import numpy as np
+from graphql import parse
+from snapshottest import TestCase
+
+from rescape_graphene.schema_models.geojson.types import GeometryCoordinates, CoordinateArray
+from rescape_graphene.schema_models.geojson.types.geometry import resolve_coordinates, POLYLINE, FLOAT32
+
+
+def coordinates_literal(coordinates):
+    return parse(f'{{ geometry(coordinates: {coordinates}) }}').definitions[0].selection_set.selections[0] \
+        .arguments[0].value
+
+
+class GeometryTests(TestCase):
+
+    def test_parse_coordinates(self):
+        point = [1.5, 2]
+        line_string = [[0, 0], [1, 0.5]]
+        # Rings of different lengths
+        polygon = [[[0, 0], [4, 0], [4, 4], [0, 0]], [[1, 1], [2, 1], [1, 1]]]
+        multi_polygon = [[[[0, 0], [1, 0], [0, 0]]], polygon]
+        for coordinates in [point, line_string, polygon, multi_polygon]:
+            floats = CoordinateArray.from_value(coordinates).tolist()
+            self.assertEqual(floats, coordinates)
+            self.assertEqual(GeometryCoordinates.parse_literal(coordinates_literal(coordinates)), floats)
+            self.assertEqual(GeometryCoordinates.parse_value(coordinates), floats)
+        self.assertEqual(CoordinateArray.from_value(multi_polygon).positions.shape, (10, 2))
+
+    def test_parse_uneven_coordinates(self):
+        # Coordinates that can't be packed are parsed as they are
+        uneven = [[1, 2, 3], [[4, 5]], []]
+        self.assertEqual(GeometryCoordinates.parse_literal(coordinates_literal(uneven)), [
+            [1.0, 2.0, 3.0], [[4.0, 5.0]], []
+        ])
+        self.assertEqual(GeometryCoordinates.parse_value(uneven), uneven)
+
+    def test_parse_non_number_coordinates(self):
+        # Values that aren't numbers are returned as they are, not converted
+        for value in [[['1.5', '2'], ['3', '4']], ['1.5', 2], [[True, False]], [[1, None]]]:
+            self.assertEqual(GeometryCoordinates.parse_value(value), value)
+            self.assertRaises(ValueError, CoordinateArray.from_value, value)
+
+    def test_serialize_coordinates(self):
+        coordinates = [[0.0, 0.0], [1.0, 0.5]]
+        self.assertEqual(GeometryCoordinates.serialize(CoordinateArray.from_value(coordinates)), coordinates)
+        self.assertEqual(GeometryCoordinates.serialize(coordinates), coordinates)
+
+    def test_encode_coordinates(self):
+        # Google's example polyline, whose latitudes are first
+        line_string = CoordinateArray.from_value([[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]])
+        self.assertEqual(line_string.encode(POLYLINE), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        polygon = CoordinateArray.from_value([[[0, 0], [4, 0], [4, 4], [0, 0]], [[1, 1], [2, 1], [1, 1]]])
+        rings = polygon.encode(FLOAT32)
+        self.assertEqual(len(rings), 2)
+        self.assertEqual(np.frombuffer(base64.b64decode(rings[1]), '<f4').tolist(), [1, 1, 2, 1, 1, 1])
+        self.assertEqual(polygon.quantize(0).tolist(), polygon.tolist())
+
+    def test_resolve_coordinates(self):
+        geometry = namedtuple('DataTuple', ['coordinates'])([[0.123456, 1.987654], [2, 3]])
+        info = namedtuple('Info', ['field_name'])('coordinates')
+        self.assertEqual(resolve_coordinates(geometry, info), geometry.coordinates)
+        self.assertEqual(
+            GeometryCoordinates.serialize(resolve_coordinates(geometry, info, precision=2)),
+            [[0.12, 1.99], [2.0, 3.0]]
+        )
+        self.assertEqual(
+            resolve_coordinates(geometry, info, precision=3, encoding=POLYLINE),
+            CoordinateArray.from_value(geometry.coordinates).encode(POLYLINE, 3)
+        )
@@ -1,10 +1,12 @@
-from .geometry import GeometryCoordinates
+from .geometry import GeometryCoordinates, CoordinateArray, CoordinateEncoding
 from .feature_collection import GrapheneFeatureCollection, FeatureCollectionDataType
 from .geojson_data_schema import feature_geometry_data_type_fields, feature_data_type_fields, FeatureGeometryDataType, FeatureDataType
 
 
 __all__ = [
     'GeometryCoordinates',
+    'CoordinateArray',
+    'CoordinateEncoding',
     'GrapheneFeatureCollection',
     'FeatureCollectionDataType',
     'feature_geometry_data_type_fields',
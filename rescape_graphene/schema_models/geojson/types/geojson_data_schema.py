@@ -1,11 +1,12 @@
 import graphene
-from graphene import String, ObjectType, Field
+from graphene import String, ObjectType, Field, Int
 from graphene.types.generic import GenericScalar
 from graphql.language.ast import ListValue
 
 from rescape_graphene.graphql_helpers.json_field_helpers import resolver_for_dict_field, type_modify_fields
 
-from rescape_graphene.schema_models.geojson.types.geometry import GeometryCoordinates
+from rescape_graphene.schema_models.geojson.types.geometry import GeometryCoordinates, CoordinateEncoding, \
+    resolve_coordinates
 from rescape_python_helpers import ramda as R
 
 feature_geometry_data_type_fields = dict(
@@ -20,7 +21,17 @@ feature_geometry_data_type_fields = dict(
 FeatureGeometryDataType = type(
     'FeatureGeometryDataType',
     (ObjectType,),
-    type_modify_fields(feature_geometry_data_type_fields)
+    R.merge(
+        type_modify_fields(feature_geometry_data_type_fields),
+        # Clients can request fewer decimals or a compact encoding of the coordinates. These are output only
+        # arguments, so they aren't in the field config that the input types are made from
+        dict(coordinates=Field(
+            GeometryCoordinates,
+            precision=Int(description='The number of decimals to round the coordinates to'),
+            encoding=CoordinateEncoding(description='Encode each LineString or ring as a string'),
+            resolver=resolve_coordinates
+        ))
+    )
 )
 
 feature_data_type_fields = dict(
@@ -1,12 +1,237 @@
+import base64
+import numbers
+
+import numpy as np
 from graphql.language.ast import ListValue
-from rescape_python_helpers import ramda as R
 import graphene
 
 
 __all__ = [
-    'GeometryCoordinates'
+    'CoordinateArray',
+    'CoordinateEncoding',
+    'GeometryCoordinates',
+    'resolve_coordinates'
 ]
 
+POLYLINE = 'polyline'
+FLOAT32 = 'float32'
+# The precision of polylines when none is requested, that of Google's encoded polylines
+POLYLINE_PRECISION = 5
+# A 64 bit varint has at most 13 five bit chunks
+_POLYLINE_SHIFTS = np.arange(13, dtype=np.uint64) * np.uint64(5)
+
+
+def _items_of_literal(node):
+    return node.values if isinstance(node, ListValue) else None
+
+
+def _items_of_value(value):
+    return value if isinstance(value, (list, tuple)) else None
+
+
+def _positions_of_literal(positions):
+    # The number strings of each position of a ring or LineString literal. numpy parses them in one pass
+    dimensions = {len(position.values) if isinstance(position, ListValue) else None for position in positions}
+    if len(dimensions) != 1 or None in dimensions:
+        raise ValueError('Positions must be lists of the same number of values')
+    try:
+        values = [value.value for position in positions for value in position.values]
+    except AttributeError:
+        # A position of lists
+        raise ValueError('Positions must be lists of values')
+    return np.array(values, dtype=np.float64).reshape(len(positions), dimensions.pop())
+
+
+def _is_number(value):
+    # bool is an Integral, but true isn't a coordinate
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _positions_of_value(positions):
+    # numpy would convert number strings and booleans, which parse_value must return as they are
+    if not all(
+        _items_of_value(position) is not None and all(_is_number(value) for value in position)
+        for position in positions
+    ):
+        raise ValueError('Positions must be lists of numbers')
+    array = np.asarray(positions, dtype=np.float64)
+    if array.ndim != 2 or not array.size:
+        raise ValueError('Positions must be lists of the same number of values')
+    return array
+
+
+class CoordinateArray(object):
+    """
+        Coordinates packed into a contiguous float64 array of positions, one row per position, and the offsets
+        that group the positions into the nested lists of LineStrings, rings and polygons. Packing is linear in
+        the number of values, and numpy converts all the numbers at once, so large geometries parse far faster
+        than walking the lists value by value. tolist converts back to nested lists
+    """
+
+    def __init__(self, positions, offsets=[], depth=2):
+        """
+        :param positions: A float64 array of shape (positions, dimensions)
+        :param offsets: For each level of lists between the outer list and the position lists, the start index
+        of each list's items in the level below, followed by the end, e.g. the rings of the polygons of a
+        MultiPolygon
+        :param depth: The number of nested lists including the positions', 1 for a Point, 2 for a LineString,
+        3 for a Polygon and 4 for a MultiPolygon
+        """
+        self.positions = positions
+        self.offsets = offsets
+        self.depth = depth
+
+    @classmethod
+    def _pack(cls, value, items_of, positions_of):
+        # The depth follows the first items. Lists that disagree with it raise ValueError
+        depth = 0
+        probe = value
+        while items_of(probe) is not None:
+            depth += 1
+            items = items_of(probe)
+            if not items:
+                raise ValueError('Empty lists have no depth')
+            probe = items[0]
+        if depth == 0:
+            raise ValueError('Coordinates must be a list')
+        if depth == 1:
+            return cls(positions_of([value]), [], 1)
+
+        offsets = [[0] for _ in range(depth - 2)]
+        chunks = []
+
+        def walk(items, level):
+            if level == depth - 2:
+                # A list of positions, a LineString or ring
+                chunks.append(positions_of(items))
+                return
+            for item in items:
+                item_items = items_of(item)
+                if item_items is None:
+                    raise ValueError('Coordinates are nested unevenly')
+                offsets[level].append(offsets[level][-1] + len(item_items))
+                walk(item_items, level + 1)
+
+        walk(items_of(value), 0)
+        # Each level's offsets index the lists of the level below, the last level's the positions.
+        # Positions of different dimensions don't concatenate
+        return cls(np.concatenate(chunks) if len(chunks) > 1 else chunks[0], offsets, depth)
+
+    @classmethod
+    def from_literal(cls, node):
+        """
+            Packs a GraphQL ListValue of coordinates
+        :param node: The ListValue
+        :return: The CoordinateArray
+        """
+        return cls._pack(node, _items_of_literal, _positions_of_literal)
+
+    @classmethod
+    def from_value(cls, value):
+        """
+            Packs nested lists of coordinates, such as a json variable or the coordinates of stored geojson
+        :param value: The nested lists
+        :return: The CoordinateArray
+        """
+        if isinstance(value, CoordinateArray):
+            return value
+        return cls._pack(value, _items_of_value, _positions_of_value)
+
+    def tolist(self):
+        """
+            The nested lists of the coordinates
+        :return: A list of floats for a Point, otherwise lists of lists
+        """
+        nested = self.positions.tolist()
+        if self.depth == 1:
+            return nested[0]
+        # Group the positions into their lists, then those lists, from the innermost level out
+        for level_offsets in reversed(self.offsets):
+            nested = [nested[start:end] for start, end in zip(level_offsets, level_offsets[1:])]
+        return nested
+
+    def quantize(self, precision):
+        """
+            Rounds the coordinates to precision decimals, which shortens their json
+        :param precision: The number of decimals
+        :return: A CoordinateArray
+        """
+        return CoordinateArray(np.round(self.positions, precision), self.offsets, self.depth)
+
+    def encode(self, encoding, precision=None):
+        """
+            Encodes the positions of each LineString or ring as a string. A Point or LineString is one string,
+            a Polygon a list of ring strings and a MultiPolygon a list of those lists
+        :param encoding: POLYLINE or FLOAT32
+        :param precision: The number of decimals. Defaults to POLYLINE_PRECISION for POLYLINE. FLOAT32 keeps
+        the precision of float32 if None
+        :return: The string or nested lists of strings
+        """
+        if encoding == POLYLINE:
+            precision = POLYLINE_PRECISION if precision is None else precision
+            return self._encode_position_lists(lambda positions: _polyline(positions, precision), self.positions)
+        if encoding == FLOAT32:
+            return self._encode_position_lists(
+                _float32,
+                self.positions if precision is None else np.round(self.positions, precision)
+            )
+        raise ValueError(f'Unknown coordinate encoding {encoding}')
+
+    def _encode_position_lists(self, encode, positions):
+        # Encodes the positions of each innermost list and nests the strings like tolist
+        if self.depth <= 2:
+            return encode(positions)
+        inner_offsets = self.offsets[-1]
+        nested = [encode(positions[start:end]) for start, end in zip(inner_offsets, inner_offsets[1:])]
+        for level_offsets in reversed(self.offsets[:-1]):
+            nested = [nested[start:end] for start, end in zip(level_offsets, level_offsets[1:])]
+        return nested
+
+
+def _polyline(positions, precision):
+    """
+        Encodes positions with the encoded polyline algorithm: each value is scaled by 10^precision, rounded and
+        stored as the zigzag varint of its difference to the previous position's value, in printable characters.
+        Like Google's polylines, 2 dimensional positions are encoded latitude first, so [longitude, latitude]
+        geojson positions are swapped and any polyline decoder reads them
+    """
+    if positions.shape[1] >= 2:
+        positions = positions[:, [1, 0] + list(range(2, positions.shape[1]))]
+    scaled = np.round(positions * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, scaled.shape[1]), dtype=np.int64)).ravel()
+    values = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+    chunks = (values[:, None] >> _POLYLINE_SHIFTS) & np.uint64(31)
+    # Every value has at least one chunk. Every chunk but a value's last has the continuation bit
+    lengths = np.maximum(1, ((values[:, None] >> _POLYLINE_SHIFTS) > 0).sum(axis=1))
+    used = np.arange(len(_POLYLINE_SHIFTS)) < lengths[:, None]
+    continued = np.arange(len(_POLYLINE_SHIFTS)) < (lengths - 1)[:, None]
+    codes = chunks + np.where(continued, 0x20, 0).astype(np.uint64) + np.uint64(63)
+    return codes[used].astype(np.uint8).tobytes().decode('ascii')
+
+
+def _float32(positions):
+    # The little endian float32 values of the positions in order, base64 encoded
+    return base64.b64encode(positions.astype('<f4').tobytes()).decode('ascii')
+
+
+def _nested_coordinates(value, items_of, number_of):
+    # The fallback for coordinates that can't be packed, such as unevenly nested lists
+    items = items_of(value)
+    if items is None:
+        return number_of(value)
+    return [_nested_coordinates(item, items_of, number_of) for item in items]
+
+
+class CoordinateEncoding(graphene.Enum):
+    """
+        Compact encodings of coordinates, which are far smaller than nested json arrays. Each LineString or ring
+        is a string
+    """
+    # Google's encoded polyline algorithm, latitude first
+    POLYLINE = POLYLINE
+    # Base64 of the little endian float32 values in position order
+    FLOAT32 = FLOAT32
+
 
 class GeometryCoordinates(graphene.Scalar):
     """
@@ -21,58 +246,57 @@ and arbitrary number of embedded arrays with endpoints being Floats to represent
 
     @classmethod
     def serialize(cls, value):
-        # Do nothing, let the view serializer to the arrays to json
+        # Nested lists are left for the view serializer to dump to json. Packed coordinates are only unpacked here
+        if isinstance(value, (CoordinateArray, np.ndarray)):
+            return value.tolist()
         return value
 
     @classmethod
     def parse_literal(cls, node):
         """
             Parses any array string
-        :param node:
-        :return:
-        """
-
-        def map_value(value):
-            """
-                value is either a ListValue with values that are ListValues or a ListValue with values that
-                are FloatValues
-            :param value:
-            :return:
-            """
-
-            def handle_floats(v):
-                if hasattr(v, 'values'):
-                    # Multiple floats:w
-                    return R.map(
-                        lambda fv: float(fv.value),
-                        v.values
-                    )
-                else:
-                    # Single float
-                    return float(v.value)
-
-            return R.if_else(
-                lambda v: R.isinstance(ListValue, R.head(v.values) if hasattr(v, 'values') else v),
-                # ListValues
-                lambda v: [reduce(v.values)],
-                # FloatValues or single FloatValue
-                lambda v: [handle_floats(v)]
-            )(value)
-
-        def reduce(values):
-            return R.reduce(
-                lambda accum, list_values: R.concat(accum, map_value(list_values)),
-                [],
-                values
-            )
-
-        # Create the coordinates by reducing node.values=[node.values=[node.floats], node.value, ...]
-        return R.reduce(
-            lambda accum, list_values: reduce(node.values),
-            [],
-            reduce(node.values)
-        )
+        :param node: A ListValue of ListValues or of FloatValues and IntValues
+        :return: The nested lists of floats
+        """
+        if not isinstance(node, ListValue):
+            return None
+        try:
+            return CoordinateArray.from_literal(node).tolist()
+        except ValueError:
+            return _nested_coordinates(node, _items_of_literal, lambda value: float(value.value))
 
     @classmethod
     def parse_value(cls, value):
-        return value
+        """
+            Parses a variable value
+        :param value: Nested lists of numbers
+        :return: The nested lists of floats. Values that aren't coordinates are returned as is
+        """
+        try:
+            return CoordinateArray.from_value(value).tolist()
+        except (ValueError, TypeError):
+            return value
+
+
+def resolve_coordinates(resource, info, precision=None, encoding=None):
+    """
+        Resolves the coordinates of a geometry json dict, rounded to precision decimals and optionally encoded.
+        Without arguments the stored coordinates are returned as they are
+    :param resource: The DataTuple of the geometry
+    :param info: The graphene resolution info
+    :param precision: Optional number of decimals
+    :param encoding: Optional CoordinateEncoding value
+    :return: The nested lists, packed coordinates that serialize unpacks or the encoded strings
+    """
+    coordinates = getattr(resource, info.field_name, None)
+    if coordinates is None or (precision is None and encoding is None):
+        return coordinates
+    if precision is not None and precision < 0:
+        raise ValueError(f'Precision must not be negative: {precision}')
+    try:
+        packed = CoordinateArray.from_value(coordinates)
+    except (ValueError, TypeError):
+        if encoding:
+            raise ValueError('Only evenly nested coordinates can be encoded')
+        return coordinates
+    return packed.encode(encoding, precision) if encoding else packed.quantize(precision)
@@ -8,7 +8,9 @@ from graphql_jwt.decorators import login_required, staff_member_required
 from rescape_python_helpers import ramda as R
 
 from .django_object_type_revisioned_mixin import reversion_types, DjangoObjectTypeRevisionedMixin
+from ..django_helpers.query_cache import cached_queryset
 from ..django_helpers.write_helpers import increment_prop_until_unique
+from ..graphql_helpers.query_optimizer import optimize_queryset
 from ..graphql_helpers.schema_helpers import input_type_fields, REQUIRE, DENY, CREATE, \
     merge_with_django_properties, input_type_parameters_for_update_or_create, UPDATE, \
     guess_update_or_create, graphql_update_or_create, graphql_query, update_or_create_with_revision, \
@@ -57,7 +59,11 @@ class UserQuery(ObjectType):
         :return:
         """
         q_expressions = process_filter_kwargs(get_user_model(), **kwargs)
-        return get_user_model().objects.filter(*q_expressions)
+        return optimize_queryset(
+            cached_queryset(get_user_model().objects.filter(*q_expressions), info, kwargs),
+            info,
+            user_fields
+        )
 
     def resolve_current_user(self, info):
         """
@@ -8,12 +8,15 @@ from rescape_python_helpers.geospatial.geometry_helpers import ewkt_from_feature
 
 from rescape_graphene import increment_prop_until_unique, enforce_unique_props
 from rescape_graphene.graphql_helpers.json_field_helpers import model_resolver_for_dict_field, \
-    type_modify_fields, resolver_for_feature_collection, resolver_for_dict_field
+    type_modify_fields, resolver_for_feature_collection, resolver_for_dict_field, feature_collection_arguments
+from rescape_graphene.django_helpers.query_cache import cached_queryset
+from rescape_graphene.graphql_helpers.query_optimizer import optimize_queryset
 from rescape_graphene.graphql_helpers.schema_helpers import REQUIRE, \
     merge_with_django_properties, guess_update_or_create, \
     CREATE, UPDATE, input_type_parameters_for_update_or_create, graphql_update_or_create, graphql_query, \
     input_type_fields, DENY, IGNORE, top_level_allowed_filter_arguments, allowed_filter_arguments, \
-    update_or_create_with_revision, process_filter_kwargs, process_filter_kwargs_with_to_manys, query_sequentially
+    update_or_create_with_revision, process_filter_kwargs, process_filter_kwargs_with_to_manys, query_sequentially, \
+    EXISTS
 from rescape_graphene.schema_models.geojson.types.feature_collection import FeatureCollectionDataType, \
     feature_collection_data_type_fields
 from rescape_graphene.schema_models.user_schema import UserType, user_fields
@@ -92,11 +95,13 @@ FooType._meta.fields['geojson'] = Field(
 )
 FooType._meta.fields['geo_collection'] = Field(
     FeatureCollectionDataType,
-    resolver=resolver_for_feature_collection
+    resolver=resolver_for_feature_collection,
+    **feature_collection_arguments()
 )
 
 foo_fields = merge_with_django_properties(FooType, dict(
-    id=dict(create=DENY, update=REQUIRE),
+    # Limit the generated filter arguments to the id profile, id_in, id_exact_not, etc
+    id=dict(create=DENY, update=REQUIRE, filters='id'),
     key=dict(create=REQUIRE, unique_with=increment_prop_until_unique(Foo, None, 'key', {})),
     name=dict(create=REQUIRE),
     bars=dict(
@@ -105,8 +110,8 @@ foo_fields = merge_with_django_properties(FooType, dict(
         fields=bar_fields,
         type_modifier=lambda *type_and_args: List(*type_and_args)
     ),
-    created_at=dict(),
-    updated_at=dict(),
+    created_at=dict(filters='date'),
+    updated_at=dict(filters='date'),
     # This refers to the FooDataType, which is a representation of all the json fields of Foo.data
     data=dict(graphene_type=FooDataType, fields=foo_data_fields, default=lambda: dict()),
     # This is a reference to a Django model instance.
@@ -138,8 +143,14 @@ class FooQuery(ObjectType):
 
     @login_required
     def resolve_foos(self, info, **kwargs):
-        q_expressions_sets = process_filter_kwargs_with_to_manys(Foo, **kwargs)
-        return query_sequentially(Foo.objects, 'filter', q_expressions_sets)
+        # Filter bars with Exists subqueries rather than sequential filters with distinct
+        q_expressions_sets = process_filter_kwargs_with_to_manys(Foo, to_many_strategy=EXISTS, **kwargs)
+        return optimize_queryset(
+            # Answers repeated filters from the ids cached by an earlier request, when the query cache is enabled
+            cached_queryset(query_sequentially(Foo.objects, 'filter', q_expressions_sets), info, kwargs),
+            info,
+            foo_fields
+        )
 
 foo_mutation_config = dict(
     class_name='Foo',
@@ -4,6 +4,9 @@ import pytest
 import reversion
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rescape_python_helpers import ramda as R
 from rescape_python_helpers.geospatial.geometry_helpers import ewkt_from_feature_collection
 from reversion.models import Version
@@ -11,6 +14,8 @@ from snapshottest import TestCase
 
 from rescape_graphene.graphql_helpers.schema_validating_helpers import quiz_model_query, quiz_model_mutation_create, \
     quiz_model_mutation_update
+from rescape_graphene.graphql_helpers.schema_helpers import process_filter_kwargs_with_to_manys, query_sequentially, \
+    EXISTS, process_filter_kwargs
 from rescape_graphene.testcases import client_for_testing
 from .foo_schema import graphql_query_foos, graphql_update_or_create_foo
 from .models import Foo, Bar
@@ -96,6 +101,281 @@ class FooSchemaTestCase(TestCase):
         quiz_model_query(self.client, graphql_query_foos, 'foos', dict(name='Foo', bars=[dict(key='bar')]))
         quiz_model_query(self.client, graphql_query_foos, 'foos', dict(name='Foo', bars=[dict(key='bar'), dict(key='bar_barr')]))
 
+    def test_to_many_strategies(self):
+        # The EXISTS strategy must match the sequential filters for each to-many combination of Foo.bars
+        def ids(to_many_strategy, **kwargs):
+            q_expressions_sets = process_filter_kwargs_with_to_manys(Foo, to_many_strategy=to_many_strategy, **kwargs)
+            return sorted(R.map(R.prop('id'), query_sequentially(Foo.objects, 'filter', q_expressions_sets)))
+
+        for kwargs in [
+            dict(bars=[dict(key='bar')]),
+            dict(bars=[dict(key='bar'), dict(key='bar_barr')]),
+            dict(name='Boo', bars=[dict(key='bar')]),
+            dict(bars=[dict(key_contains='bar')]),
+            dict(bars=[dict(id=R.prop('id', Bar.objects.get(key='bar_barr')))]),
+            dict(user=dict(id=self.admin.id), bars=[dict(key='bar_barr')]),
+        ]:
+            assert ids(EXISTS, **kwargs) == ids('sequential', **kwargs), kwargs
+        assert ids(EXISTS, bars=[dict(key='bar'), dict(key='bar_barr')]) == [self.foos[0].id]
+
+    def test_json_containment(self):
+        # Combining the json equality filters into one containment filter must match the same Foos
+        def ids(json_containment, **kwargs):
+            with override_settings(RESCAPE_GRAPHENE_JSON_CONTAINMENT=json_containment):
+                q_expressions = process_filter_kwargs(Foo, **kwargs)
+            return q_expressions, sorted(R.map(R.prop('id'), Foo.objects.filter(*q_expressions)))
+
+        friend_id = self.user.id
+        tagged = Foo.objects.create(
+            key='tagged', name='Tagged', user=self.user, data=dict(example=2.2, tags=['a', 'b']),
+            geojson=geojson, geo_collection=ewkt_from_feature_collection(geojson)
+        )
+        for kwargs in [
+            # Lists aren't folded into the containment of the scalars
+            dict(data=dict(example=2.2, tags=['a'])),
+            dict(data=dict(tags=['a', 'b'])),
+            dict(data=dict(example=2.2, friend=dict(id=friend_id))),
+            dict(data=dict(example=2.2, friend=dict(id=-1))),
+            dict(name='Boo', data=dict(friend=dict(id=friend_id))),
+            dict(data=dict(example_contains=2.2))
+        ]:
+            assert ids(True, **kwargs)[1] == ids(False, **kwargs)[1], kwargs
+        q_expressions, foo_ids = ids(True, data=dict(example=2.2, friend=dict(id=friend_id)))
+        assert R.length(q_expressions) == 1
+        assert q_expressions[0].children[0] == ('data__contains', dict(example=2.2, friend=dict(id=friend_id)))
+        assert R.length(foo_ids) == 2
+        q_expressions, foo_ids = ids(True, data=dict(example=2.2, tags=['a']))
+        assert R.map(lambda q_expression: q_expression.children[0], q_expressions) == [
+            ('data__contains', dict(example=2.2)),
+            ('data__tags__contains', ['a'])
+        ]
+        assert foo_ids == [tagged.id]
+
+    def test_query_count(self):
+        # Selecting related user and bars must not add queries per Foo
+        query = '''
+            query fooQuery {
+                foos {
+                    id
+                    name
+                    user { username }
+                    bars { key }
+                }
+            }
+        '''
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                result = self.client.execute(query)
+            assert not R.prop_or(None, 'errors', result), result['errors']
+            return len(R.item_path(['data', 'foos'], result)), len(context.captured_queries)
+
+        foo_count, query_count = count_queries()
+        # Add more foos, each with its own bar
+        for i in range(3):
+            bar = Bar.objects.create(key=f'extra_bar{i}')
+            foo = Foo.objects.create(
+                key=f'extra{i}', name=f'Extra {i}', user=self.user, data=dict(example=1.1),
+                geojson=geojson, geo_collection=ewkt_from_feature_collection(geojson)
+            )
+            foo.bars.add(bar)
+        more_foo_count, more_query_count = count_queries()
+        assert more_foo_count == foo_count + 3
+        assert more_query_count == query_count
+
+    def test_dict_field_model_loading(self):
+        # The users referenced by Foo.data.friend are loaded together rather than per Foo
+        query = '''
+            query fooQuery {
+                foos {
+                    id
+                    data {
+                        example
+                        friend { id username }
+                    }
+                }
+            }
+        '''
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                result = self.client.execute(query)
+            assert not R.prop_or(None, 'errors', result), result['errors']
+            return R.item_path(['data', 'foos'], result), len(context.captured_queries)
+
+        foos, query_count = count_queries()
+        assert R.item_path(['data', 'friend', 'username'], foos[0]) == self.user.username
+        for i in range(3):
+            friend = get_user_model().objects.create(username=f'friend{i}')
+            Foo.objects.create(
+                key=f'friendly{i}', name=f'Friendly {i}', user=self.user,
+                data=dict(example=1.1, friend=dict(id=friend.id)),
+                geojson=geojson, geo_collection=ewkt_from_feature_collection(geojson)
+            )
+        more_foos, more_query_count = count_queries()
+        assert R.length(more_foos) == R.length(foos) + 3
+        assert more_query_count == query_count
+        assert 'friend2' in R.map(R.item_path(['data', 'friend', 'username']), more_foos)
+
+    def test_json_list_slicing(self):
+        # first and offset window the features before they are resolved
+        features = R.map(
+            lambda i: R.merge(R.head(geojson['features']), dict(properties=dict(index=i))),
+            range(3)
+        )
+        Foo.objects.create(
+            key='featureful', name='Featureful', user=self.user, data=dict(example=1.1),
+            geojson=R.merge(geojson, dict(features=features)), geo_collection=ewkt_from_feature_collection(geojson)
+        )
+        query = '''
+            query fooQuery {
+                foos(key: "featureful") {
+                    all: geojson { features { type } }
+                    window: geojson { features(first: 1, offset: 1) { type properties } }
+                    past: geojson { features(offset: 3) { type } }
+                }
+            }
+        '''
+        result = self.client.execute(query)
+        assert not R.prop_or(None, 'errors', result), result['errors']
+        foo = R.item_path(['data', 'foos', 0], result)
+        assert R.length(R.item_path(['all', 'features'], foo)) == 3
+        assert R.length(R.item_path(['window', 'features'], foo)) == 1
+        # The second feature
+        assert R.item_path(['window', 'features', 0, 'properties', 'index'], foo) == 1
+        assert R.item_path(['past', 'features'], foo) == []
+
+    def test_json_list_pushdown(self):
+        # Filtering json list items in the database matches the Python filter
+        features = R.map(
+            lambda i: R.merge(R.head(geojson['features']), dict(id=f'feature{i % 2}')),
+            range(4)
+        )
+        Foo.objects.create(
+            key='featureful', name='Featureful', user=self.user, data=dict(example=1.1),
+            geojson=R.merge(geojson, dict(features=features)), geo_collection=ewkt_from_feature_collection(geojson)
+        )
+        query = '''
+            query fooQuery {
+                foos(key: "featureful") {
+                    geojson { type features(id: "feature1", first: 1) { id } }
+                }
+            }
+        '''
+        results = {}
+        for pushdown in [False, True]:
+            with override_settings(RESCAPE_GRAPHENE_JSON_LIST_PUSHDOWN=pushdown):
+                with CaptureQueriesContext(connection) as context:
+                    results[pushdown] = self.client.execute(query)
+            assert not R.prop_or(None, 'errors', results[pushdown]), results[pushdown]['errors']
+            foo_sql = R.find(lambda query: 'sample_webapp_foo' in query['sql'], context.captured_queries)['sql']
+            assert ('jsonb_array_elements' in foo_sql) == pushdown
+        assert results[True] == results[False]
+        assert R.item_path(['data', 'foos', 0, 'geojson', 'features'], results[True]) == [dict(id='feature1')]
+
+    def test_coordinates_precision_and_encoding(self):
+        query = '''
+            query fooQuery {
+                foos(key: "foo") {
+                    geojson {
+                        features {
+                            geometry {
+                                full: coordinates
+                                rounded: coordinates(precision: 2)
+                                polyline: coordinates(encoding: POLYLINE)
+                            }
+                        }
+                    }
+                }
+            }
+        '''
+        result = self.client.execute(query)
+        assert not R.prop_or(None, 'errors', result), result['errors']
+        geometry = R.item_path(['data', 'foos', 0, 'geojson', 'features', 0, 'geometry'], result)
+        assert geometry['full'] == R.item_path(['features', 0, 'geometry', 'coordinates'], geojson)
+        assert R.head(R.head(geometry['rounded'])) == [49.53, 2.51]
+        # One string per ring
+        assert len(geometry['polyline']) == 1 and isinstance(R.head(geometry['polyline']), str)
+
+    def test_spatial_filters(self):
+        # A Foo far from the sample polygon, which spans x 49.5 to 51.5 and y 2.5 to 6.2
+        far = R.merge(geojson, dict(features=[dict(type='Feature', geometry=dict(
+            type='Polygon', coordinates=[[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]
+        ))]))
+        Foo.objects.create(
+            key='far', name='Far', user=self.user, data=dict(example=1.1),
+            geojson=far, geo_collection=ewkt_from_feature_collection(far)
+        )
+
+        def keys(filters):
+            result = self.client.execute(f'query fooQuery {{ foos({filters}) {{ key }} }}')
+            assert not R.prop_or(None, 'errors', result), result['errors']
+            return sorted(R.map(R.prop('key'), R.item_path(['data', 'foos'], result)))
+
+        with CaptureQueriesContext(connection) as context:
+            assert keys('geoCollectionBboxIntersects: [49, 2, 52, 7]') == ['boo', 'foo']
+        foo_sql = R.find(lambda query: 'sample_webapp_foo' in query['sql'], context.captured_queries)['sql']
+        # The bounding box operator of the GiST index
+        assert '&&' in foo_sql
+        assert keys('geoCollectionBboxIntersects: [-1, -1, 0.5, 0.5]') == ['far']
+        assert keys('geoCollectionIntersects: {type: "Point", coordinates: [50, 3]}') == ['boo', 'foo']
+        assert keys(
+            'geoCollectionWithin: {type: "Polygon", coordinates: [[[-1, -1], [2, -1], [2, 2], [-1, 2], [-1, -1]]]}'
+        ) == ['far']
+        assert keys('geoCollectionDwithin: {point: [48, 3], distance: 2}') == ['boo', 'foo']
+        assert keys('geoCollectionDwithin: {point: [48, 3], distance: 1}') == []
+        # Spatial filters combine with the others
+        assert keys('key: "foo", geoCollectionBboxIntersects: [49, 2, 52, 7]') == ['foo']
+        assert R.length(process_filter_kwargs(Foo, geo_collection_bbox_intersects=[49, 2, 52, 7], key='foo')) == 2
+
+    def test_geometry_simplification(self):
+        # A polygon whose many vertices are nearly collinear
+        ring = [[i / 100, (i % 2) / 10000] for i in range(101)] + [[1, 1], [0, 1], [0, 0]]
+        detailed = dict(type='FeatureCollection', features=[
+            dict(type='Feature', geometry=dict(type='Polygon', coordinates=[ring]))
+        ])
+        foo = Foo.objects.create(
+            key='detailed', name='Detailed', user=self.user, data=dict(example=1.1),
+            geojson=detailed, geo_collection=ewkt_from_feature_collection(detailed)
+        )
+        query = '''
+            query fooQuery {
+                foos(key: "detailed") {
+                    geoCollection(simplify: 0.01) { features { geometry { coordinates } } }
+                }
+            }
+        '''
+        with CaptureQueriesContext(connection) as context:
+            result = self.client.execute(query)
+        assert not R.prop_or(None, 'errors', result), result['errors']
+        foo_sql = R.find(lambda query: 'sample_webapp_foo' in query['sql'], context.captured_queries)['sql']
+        # Only the simplified geometry is loaded
+        assert 'ST_SimplifyPreserveTopology' in foo_sql and foo_sql.count('"geo_collection"') == 1
+        coordinates = R.item_path(
+            ['data', 'foos', 0, 'geoCollection', 'features', 0, 'geometry', 'coordinates', 0],
+            result
+        )
+        assert len(coordinates) == len(foo.geo_collection.simplify(0.01, preserve_topology=True)[0].coords[0])
+        assert len(coordinates) < len(ring)
+
+    def test_query_columns(self):
+        # Only the selected columns are loaded
+        query = '''
+            query fooQuery {
+                foos {
+                    id
+                    name
+                    user { username }
+                }
+            }
+        '''
+        with CaptureQueriesContext(connection) as context:
+            result = self.client.execute(query)
+        assert not R.prop_or(None, 'errors', result), result['errors']
+        foo_sql = R.find(lambda query: 'sample_webapp_foo' in query['sql'], context.captured_queries)['sql']
+        assert '"geojson"' not in foo_sql and '"geo_collection"' not in foo_sql and '"data"' not in foo_sql
+        assert '"username"' in foo_sql
+
     def test_create(self):
         (result, new_result) = quiz_model_mutation_create(
             self.client, graphql_update_or_create_foo, 'createFoo.foo',
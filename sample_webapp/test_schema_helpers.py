@@ -1,12 +1,17 @@
 from django.contrib.auth.hashers import make_password
+from django.test import override_settings
+from graphene import ObjectType, List
 
+from rescape_graphene.schema import profile_schema_build
+from rescape_graphene.schema_models.group_schema import GroupType, group_fields
 from rescape_graphene.schema_models.user_schema import UserType, user_fields
 
-from sample_webapp.sample_schema import FooType, create_default_schema
+from sample_webapp.sample_schema import FooType, create_default_schema, default_class_config
 
 from sample_webapp.sample_schema import foo_fields
 from rescape_graphene.graphql_helpers.schema_helpers import allowed_read_fields, input_type_fields, CREATE, UPDATE, \
-    input_type_parameters_for_update_or_create, allowed_filter_arguments
+    input_type_parameters_for_update_or_create, allowed_filter_arguments, filter_profile, input_type_class, READ, \
+    related_input_field_for_crud_type
 from snapshottest import TestCase
 from rescape_python_helpers import ramda as R
 
@@ -26,6 +31,66 @@ class SchemaHelpersTypeCase(TestCase):
         self.assertTrue(R.contains('key_contains', list(allowed_filter_arguments(foo_fields, FooType))))
         self.assertTrue(R.contains('key_contains_not', list(allowed_filter_arguments(foo_fields, FooType))))
 
+    def test_filter_profiles(self):
+        # foo_fields limits id to the 'id' profile and created_at to the 'date' profile
+        filter_arguments = list(allowed_filter_arguments(foo_fields, FooType))
+        self.assertTrue(R.contains('id_in', filter_arguments))
+        self.assertTrue(R.contains('id_in_not', filter_arguments))
+        self.assertFalse(R.contains('id_contains', filter_arguments))
+        self.assertFalse(R.contains('created_at_contains', filter_arguments))
+        self.assertEqual(['exact', 'exact_not', 'in', 'in_not'], filter_profile(dict(filters='id')))
+        self.assertEqual(['icontains', 'icontains_not'], filter_profile(dict(filters=['icontains'])))
+        self.assertIsNone(filter_profile(dict()))
+        # A misspelled profile or suffix is an error, not a silently missing filter
+        with self.assertRaises(ValueError):
+            filter_profile(dict(filters='txt'))
+        with self.assertRaisesRegex(ValueError, 'icontain\\b'):
+            filter_profile(dict(filters=['exact', 'icontain']))
+        with self.assertRaisesRegex(ValueError, 'icontain\\b'):
+            allowed_filter_arguments(R.merge(foo_fields, dict(key=dict(filters=['icontain']))), FooType)
+
+    @override_settings(RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES=True)
+    def test_deduplicate_input_types(self):
+        # The users of two ancestries have identical layouts, so they share one canonical class.
+        # input_type_class is memoized on the ancestry, so use ancestries the schema build didn't create without
+        # deduplication
+        user_config = dict(graphene_type=UserType, fields=user_fields)
+        foo_user_input_type = input_type_class(user_config, READ, ['DeduplicateFoo'])
+        other_user_input_type = input_type_class(user_config, READ, ['DeduplicateFoo', 'DeduplicateGroup'])
+        self.assertIs(foo_user_input_type, other_user_input_type)
+        # A different layout gets its own class
+        id_only_input_type = input_type_class(dict(graphene_type=UserType, fields=R.pick(['id'], user_fields)), READ,
+                                              ['DeduplicateUser'])
+        self.assertIsNot(foo_user_input_type, id_only_input_type)
+
+    def test_input_type_ancestry_names(self):
+        # Without deduplication each ancestry gets its own class, named for it
+        user_config = dict(graphene_type=UserType, fields=user_fields)
+        foo_user_input_type = input_type_class(user_config, READ, ['AncestryFoo'])
+        other_user_input_type = input_type_class(user_config, READ, ['AncestryFoo', 'AncestryGroup'])
+        self.assertIsNot(foo_user_input_type, other_user_input_type)
+        self.assertEqual('UserTypeofAncestryFooofAncestryGroupRelatedReadInputType', other_user_input_type.__name__)
+
+    @override_settings(RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES=True)
+    def test_deduplicate_related_input_lists(self):
+        # Each layout makes its own related input lambda for friends. The layouts still share one class
+        class FriendsType(ObjectType):
+            friends = List(UserType)
+
+        def friends_config(parent_type_class):
+            return dict(graphene_type=FriendsType, fields=dict(friends=dict(
+                type=related_input_field_for_crud_type(
+                    dict(graphene_type=UserType, fields=user_fields),
+                    [FriendsType, parent_type_class]
+                ),
+                type_modifier=lambda *type_and_args: List(*type_and_args)
+            )))
+
+        self.assertIs(
+            input_type_class(friends_config(FooType), UPDATE, [FooType]),
+            input_type_class(friends_config(UserType), UPDATE, [UserType])
+        )
+
     def test_query_fields(self):
         self.assertMatchSnapshot(list(R.keys(allowed_read_fields(user_fields, UserType))))
         self.assertMatchSnapshot(list(R.keys(allowed_read_fields(foo_fields, UserType))))
@@ -51,12 +116,36 @@ class SchemaHelpersTypeCase(TestCase):
                       data =dict(example=2.2))
         self.assertMatchSnapshot(R.omit(['password'], input_type_parameters_for_update_or_create(foo_fields, foo_values)))
 
+    def test_profile_schema_build_memoize(self):
+        # Each build asks for a new group input type 3 times, so the first build misses once and hits twice for it.
+        # The default schema is already built at import, so every other input_type_class call of a build is a hit
+        repeats = 3
+
+        def class_config():
+            for _ in range(repeats):
+                input_type_class(dict(graphene_type=GroupType, fields=group_fields), READ, ['ProfileMemoize'])
+            return default_class_config
+
+        baseline = profile_schema_build(default_class_config)['memoize']
+        self.assertEqual(0, baseline['misses'])
+        self.assertEqual(baseline['calls'], baseline['hits'])
+
+        cold = profile_schema_build(class_config)['memoize']
+        self.assertEqual(baseline['calls'] + repeats, cold['calls'])
+        self.assertEqual(1, cold['misses'])
+        self.assertEqual(baseline['hits'] + repeats - 1, cold['hits'])
+
+        # Repeated builds only hit the cache
+        for _ in range(repeats):
+            warm = profile_schema_build(class_config)['memoize']
+            self.assertEqual(baseline['calls'] + repeats, warm['calls'])
+            self.assertEqual(0, warm['misses'])
+            self.assertEqual(1, warm['hit_rate'])
 
     # def test_delete(self):
     #    self.assertMatchSnapshot(delete_fields(user_fields))
 
 
-
 def assert_no_errors(result):
     """
         Assert no graphql request errors
@@ -23,6 +23,42 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # ENV
 PROD = os.environ.get('ENV_TYPE') == 'prod'
 
+# Path of the compiled schema artifact. When set, schema building reuses Django metadata and filter layouts
+# stored by a previous process. See rescape_graphene.graphql_helpers.compiled_schema
+RESCAPE_GRAPHENE_COMPILED_SCHEMA = os.environ.get('RESCAPE_GRAPHENE_COMPILED_SCHEMA')
+# Honor the filters property of field configs. Turn off to compare against the full FILTER_FIELDS explosion
+RESCAPE_GRAPHENE_FILTER_PROFILES = 'true' == os.environ.get('RESCAPE_GRAPHENE_FILTER_PROFILES', 'true').lower()
+# Share one input type class between identical field layouts instead of one per parent ancestry. Off by default,
+# like the library, so the suite covers the ancestry names. The deduplication tests turn it on
+RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES = 'true' == os.environ.get(
+    'RESCAPE_GRAPHENE_DEDUPLICATE_INPUT_TYPES', 'false'
+).lower()
+# Compile filter kwargs once per shape and bind the values of each request. Turn off to compare
+RESCAPE_GRAPHENE_COMPILE_FILTER_PLANS = 'true' == os.environ.get(
+    'RESCAPE_GRAPHENE_COMPILE_FILTER_PLANS', 'true'
+).lower()
+# Combine the equality filters of a json field into one containment (@>) filter that GIN indexes serve
+RESCAPE_GRAPHENE_JSON_CONTAINMENT = 'true' == os.environ.get('RESCAPE_GRAPHENE_JSON_CONTAINMENT', 'false').lower()
+# Filter the items of selected json lists in the database. See rescape_graphene.graphql_helpers.json_list_pushdown
+RESCAPE_GRAPHENE_JSON_LIST_PUSHDOWN = 'true' == os.environ.get('RESCAPE_GRAPHENE_JSON_LIST_PUSHDOWN', 'false').lower()
+# Cache the ids that top-level list resolvers return. See rescape_graphene.django_helpers.query_cache
+RESCAPE_GRAPHENE_QUERY_CACHE = dict(
+    enabled='true' == os.environ.get('RESCAPE_GRAPHENE_QUERY_CACHE', 'false').lower()
+)
+# How paginated types count for pages: exact, approximate or capped at cap rows
+RESCAPE_GRAPHENE_PAGINATION_COUNT = dict(
+    strategy=os.environ.get('RESCAPE_GRAPHENE_PAGINATION_COUNT', 'exact'),
+    cap=10000
+)
+# Report the SQL of each GraphQL request in the response extensions. See rescape_graphene.django_helpers.sql_capture
+RESCAPE_GRAPHENE_SQL_CAPTURE = dict(
+    enabled='true' == os.environ.get('RESCAPE_GRAPHENE_SQL_CAPTURE', 'false').lower()
+)
+# Record the filters that clients use for the suggest_filter_indexes command
+RESCAPE_GRAPHENE_FILTER_USAGE = dict(
+    enabled='true' == os.environ.get('RESCAPE_GRAPHENE_FILTER_USAGE', 'false').lower()
+)
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'dp&=7jt@y*^3kwfxh&!xufl9pu$!!t2vhvxozgf5y$xd(*(7w*'
 
@@ -42,7 +78,9 @@ INSTALLED_APPS = [
     'corsheaders',
     'graphene_django',
     'reversion',
-    'reversion_compare'
+    'reversion_compare',
+    # For the suggest_filter_indexes command
+    'rescape_graphene'
 ]
 
 STATIC_URL = '/static/'